@@ -0,0 +1,77 @@
+import numpy as np
+
+
+def _intersection(a, b):
+    """(A, B) intersection areas of (A, 4) and (B, 4) boxes, with both boxes' areas broadcast alongside."""
+    # (A, 1) columns against (1, B) rows
+    ax1, ay1, ax2, ay2 = a.T[:, :, None]
+    bx1, by1, bx2, by2 = b.T[:, None, :]
+    inter = (np.maximum(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0)
+             * np.maximum(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0))
+    return inter, (ax2 - ax1) * (ay2 - ay1), (bx2 - bx1) * (by2 - by1)
+
+
+def pairwise_overlap(boxes_a, boxes_b):
+    """
+    Vectorized overlap of every box in boxes_a against every box in boxes_b.
+
+    Returns (iou, containment), both (A, B) float arrays. containment[i, j] is
+    the fraction of box_b[j]'s area that lies inside box_a[i], which is the
+    useful measure for a small phone held inside a large person box.
+    """
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    inter, area_a, area_b = _intersection(a, b)
+    # Empty boxes have no intersection, so a tiny floor on the denominator yields 0 without a division warning
+    iou = inter / np.maximum(area_a + area_b - inter, 1e-9)
+    containment = inter / np.maximum(area_b, 1e-9)
+    return iou, containment
+
+
+def containment(boxes_a, boxes_b):
+    """Just the (A, B) containment matrix of pairwise_overlap(), for pixel boxes."""
+    inter, _, area_b = _intersection(np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4),
+                                     np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4))
+    return inter / np.maximum(area_b, 1)
+
+
+class EpisodeDebouncer:
+    """
+    Per-track debounce state machine: idle -> pending -> active -> idle.
+
+    A track must be flagged for `trigger_frames` consecutive frames before its
+    episode fires (once). The episode ends after `release_frames` consecutive
+    frames without the condition, after which a new episode can fire again.
+    """
+
+    def __init__(self, trigger_frames=5, release_frames=15):
+        self.trigger_frames = trigger_frames
+        self.release_frames = release_frames
+        # track_id -> [consecutive_hits, consecutive_misses, active]
+        self._state = {}
+
+    def update(self, flagged_ids):
+        """Feed this frame's flagged track ids; return the ids whose episode starts now."""
+        flagged = set(flagged_ids)
+        fired = []
+        for track_id in flagged:
+            state = self._state.setdefault(track_id, [0, 0, False])
+            state[0] += 1
+            state[1] = 0
+            if not state[2] and state[0] >= self.trigger_frames:
+                state[2] = True
+                fired.append(track_id)
+        for track_id in [t for t in self._state if t not in flagged]:
+            state = self._state[track_id]
+            state[0] = 0
+            state[1] += 1
+            if state[1] >= self.release_frames:
+                del self._state[track_id]
+        return fired
+
+    def is_active(self, track_id):
+        state = self._state.get(track_id)
+        return state is not None and state[2]
+
+    def __len__(self):
+        return len(self._state)
@@ -1,287 +1,415 @@
 import os
+import socket
+import argparse
 import time
-import cv2
+import yaml
 import threading
-from flask import Flask, Response, render_template_string, stream_with_context
-from ultralytics import YOLO
-from datetime import datetime
-from google.cloud import storage
-from google.oauth2 import service_account
+from flask import Flask, Response, redirect, render_template_string, stream_with_context
 from flask import request, jsonify
-from collections import defaultdict
+from datetime import datetime
+from cameras import Camera, CameraRegistry
+from eventlog import EventRecord, EventRing
+from eventstore import EventStore
+from rois import ROIStore, roi_polygon
+from rules import RuleBook
+from scheduler import InferenceScheduler
+from uploader import SnapshotUploader, create_backend
+from clips import ClipRecorder
+from cluster import ClusterNode, Coordinator
+from asgi import StreamingASGI
+from detector import load_detector, warm_up
+from pipeline import FrameProcessor, DETECTION_CLASSES, PHONE_ALERT_FRAMES, PHONE_RELEASE_FRAMES
+from logs import configure as configure_logging, get_logger
+from metrics import REGISTRY
+from profiler import SamplingProfiler
+from startup import Startup
+from workers import ProcessPipeline
 
 # Fix OpenMP duplicate library error
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
+# Structured JSON logs on stderr; each (logger, event) pair is capped at LOG_BURST lines per
+# LOG_INTERVAL seconds. Set LOG_LEVEL = "DEBUG" to see per-frame inference summaries and uploads.
+LOG_LEVEL = "INFO"
+LOG_BURST = 10
+LOG_INTERVAL = 10.0
+configure_logging(LOG_LEVEL, LOG_BURST, LOG_INTERVAL)
+log = get_logger("app")
+
+# Token required (X-Admin-Token header) by /admin/* routes; None leaves them open
+ADMIN_TOKEN = None
+
 # Replace with your actual service account details
 SERVICE_ACCOUNT_INFO = {"your_gcp_bucket_credentials"}
 
 GCS_BUCKET_NAME = "your_bucket_name"
-# GCS_FOLDER = "videos-dev"
-
-credentials = service_account.Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO)
-gcs_client = storage.Client(credentials=credentials, project=SERVICE_ACCOUNT_INFO["project_id"])
-bucket = gcs_client.bucket(GCS_BUCKET_NAME)
+GCS_FOLDER = "videos-dev"
+
+# Snapshot storage: "gcs", "local" (writes under LOCAL_STORAGE_DIR) or "memory"
+STORAGE_BACKEND = "gcs"
+LOCAL_STORAGE_DIR = "snapshots"
+UPLOAD_WORKERS = 4
+UPLOAD_QUEUE_SIZE = 256
+UPLOAD_SPOOL_DIR = "upload_spool"  # Survives restarts and storage outages
+
+uploader = SnapshotUploader(
+    create_backend(STORAGE_BACKEND, bucket_name=GCS_BUCKET_NAME,
+                   credentials_info=SERVICE_ACCOUNT_INFO, root=LOCAL_STORAGE_DIR),
+    workers=UPLOAD_WORKERS,
+    max_queue=UPLOAD_QUEUE_SIZE,
+    spool_dir=UPLOAD_SPOOL_DIR,
+)
+
+# Every alert snapshot is accompanied by an MP4 of CLIP_PRE_SECONDS before to CLIP_POST_SECONDS
+# after it, cut from a per-camera buffer of recent frames capped at CLIP_BUFFER_SECONDS and
+# CLIP_BUFFER_MB (override per camera with "clip_buffer_seconds"/"clip_buffer_mb"; 0 disables)
+CLIP_PRE_SECONDS = 5.0
+CLIP_POST_SECONDS = 5.0
+CLIP_BUFFER_SECONDS = 12.0
+CLIP_BUFFER_MB = 16
+clips = ClipRecorder(uploader, CLIP_PRE_SECONDS, CLIP_POST_SECONDS)
 
 app = Flask(__name__)
 
-# Load YOLOv8 model
-model = YOLO('yolov8m.pt')
+# Detector: YOLOv8 size (n/s/m/l/x), runtime ("pytorch", "onnx", "openvino") and precision
+# ("fp32", "fp16", "int8"). Exported variants are cached in MODEL_CACHE_DIR (None: a temporary
+# directory, so every restart exports again); INT8 is calibrated on recorded forecourt frames in
+# CALIBRATION_FRAMES_DIR. fp16/int8 need onnx or openvino (ONNX fp16 only on a CUDA GPU). Falls back
+# to the .pt weights on failure.
+MODEL_SIZE = "m"
+MODEL_BACKEND = "pytorch"
+MODEL_PRECISION = "fp32"
+MODEL_IMGSZ = 640
+MODEL_CACHE_DIR = "models"
+CALIBRATION_FRAMES_DIR = None
+
+# The model is loaded in the background by start_engine(), then run MODEL_WARMUP_RUNS times on
+# blank MODEL_IMGSZ frames so the first camera frames see full speed; /readyz reports progress
+MODEL_WARMUP_RUNS = 2
+startup = Startup()
 
 rtsp_url = 'rtsp_link'
 
-CONFIDENCE_THRESHOLD = 0.7  
-
-camera_config = {
-    "camera_id": "CAM1",
-    "station_number": "Station1"
-}
-
-person_class_id = 0
-cell_phone_class_id = 67
-vehicle_class_ids = [1, 2, 3, 5, 7]
-
-class_names = model.names
-tracked_vehicles = {}
-
-DWELL_TIME = 60
-WARNING_TIME = 45
-MOVE_THRESHOLD = 40
-
-event_log = []
+# Cameras started at boot; more can be added or removed at runtime via /cameras.
+# inference_mode: "full" (detect every frame), "fixed" (every detect_stride-th frame)
+# or "adaptive" (stride picked from measured inference time vs target_latency_ms).
+# render_mode: "server" burns overlays into the stream; "client" streams raw frames and
+# sends detections to the browser over /detections.
+# crop_mode: "full" runs the detector on the whole frame; "roi" only on (tiled) crops around the ROIs
+# clip_buffer_seconds/clip_buffer_mb: memory kept for pre-event clips (defaults CLIP_BUFFER_*)
+# motion_gate: skip the detector while nothing moves inside the ROIs (tracks are held, timers keep running)
+CAMERAS = [
+    {"camera_id": "CAM1", "source": rtsp_url, "station_number": "Station1", "customer_id": "Customer1",
+     "inference_mode": "full", "detect_stride": 1, "target_latency_ms": 66.0, "render_mode": "server",
+     "crop_mode": "full", "motion_gate": False},
+]
+DEFAULT_CAMERA = CAMERAS[0]["camera_id"]
+
+# Maximum number of camera frames run through a single model.predict call
+INFERENCE_BATCH_SIZE = 8
+
+# Detection classes, confidence and alert thresholds live in pipeline.py
+
+# Vehicles unseen for this many frames are forgotten (matches ByteTrack's track_buffer)
+with open("bytetrack.yaml") as f:
+    TRACK_TTL_FRAMES = yaml.safe_load(f).get("track_buffer", 30)
+
+# Ring buffers keep the last *_CAPACITY records for SSE resume; the JSON views show the newest MAX_*
+event_log = EventRing(capacity=1000)
 MAX_EVENTS = 20
 
-inference_log = []
+inference_log = EventRing(capacity=200)
 MAX_INFERENCES = 20
 
-# Define multiple ROIs for gas station
-ROIs = {}
-
-# Store the actual frame dimensions for coordinate scaling
-frame_dimensions = {"width": 640, "height": 480}  # Default values, will be updated
-
-def get_roi_label(x1, y1, x2, y2):
-    for label, (top_left, bottom_right) in ROIs.items():
-        rx1, ry1 = top_left
-        rx2, ry2 = bottom_right
-
-        # Return label if there is any intersection between the bounding box and the ROI
-        if x1 < rx2 and x2 > rx1 and y1 < ry2 and y2 > ry1:
-            return label
-    return "Unknown"
-
-def save_event_frame(frame, event_type, track_id, roi_label="Unknown"):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    camera_id = camera_config.get("camera_id", "CAM1")
-    station_number = camera_config.get("station_number", "Station1")
-    customer_id = camera_config.get("customer_id", "Customer1")
-    filename = f"{event_type}_ID{track_id}_{roi_label}_{customer_id}_{camera_id}_{station_number}_{timestamp}.jpg"
-
-    blob_path = f"{GCS_FOLDER}/{filename}"
-
-    success, encoded_image = cv2.imencode('.jpg', frame)
-    if not success:
-        print("Failed to encode image.")
-        return None
-
-    blob = bucket.blob(blob_path)
-    blob.upload_from_string(encoded_image.tobytes(), content_type='image/jpeg')
-    print(f"[GCS] Uploaded: {blob_path}")
-    return filename
-
-def generate_frames():
-    global frame_dimensions
-    results = model.track(
-        source=rtsp_url,
-        show=False,
-        stream=True,
-        tracker="bytetrack.yaml",
-        persist=True
-    )
-
-    prev_time = time.time()
-
-    for result in results:
-        frame = result.orig_img
-        current_time = time.time()
-
-        # Update frame dimensions for coordinate scaling
-        frame_dimensions["height"], frame_dimensions["width"] = frame.shape[:2]
-
-        fps = 1.0 / (current_time - prev_time)
-        prev_time = current_time
-
-        if result.boxes.id is None:
-            continue
-
-        ids = result.boxes.id.cpu().numpy().astype(int)
-        classes = result.boxes.cls.cpu().numpy().astype(int)
-        confidences = result.boxes.conf.cpu().numpy()
-        boxes = result.boxes.xyxy.cpu().numpy()
-
-        roi_person_count = {label: 0 for label in ROIs}
-        roi_vehicle_count = {label: 0 for label in ROIs}
-        persons = []
-        cell_phones = []
-
-        for label, (top_left, bottom_right) in ROIs.items():
-            # Ensure integer coordinates
-            x1, y1 = map(int, top_left)
-            x2, y2 = map(int, bottom_right)
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 255, 0), 2)
-            cv2.putText(frame, f"ROI: {label}", (x1, y1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-
-
-        for track_id, cls, box, conf in zip(ids, classes, boxes, confidences):
-            if conf < CONFIDENCE_THRESHOLD:
+# Every event is also kept as an indexed row in SQLite for the /events history query
+EVENT_DB_PATH = "events.db"
+MAX_EVENT_PAGE = 1000
+event_store = EventStore(EVENT_DB_PATH)
+
+# Default JPEG quality of the live stream (override per viewer with /stream?q=)
+STREAM_JPEG_QUALITY = 80
+
+# Seconds between SSE keep-alive comments when nothing new arrives
+SSE_KEEPALIVE = 15
+
+# "wsgi": Flask's threaded server (one thread per open stream); "asgi": uvicorn with async streaming routes
+SERVER_MODE = "wsgi"
+
+# "threads": capture, inference and encoding run as threads of this process (one GIL).
+# "processes": they run in CAPTURE/INFERENCE/ENCODE_WORKERS worker processes that pass frames
+# through shared memory, and this process only serves streams, logs and the API.
+PIPELINE_MODE = "threads"
+CAPTURE_WORKERS = 1
+INFERENCE_WORKERS = 1
+ENCODE_WORKERS = 2
+MAX_FRAME_BYTES = 1920 * 1080 * 3  # Largest decoded frame a shared-memory slot can hold
+
+# Several nodes, one camera list. "standalone" runs CAMERAS here. "coordinator" runs no cameras:
+# it assigns CAMERAS (and /cameras additions) to worker nodes by their measured inference ms per
+# frame, moves a node's cameras elsewhere once it misses heartbeats for NODE_TIMEOUT seconds, and
+# serves every node's events, metrics and streams (redirected) through its own API and dashboard.
+# "worker" runs whatever the coordinator at COORDINATOR_URL assigns, reporting every
+# HEARTBEAT_INTERVAL seconds as NODE_ID, reachable at NODE_URL (default http://127.0.0.1:PORT),
+# and stops its cameras once it has gone NODE_TIMEOUT seconds without reaching the coordinator
+# (keep NODE_TIMEOUT the same on every node).
+# Override with `python app.py --role worker --port 5001 --coordinator http://127.0.0.1:5000`.
+PORT = 5000
+CLUSTER_ROLE = "standalone"
+COORDINATOR_URL = "http://127.0.0.1:5000"
+NODE_ID = socket.gethostname()
+NODE_URL = None
+HEARTBEAT_INTERVAL = 1.0
+NODE_TIMEOUT = 5.0
+coordinator = None
+cluster_node = None
+
+# ROI sets saved by /update_rois; restored at startup and when a camera is added again
+ROI_STORE_PATH = "rois.json"
+roi_store = ROIStore(ROI_STORE_PATH)
+
+# Declarative alert rules (see rules.py), edited through /alert_rules and reloaded when the file changes;
+# the built-in idle/unattended/phone rules apply until the file exists
+ALERT_RULES_PATH = "alert_rules.json"
+rule_book = RuleBook(ALERT_RULES_PATH)
+
+def build_camera(cam):
+    """Create a Camera from a CAMERAS entry or a /cameras POST body, with its saved (or given) ROIs."""
+    camera = Camera(cam["camera_id"], cam["source"],
+                  cam.get("station_number", "Station1"), cam.get("customer_id", "Customer1"),
+                  PHONE_ALERT_FRAMES, PHONE_RELEASE_FRAMES,
+                  cam.get("inference_mode", "full"), cam.get("detect_stride", 1),
+                  cam.get("target_latency_ms", 66.0), TRACK_TTL_FRAMES,
+                  cam.get("render_mode", "server"), cam.get("crop_mode", "full"),
+                  cam.get("clip_buffer_seconds", CLIP_BUFFER_SECONDS),
+                  int(cam.get("clip_buffer_mb", CLIP_BUFFER_MB) * 1024 * 1024),
+                  cam.get("motion_gate", False), MODEL_IMGSZ)
+    rois = cam.get("rois") or roi_store.load().get(cam["camera_id"])
+    if rois:
+        camera.set_rois(rois)
+    return camera
+
+registry = CameraRegistry()
+for cam in CAMERAS:
+    registry.add(build_camera(cam), start=False)
+
+# Tracking/alert logic shared with the offline replay harness (benchmarks/replay.py)
+# Class names and the model itself are filled in once the model has loaded
+processor = FrameProcessor({}, uploader, event_log, inference_log, GCS_FOLDER, STREAM_JPEG_QUALITY,
+                           event_store, clips, rule_book)
+
+# Captured frames from every camera are batched through the single model (held until it is loaded)
+scheduler = InferenceScheduler(None, registry, processor.process_result, max_batch=INFERENCE_BATCH_SIZE,
+                               tracker_config="bytetrack.yaml", imgsz=MODEL_IMGSZ, classes=DETECTION_CLASSES)
+_engine_lock = threading.Lock()
+
+process_pipeline = None
+if PIPELINE_MODE == "processes":
+    process_pipeline = ProcessPipeline(
+        registry, event_log, inference_log,
+        model_options={"size": MODEL_SIZE, "backend": MODEL_BACKEND, "precision": MODEL_PRECISION,
+                       "imgsz": MODEL_IMGSZ, "cache_dir": MODEL_CACHE_DIR,
+                       "calibration_dir": CALIBRATION_FRAMES_DIR},
+        predict_options={"imgsz": MODEL_IMGSZ, "classes": DETECTION_CLASSES},
+        storage_options={"kind": STORAGE_BACKEND,
+                         "options": {"bucket_name": GCS_BUCKET_NAME, "credentials_info": SERVICE_ACCOUNT_INFO,
+                                     "root": LOCAL_STORAGE_DIR},
+                         "workers": UPLOAD_WORKERS, "max_queue": UPLOAD_QUEUE_SIZE, "spool_dir": UPLOAD_SPOOL_DIR},
+        capture_workers=CAPTURE_WORKERS, inference_workers=INFERENCE_WORKERS, encode_workers=ENCODE_WORKERS,
+        max_batch=INFERENCE_BATCH_SIZE, snapshot_folder=GCS_FOLDER, stream_quality=STREAM_JPEG_QUALITY,
+        max_frame_bytes=MAX_FRAME_BYTES, log_level=LOG_LEVEL, event_store=event_store,
+        clips=clips, rules_path=ALERT_RULES_PATH, warmup_runs=MODEL_WARMUP_RUNS)
+
+# Sampled on demand through /admin/profiler; idle otherwise
+profiler = SamplingProfiler()
+
+def _per_camera(fn):
+    return lambda: {(camera.camera_id,): fn(camera) for camera in registry.cameras()}
+
+def _worker_state(camera):
+    """Capture and tracking stats of a camera, as its worker processes last reported them in process mode."""
+    if process_pipeline is not None:
+        return process_pipeline.camera_stats(camera.camera_id)
+    return {"capture": camera.grabber.stats(), "tracked_vehicles": len(camera.tracked_vehicles),
+            "rule_timers": camera.rule_timers.pending}
+
+def _capture(key):
+    return _per_camera(lambda c: _worker_state(c)["capture"].get(key) or 0)
+
+# Scrape-time views of state the components already keep. In process mode the counters and
+# histograms of the worker processes arrive over the results queue and are merged in by /metrics
+REGISTRY.collector("sst_capture_frames_total", "Frames decoded from the source",
+                   _capture("captured_frames"), ("camera",), "counter")
+REGISTRY.collector("sst_capture_dropped_frames_total", "Frames overwritten before inference picked them up",
+                   _capture("dropped_frames"), ("camera",), "counter")
+REGISTRY.collector("sst_capture_reconnects_total", "Source reconnects",
+                   _capture("reconnects"), ("camera",), "counter")
+REGISTRY.collector("sst_capture_fps", "Smoothed source frame rate",
+                   _capture("capture_fps"), ("camera",))
+REGISTRY.collector("sst_capture_latency_seconds", "Smoothed capture-to-publish latency",
+                   _per_camera(lambda c: (_worker_state(c)["capture"].get("latency_ms") or 0.0) / 1000),
+                   ("camera",))
+REGISTRY.collector("sst_stream_viewers", "Open /stream connections",
+                   _per_camera(lambda c: c.broadcaster.subscribers), ("camera",))
+REGISTRY.collector("sst_tracked_vehicles", "Vehicles currently tracked",
+                   _per_camera(lambda c: _worker_state(c).get("tracked_vehicles", 0)), ("camera",))
+REGISTRY.collector("sst_rule_timers", "Alert rule timers running for tracks in view",
+                   _per_camera(lambda c: _worker_state(c).get("rule_timers", 0)), ("camera",))
+# Inference workers report their own batch counts
+REGISTRY.collector("sst_inference_batches_total", "model.predict calls",
+                   lambda: {(): scheduler.batches} if process_pipeline is None else {}, kind="counter")
+REGISTRY.collector("sst_uploads_total", "Snapshot uploads by outcome",
+                   lambda: {(k,): v for k, v in uploader.stats().items()
+                            if k in ("submitted", "uploaded", "failed", "dropped", "spooled", "replayed", "retried")},
+                   ("result",), "counter")
+REGISTRY.collector("sst_upload_queue_depth", "Snapshots waiting for an upload worker",
+                   lambda: {(): uploader.stats()["queue_depth"]})
+REGISTRY.collector("sst_clip_buffer_bytes", "Encoded frames held for pre-event clips",
+                   _per_camera(lambda c: c.clip_buffer.stats()["bytes"] if c.clip_buffer else 0), ("camera",))
+REGISTRY.collector("sst_clips_total", "Event clips by outcome",
+                   lambda: {(k,): v for k, v in clips.stats().items() if k in ("triggered", "uploaded", "failed")},
+                   ("result",), "counter")
+REGISTRY.collector("sst_event_store_rows_total", "Events written to the event store",
+                   lambda: {(): event_store.written}, kind="counter")
+REGISTRY.collector("sst_event_store_queue_depth", "Events waiting to be written to the event store",
+                   lambda: {(): event_store.stats()["queued"]})
+REGISTRY.collector("sst_cluster_node_share", "Share of each second a node spends on inference for its cameras",
+                   lambda: {(node,): share for node, share in coordinator.node_shares().items()} if coordinator else {},
+                   ("node",))
+REGISTRY.collector("sst_cluster_reassignments_total", "Cameras moved to another node",
+                   lambda: {(): coordinator.reassigned} if coordinator else {}, kind="counter")
+
+def render_metrics():
+    """This process's metrics text, with every worker process's merged in (labelled worker=) in process mode"""
+    text = REGISTRY.render()
+    return text if process_pipeline is None else process_pipeline.metrics(text)
+
+def attach_camera(cam):
+    """Build a camera from its spec and start running it; raises ValueError/KeyError like the constructors."""
+    camera = build_camera(cam)
+    registry.add(camera, start=process_pipeline is None)
+    if process_pipeline is not None:
+        process_pipeline.add_camera(camera)
+    return camera
+
+def detach_camera(camera_id):
+    camera = registry.remove(camera_id)
+    if camera is not None and process_pipeline is not None:
+        process_pipeline.remove_camera(camera_id)
+    return camera
+
+def apply_assignment(specs):
+    """Run exactly the cameras the coordinator assigned to this node."""
+    assigned = {cam["camera_id"]: cam for cam in specs}
+    for camera in registry.cameras():
+        if camera.camera_id not in assigned:
+            detach_camera(camera.camera_id)
+            log.info("camera_released", camera=camera.camera_id)
+    for camera_id, cam in assigned.items():
+        if registry.get(camera_id) is None:
+            try:
+                attach_camera(cam)
+            except (KeyError, ValueError) as e:
+                log.error("camera_assignment_failed", camera=camera_id, error=str(e))
                 continue
-            x1, y1, x2, y2 = map(int, box)
-            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
-            label = class_names[cls]
-
-            color = (0, 255, 0)
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-            label_text = f'{label} ID: {track_id} ({conf:.2f})'
-            cv2.putText(frame, label_text, (x1, y2 + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-
-
-            roi_label = get_roi_label(x1, y1, x2, y2)
-            if roi_label == "Unknown":
-                continue
-
-            if cls == person_class_id:
-                roi_person_count[roi_label] += 1
-                persons.append((track_id, (x1, y1, x2, y2)))
-            elif cls == cell_phone_class_id:
-                cell_phones.append((track_id, (x1, y1, x2, y2)))
-            elif cls in vehicle_class_ids:
-                roi_vehicle_count[roi_label] += 1
-                
-                #Alert for Vehicle-idle
-                if track_id not in tracked_vehicles:
-                    tracked_vehicles[track_id] = {
-                        'start_time': current_time,
-                        'last_attended_time': current_time,
-                        'bbox': (cx, cy),
-                        'alert_level': 0
-                    }
-                else:
-                    prev_cx, prev_cy = tracked_vehicles[track_id]['bbox']
-                    distance = ((cx - prev_cx) ** 2 + (cy - prev_cy) ** 2) ** 0.5
-                    if distance > MOVE_THRESHOLD:
-                        tracked_vehicles[track_id]['start_time'] = current_time
-                        tracked_vehicles[track_id]['last_attended_time'] = current_time
-                        tracked_vehicles[track_id]['bbox'] = (cx, cy)
-
-                dwell_duration = current_time - tracked_vehicles[track_id]['start_time']
-                interval = int(dwell_duration // 180)
-
-                unattended_duration = current_time - tracked_vehicles[track_id]['last_attended_time']
-
-                # New: Check for unattended vehicle > 30 seconds
-                if unattended_duration > 30:
-                    attended = False
-                    for pid, (px1, py1, px2, py2) in persons:
-                        if get_roi_label(x1, y1, x2, y2) == get_roi_label(px1, py1, px2, py2):
-                            attended = True
-                            tracked_vehicles[track_id]['last_attended_time'] = current_time
-                            # Reset alert level and remove previous unattended alerts if any
-                            if 'unattended_alert_level' in tracked_vehicles[track_id]:
-                                del tracked_vehicles[track_id]['unattended_alert_level']
-                                # Remove all previous unattended alerts related to this vehicle
-                                event_log[:] = [e for e in event_log if f"Vehicle {track_id} unattended" not in e]
-                            break
-
-                    if not attended:
-                        unattended_interval = int(unattended_duration // 30)
-                        last_alert = tracked_vehicles[track_id].get('unattended_alert_level', -1)
-
-                        if unattended_interval > last_alert:
-                            alert_color = (0, 165, 255)
-                            unattended_msg = f'ALERT: Vehicle {track_id} unattended >{unattended_interval * 30}s'
-                            cv2.putText(frame, unattended_msg, (x1, y1 - 35), cv2.FONT_HERSHEY_SIMPLEX, 0.5, alert_color, 2)
-                            print(unattended_msg)
-                            event_log.append(f"{roi_label}: {unattended_msg}")
-                            filename = save_event_frame(frame, "unattended_vehicle", track_id, roi_label)
-                            event_log.append(f"{roi_label}: {unattended_msg} (Frame: {filename})")
-
-
-                if interval > tracked_vehicles[track_id]['alert_level']:
-                    alert_color = (0, 0, 255)
-                    alert_msg = f'ALERT: {label} {track_id} idle for {interval * 3} minutes'
-                    cv2.putText(frame, alert_msg, (x1, y1 - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, alert_color, 2)
-                    print(alert_msg)
-                    event_log.append(f"{roi_label}: {alert_msg} (Frame: {filename})")
-                    filename = save_event_frame(frame, "idle_vehicle", track_id, roi_label)
-                    tracked_vehicles[track_id]['alert_level'] = interval
-                elif dwell_duration >= WARNING_TIME:
-                    alert_color = (0, 255, 255)
-                else:
-                    alert_color = (0, 255, 0)
-
-                cv2.rectangle(frame, (x1, y1), (x2, y2), alert_color, 2)
-                cv2.putText(frame, f'{label} ID: {track_id}', (x1, y2 + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, alert_color, 2)
-        
-        #Alert for Person using Cell-Phone
-        for pid, p_box in persons:
-            px1, py1, px2, py2 = p_box
-            for cid, c_box in cell_phones:
-                cx1, cy1, cx2, cy2 = c_box
-
-                if (px1 < cx2 and px2 > cx1 and py1 < cy2 and py2 > cy1):
-                    color = (255, 0, 0)
-                    alert_msg = f'ALERT: Person {pid} using mobile phone'
-
-                    # Determine the ROI for the person
-                    person_roi = get_roi_label(px1, py1, px2, py2)
-                    if person_roi != "Unknown":
-                        alert_msg += f' in ROI: {person_roi}'
-
-                    cv2.putText(frame, alert_msg, (px1, py1 - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                    print(alert_msg)
-                    cv2.rectangle(frame, (px1, py1), (px2, py2), color, 2)
-                    event_log.append(f"{person_roi}: {alert_msg} (Frame: {filename})")
-                    filename = save_event_frame(frame, "mobile_user", pid, person_roi)
-
-        while len(event_log) > MAX_EVENTS:
-            event_log.pop(0)
-
-        text_color = (255, 255, 255)
-        y_offset = 30
-        for label in roi_person_count:
-            cv2.putText(frame, f"{label} - People: {roi_person_count[label]}",
-                        (20, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.6, text_color, 2)
-            y_offset += 30
-            cv2.putText(frame, f"{label} - Vehicles: {roi_vehicle_count[label]}",
-                        (20, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.6, text_color, 2)
-            y_offset += 40
-
-
-        cv2.putText(frame, f"FPS: {fps:.2f}", (20, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-        ret, buffer = cv2.imencode('.jpg', frame)
-        if not ret:
-            continue
-        frame_bytes = buffer.tobytes()
-
-        frame_summary = [class_names[cls] for cls in classes]
-        summary_text = f"{len(frame_summary)}: " + ', '.join(frame_summary)
-        inference_time = result.speed['inference']
-        fps = 1000 / inference_time if inference_time > 0 else 0
-        fps_text = f"FPS: {fps:.1f}"
-
-        cv2.putText(frame, fps_text, (20, frame.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-
-        summary_text += f", {inference_time:.1f}ms, {fps_text}"
-        print(summary_text)
-        inference_log.append(summary_text)
-
-        while len(inference_log) > MAX_INFERENCES:
-            inference_log.pop(0)
-
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+            log.info("camera_assigned", camera=camera_id, source=cam.get("source"))
+
+def node_report():
+    """(inference ms per frame averaged over this node's cameras, or None; per-camera stats) for heartbeats"""
+    cameras = {camera.camera_id: camera_info(camera) for camera in registry.cameras()}
+    measured = [info["inference"].get("inference_ms") for info in cameras.values()
+                if isinstance(info.get("inference"), dict) and info["inference"].get("inference_ms")]
+    if not measured:
+        # Before any camera has been measured, the warm-up speed stands in
+        return startup.info("model").get("warmup_ms"), cameras
+    return sum(measured) / len(measured), cameras
+
+def start_cluster():
+    """Create this process's coordinator or cluster node for CLUSTER_ROLE (once)."""
+    global coordinator, cluster_node
+    if CLUSTER_ROLE == "coordinator" and coordinator is None:
+        saved = roi_store.load()
+        coordinator = Coordinator([{**cam, "rois": cam.get("rois") or saved.get(cam["camera_id"])}
+                                   for cam in CAMERAS], event_log, event_store, NODE_TIMEOUT,
+                                  on_rois=roi_store.save)
+        # Cameras run on the worker nodes only
+        for camera in registry.cameras():
+            registry.remove(camera.camera_id)
+        log.info("cluster_coordinator_started", cameras=len(CAMERAS))
+    elif CLUSTER_ROLE == "worker" and cluster_node is None:
+        for camera in registry.cameras():
+            registry.remove(camera.camera_id)
+        cluster_node = ClusterNode(NODE_ID, NODE_URL or f"http://127.0.0.1:{PORT}", COORDINATOR_URL,
+                                   node_report, apply_assignment, render_metrics, HEARTBEAT_INTERVAL,
+                                   node_timeout=NODE_TIMEOUT)
+        # Every event raised here is also sent to the coordinator
+        processor.event_log = cluster_node.forward(event_log, "events")
+        processor.event_store = cluster_node.forward(event_store, "store")
+        if process_pipeline is not None:
+            process_pipeline.event_log = processor.event_log
+            process_pipeline.event_store = processor.event_store
+        cluster_node.start()
+
+def load_model(progress):
+    """Startup step: load (exporting if needed) and warm up the detector, then hand it to the scheduler."""
+    progress("loading", backend=MODEL_BACKEND, precision=MODEL_PRECISION, imgsz=MODEL_IMGSZ)
+    started = time.time()
+    model, description = load_detector(MODEL_SIZE, MODEL_BACKEND, MODEL_PRECISION, MODEL_IMGSZ,
+                                       MODEL_CACHE_DIR, CALIBRATION_FRAMES_DIR)
+    progress("warming_up", model=description, load_seconds=round(time.time() - started, 3))
+    ms = warm_up(model, MODEL_IMGSZ, INFERENCE_BATCH_SIZE, MODEL_WARMUP_RUNS, classes=DETECTION_CLASSES)
+    processor.class_names.update(model.names)
+    scheduler.model = model
+    progress("serving", warmup_ms=round(ms, 2))
+    log.info("model_loaded", model=description, warmup_ms=round(ms, 2))
+    return model
+
+def connect_storage(progress):
+    """Startup step: build the snapshot storage client ahead of the first alert."""
+    progress("connecting", backend=STORAGE_BACKEND)
+    uploader.backend.connect()
+
+def start_engine():
+    """
+    Start capture threads for all cameras and the shared inference scheduler (idempotent).
+    Returns at once: the model and the storage client are set up in the background (see /readyz).
+    """
+    with _engine_lock:
+        start_cluster()
+        if coordinator is not None:
+            return
+        startup.run("storage", connect_storage, required=False)
+        if process_pipeline is not None:
+            process_pipeline.start()
+            startup.run("model", process_pipeline.wait_models)
+            return
+        startup.run("model", load_model)
+        for camera in registry.cameras():
+            camera.start()
+        scheduler.start()
+
+def camera_info(camera):
+    """camera.to_dict(), with capture/inference stats reported by the worker processes if any"""
+    info = camera.to_dict()
+    if process_pipeline is not None:
+        info.update(process_pipeline.camera_stats(camera.camera_id))
+    return info
+
+def get_camera():
+    """Resolve the camera addressed by the ?camera= query parameter (default camera otherwise)."""
+    camera_id = request.args.get("camera", DEFAULT_CAMERA)
+    return registry.get(camera_id)
+
+# Per-camera routes a coordinator hands to the node running the camera (307 keeps POST bodies)
+NODE_ROUTES = ("stream", "detections", "update_config", "update_rois", "get_frame_dimensions")
+
+@app.before_request
+def route_to_node():
+    if coordinator is None or request.endpoint not in NODE_ROUTES:
+        return None
+    url = coordinator.owner_url(request.args.get("camera", DEFAULT_CAMERA))
+    if url is None:
+        return jsonify({"status": "error", "message": "Camera not running on any node"}), 503
+    return redirect(url + request.full_path, code=307)
 
 @app.route('/')
 def index():
@@ -433,6 +561,7 @@ def index():
 <body>
 <div id="config-container" style="max-width: 960px; margin: 20px auto; padding:0 20px;">
     <h2>⚙️ Camera Configuration</h2>
+    <select id="cameraSelect" style="margin-right:10px; padding:5px;"></select>
     <input type="text" id="cameraIdInput" placeholder="Enter Camera ID" style="margin-right:10px; padding:5px;">
     <input type="text" id="stationNumberInput" placeholder="Enter Station Number" style="margin-right:10px; padding:5px;">
     <input type="text" id="customerIdInput" placeholder="Enter Customer ID" style="margin-right:10px; padding:5px;">
@@ -465,6 +594,96 @@ const ctx = canvas.getContext('2d');
 let isDrawing = false;
 let startX, startY;
 const rectangles = [];
+const cameraSelect = document.getElementById('cameraSelect');
+
+function cameraQuery() {
+    return cameraSelect.value ? `?camera=${encodeURIComponent(cameraSelect.value)}` : '';
+}
+
+// Populate the camera picker and switch the stream when another camera is selected
+fetch('/cameras')
+    .then(response => response.json())
+    .then(cameras => {
+        cameras.forEach(cam => {
+            const option = document.createElement('option');
+            option.value = cam.camera_id;
+            option.textContent = `${cam.camera_id} (${cam.config.station_number})`;
+            option.dataset.renderMode = cam.render_mode;
+            cameraSelect.appendChild(option);
+        });
+        connectDetections();
+    })
+    .catch(err => console.error('Error fetching cameras:', err));
+
+cameraSelect.addEventListener('change', () => {
+    rectangles.length = 0;
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    img.src = '/stream' + cameraQuery();
+    connectDetections();
+});
+
+// Client-side overlays: cameras in "client" render mode stream raw frames plus detection payloads
+let detectionSource = null;
+let latestDetections = null;
+
+function connectDetections() {
+    if (detectionSource) {
+        detectionSource.close();
+        detectionSource = null;
+    }
+    latestDetections = null;
+    const selected = cameraSelect.selectedOptions[0];
+    if (!selected || selected.dataset.renderMode !== 'client') return;
+    detectionSource = new EventSource('/detections' + cameraQuery());
+    detectionSource.onmessage = (e) => {
+        latestDetections = JSON.parse(e.data);
+        if (!isDrawing) {
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
+            drawAll();
+        }
+    };
+}
+
+function drawDetections() {
+    if (!latestDetections) return;
+    const sx = canvas.width / latestDetections.width;
+    const sy = canvas.height / latestDetections.height;
+    latestDetections.overlay.forEach(op => {
+        if (op[0] === 'r') {
+            const [, x1, y1, x2, y2, color] = op;
+            ctx.strokeStyle = color;
+            ctx.lineWidth = 2;
+            ctx.strokeRect(x1 * sx, y1 * sy, (x2 - x1) * sx, (y2 - y1) * sy);
+        } else if (op[0] === 'b') {
+            // Batch of captioned boxes: flat coordinates, one colour or one per box
+            const [, coords, colors, captions, scale] = op;
+            ctx.lineWidth = 2;
+            ctx.font = `${Math.max(10, Math.round(scale * 30 * sy))}px Roboto`;
+            for (let i = 0, n = 0; i < coords.length; i += 4, n++) {
+                const [x1, y1, x2, y2] = coords.slice(i, i + 4);
+                ctx.strokeStyle = ctx.fillStyle = Array.isArray(colors) ? colors[n] : colors;
+                ctx.strokeRect(x1 * sx, y1 * sy, (x2 - x1) * sx, (y2 - y1) * sy);
+                ctx.fillText(captions[n], x1 * sx, (y2 + 20) * sy);
+            }
+        } else if (op[0] === 'p') {
+            const [, points, color] = op;
+            ctx.strokeStyle = color;
+            ctx.lineWidth = 2;
+            ctx.beginPath();
+            for (let i = 0; i < points.length; i += 2) {
+                ctx.lineTo(points[i] * sx, points[i + 1] * sy);
+            }
+            ctx.closePath();
+            ctx.stroke();
+        } else {
+            const [, text, x, y, scale, color] = op;
+            // Hershey simplex at scale 1.0 is roughly 30px tall
+            ctx.font = `${Math.max(10, Math.round(scale * 30 * sy))}px Roboto`;
+            ctx.fillStyle = color;
+            ctx.fillText(text, x * sx, y * sy);
+        }
+    });
+}
 
 function resizeCanvas() {
     canvas.width = img.clientWidth;
@@ -527,7 +746,7 @@ canvas.addEventListener('mouseup', (e) => {
         const frameScaleY = 480 / canvas.height; // Assuming default frame height
         
         // Get actual frame dimensions from server
-        fetch('/frame_dimensions')
+        fetch('/frame_dimensions' + cameraQuery())
             .then(response => response.json())
             .then(frameDims => {
                 const actualFrameScaleX = frameDims.width / canvas.width;
@@ -577,6 +796,7 @@ canvas.addEventListener('mouseup', (e) => {
 });
 
 function drawAll() {
+    drawDetections();
     rectangles.forEach(r => {
         ctx.strokeStyle = '#00FF00';
         ctx.lineWidth = 2;
@@ -608,7 +828,7 @@ document.getElementById('saveRoisButton').addEventListener('click', () => {
         y2: r.y2
     }));
     
-    fetch('/update_rois', {
+    fetch('/update_rois' + cameraQuery(), {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ rois: roisToSend })
@@ -669,7 +889,7 @@ document.getElementById('saveConfigButton').addEventListener('click', () => {
         return;
     }
 
-    fetch('/update_config', {
+    fetch('/update_config' + cameraQuery(), {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -696,74 +916,322 @@ document.getElementById('saveConfigButton').addEventListener('click', () => {
 
 @app.route('/stream')
 def stream():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    start_engine()
+    camera = get_camera()
+    if camera is None:
+        return jsonify({"status": "error", "message": "Unknown camera"}), 404
+    # ?w= downscales and ?q= sets JPEG quality; variants are encoded once and shared by all viewers
+    width = request.args.get("w", type=int)
+    quality = request.args.get("q", type=int)
+    return Response(camera.broadcaster.subscribe(width, quality),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/update_config', methods=['POST'])
 def update_config():
+    camera = get_camera()
+    if camera is None:
+        return jsonify({"status": "error", "message": "Unknown camera"}), 404
     data = request.json
-    camera_config["camera_id"] = data.get("camera_id", "CAM1")
-    camera_config["station_number"] = data.get("station_number", "Station1")
-    camera_config["customer_id"] = data.get("customer_id", "Customer1")
-    print("[INFO] Updated camera config:", camera_config)
-    return jsonify({"status": "success", "config": camera_config})
+    camera.config["camera_id"] = data.get("camera_id", "CAM1")
+    camera.config["station_number"] = data.get("station_number", "Station1")
+    camera.config["customer_id"] = data.get("customer_id", "Customer1")
+    if process_pipeline is not None:
+        process_pipeline.update_config(camera.camera_id, camera.config)
+    log.info("camera_config_updated", camera=camera.camera_id, config=camera.config)
+    return jsonify({"status": "success", "config": camera.config})
 
 @app.route('/frame_dimensions')
 def get_frame_dimensions():
     """Return the current frame dimensions for coordinate scaling"""
-    return jsonify(frame_dimensions)
+    camera = get_camera()
+    if camera is None:
+        return jsonify({"status": "error", "message": "Unknown camera"}), 404
+    return jsonify(camera.frame_dimensions)
+
+@app.route('/cameras', methods=['GET'])
+def list_cameras():
+    """Return every registered camera with its config and ROIs (on a coordinator: every node's, with its node)"""
+    if coordinator is not None:
+        return jsonify(coordinator.camera_list())
+    return jsonify([camera_info(camera) for camera in registry.cameras()])
+
+@app.route('/cameras', methods=['POST'])
+def add_camera():
+    """Register a new camera; its frames join the shared inference batches immediately"""
+    data = request.json or {}
+    camera_id = data.get("camera_id")
+    source = data.get("source")
+    if not camera_id or not source:
+        return jsonify({"status": "error", "message": "camera_id and source are required"}), 400
+    if coordinator is not None:
+        try:
+            node_id = coordinator.add_camera(data)
+        except KeyError as e:
+            return jsonify({"status": "error", "message": str(e)}), 409
+        log.info("camera_added", camera=camera_id, source=source, node=node_id)
+        return jsonify({"status": "success", "camera": data, "node": node_id})
+    try:
+        camera = attach_camera(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except KeyError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    log.info("camera_added", camera=camera_id, source=source)
+    return jsonify({"status": "success", "camera": camera.to_dict()})
+
+@app.route('/cameras/<camera_id>', methods=['DELETE'])
+def remove_camera(camera_id):
+    """Stop and unregister a camera (on a coordinator: its node drops it on the next heartbeat)"""
+    camera = coordinator.remove_camera(camera_id) if coordinator is not None else detach_camera(camera_id)
+    if camera is None:
+        return jsonify({"status": "error", "message": "Unknown camera"}), 404
+    log.info("camera_removed", camera=camera_id)
+    return jsonify({"status": "success"})
 
 @app.route('/events_json')
 def events_json():
     """Return events as JSON for AJAX updates"""
-    return jsonify(event_log)
+    return jsonify([record.text() for record in event_log.latest(MAX_EVENTS)])
 
 @app.route('/inference_json')
 def inference_json():
     """Return inference log as JSON for AJAX updates"""
-    return jsonify(inference_log)
+    return jsonify([record.message for record in inference_log.latest(MAX_INFERENCES)])
+
+@app.route('/upload_stats')
+def upload_stats():
+    """Return snapshot upload queue depth, latency and drop counters"""
+    if process_pipeline is not None:
+        # One uploader per encode worker process
+        return jsonify(process_pipeline.upload_stats())
+    return jsonify(uploader.stats())
+
+@app.route('/workers')
+def worker_status():
+    """Return the pipeline mode and, in process mode, every worker process and whether it is alive"""
+    if process_pipeline is None:
+        return jsonify({"mode": "threads"})
+    return jsonify({"mode": "processes", "workers": process_pipeline.workers()})
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests, whatever is still loading"""
+    return jsonify({"status": "ok", "uptime_s": startup.stats()["uptime_s"]})
+
+@app.route('/readyz')
+def readyz():
+    """
+    Readiness: 200 once the model is loaded and warmed up, 503 until then.
+    The body lists every startup step with its state, current phase and
+    seconds taken, so a deploy can follow progress or see what failed.
+    """
+    start_engine()
+    stats = startup.stats()
+    if stats["ready"]:
+        return jsonify({"status": "ready", **stats})
+    failed = any(step["required"] and step["state"] == "failed" for step in stats["steps"].values())
+    return jsonify({"status": "failed" if failed else "starting", **stats}), 503
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of stage timings and per-camera counters (on a coordinator, every node's too)"""
+    text = render_metrics()
+    if coordinator is not None:
+        text = coordinator.metrics(text)
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
+@app.route('/cluster/heartbeat', methods=['POST'])
+def cluster_heartbeat():
+    """Worker node heartbeat: its stats, events and metrics in; the cameras it should run out"""
+    if coordinator is None:
+        return jsonify({"status": "error", "message": "Not a cluster coordinator"}), 404
+    try:
+        return jsonify(coordinator.heartbeat(request.json))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid heartbeat: {e}"}), 400
+
+@app.route('/cluster')
+def cluster_status():
+    """Coordinator: nodes, their measured cost, load and cameras. Worker: connection to the coordinator."""
+    if coordinator is not None:
+        return jsonify({"role": "coordinator", **coordinator.stats()})
+    if cluster_node is not None:
+        return jsonify({"role": "worker", **cluster_node.stats()})
+    return jsonify({"role": "standalone"})
+
+@app.route('/cluster/rebalance', methods=['POST'])
+def cluster_rebalance():
+    """Re-plan every camera across the live nodes, e.g. after adding nodes"""
+    if coordinator is None:
+        return jsonify({"status": "error", "message": "Not a cluster coordinator"}), 404
+    return jsonify({"status": "success", "moved": coordinator.rebalance(), **coordinator.stats()})
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def admin_profiler():
+    """
+    GET: profiler status and hottest functions (?format=collapsed for flame-graph input).
+    POST {"enabled": true, "interval": 0.01}: start or stop sampling.
+    """
+    if ADMIN_TOKEN is not None and request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return jsonify({"status": "error", "message": "Forbidden"}), 403
+    if request.method == 'POST':
+        data = request.json or {}
+        if data.get("enabled"):
+            profiler.start(data.get("interval"), reset=data.get("reset", True))
+        else:
+            profiler.stop()
+        log.info("profiler_toggled", enabled=profiler.running, interval=profiler.interval)
+    if request.args.get("format") == "collapsed":
+        return Response(profiler.collapsed(), mimetype="text/plain")
+    return jsonify(profiler.stats())
+
+def sse_stream(ring, cursor, render):
+    """Yield SSE messages from a ring buffer, resuming after cursor; blocks instead of polling."""
+    while True:
+        records = ring.wait(cursor, timeout=SSE_KEEPALIVE)
+        if not records:
+            yield ": keep-alive\n\n"
+            continue
+        for record in records:
+            yield f"id: {record.seq}\ndata: {render(record)}\n\n"
+        cursor = records[-1].seq
+
+def sse_cursor():
+    """Resume position from the Last-Event-ID header (or ?last_event_id=); 0 replays the retained backlog."""
+    value = request.headers.get("Last-Event-ID") or request.args.get("last_event_id", "0")
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        return 0
+
+def parse_time(value):
+    """Epoch seconds or an ISO 8601 timestamp (local time unless it carries an offset); None if absent."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
 
 @app.route('/events')
 def events():
-    def event_stream():
-        last_len = 0
-        while True:
-            time.sleep(1)
-            if len(event_log) > last_len:
-                for msg in event_log[last_len:]:
-                    yield f"data: {msg}\n\n"
-                last_len = len(event_log)
-    return Response(stream_with_context(event_stream()), mimetype="text/event-stream")
+    """
+    Live events as SSE for clients that accept text/event-stream; otherwise a page of
+    stored events, newest first, filtered by ?start=&end= (epoch or ISO 8601), camera,
+    station, customer, roi, type (comma-separated), track_id and include_retracted.
+    Pass the returned next_cursor as ?cursor= for the following page.
+    """
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        stream = sse_stream(event_log, sse_cursor(), EventRecord.text)
+        return Response(stream_with_context(stream), mimetype="text/event-stream")
+    args = request.args
+    try:
+        start, end = parse_time(args.get("start")), parse_time(args.get("end"))
+        limit = min(max(int(args.get("limit", 100)), 1), MAX_EVENT_PAGE)
+        track_id = int(args["track_id"]) if args.get("track_id") else None
+        rows, next_cursor = event_store.query(
+            start, end, limit, args.get("cursor"), args.get("include_retracted") in ("1", "true"),
+            camera_id=args.get("camera"), station_number=args.get("station"),
+            customer_id=args.get("customer"), roi_label=args.get("roi"),
+            event_type=[t for t in args.get("type", "").split(",") if t], track_id=track_id)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"events": rows, "next_cursor": next_cursor})
 
 @app.route('/inference')
 def inference():
-    def inference_stream():
-        last_len = 0
-        while True:
-            time.sleep(0.5)
-            if len(inference_log) > last_len:
-                for msg in inference_log[last_len:]:
-                    yield f"data: {msg}\n\n"
-                last_len = len(inference_log)
-    return Response(stream_with_context(inference_stream()), mimetype="text/event-stream")
+    stream = sse_stream(inference_log, sse_cursor(), lambda record: record.message)
+    return Response(stream_with_context(stream), mimetype="text/event-stream")
+
+@app.route('/detections')
+def detections():
+    """Newest detection payload per frame (SSE) for cameras in client render mode"""
+    camera = get_camera()
+    if camera is None:
+        return jsonify({"status": "error", "message": "Unknown camera"}), 404
+
+    def detection_stream():
+        last_seq = 0
+        while not camera.detections.closed:
+            seq, payload = camera.detections.wait(last_seq, SSE_KEEPALIVE)
+            if seq == last_seq or payload is None:
+                yield ": keep-alive\n\n"
+                continue
+            last_seq = seq
+            yield f"data: {payload}\n\n"
+    return Response(stream_with_context(detection_stream()), mimetype="text/event-stream")
 
 @app.route('/update_rois', methods=['POST'])
 def update_rois():
     """
     Receive ROI definitions from the frontend as JSON and update the ROIs dictionary.
-    Each call adds new ROIs instead of replacing all.
+    Each ROI is a rectangle {"label", "x1", "y1", "x2", "y2"} or a polygon
+    {"label", "points": [[x, y], ...]}. Each call adds new ROIs instead of replacing
+    all, unless "replace" is true. The result is compiled off the frame loop, swapped
+    in atomically and saved to ROI_STORE_PATH.
     """
-    global ROIs
-    data = request.json
+    camera = get_camera()
+    if camera is None:
+        return jsonify({"status": "error", "message": "Unknown camera"}), 404
+    data = request.json or {}
     new_rois = {}
-    for roi in data.get("rois", []):
-        label = roi["label"]
-        # Ensure coordinates are integers and properly ordered
-        x1, y1, x2, y2 = int(roi["x1"]), int(roi["y1"]), int(roi["x2"]), int(roi["y2"])
-        new_rois[label] = [(min(x1, x2), min(y1, y2)), (max(x1, x2), max(y1, y2))]
-
-    ROIs.update(new_rois)  # Merge with existing ROIs instead of replacing
-    print("[INFO] Updated ROIs:", ROIs)
-    return jsonify({"status": "success", "rois": ROIs})
+    try:
+        for roi in data.get("rois", []):
+            label = roi["label"]
+            if "points" in roi:
+                new_rois[label] = roi_polygon(roi["points"])
+            else:
+                # Ensure coordinates are integers, in range and properly ordered
+                x1, y1, x2, y2 = int(roi["x1"]), int(roi["y1"]), int(roi["x2"]), int(roi["y2"])
+                roi_polygon([(x1, y1), (x2, y2)])
+                new_rois[label] = [(min(x1, x2), min(y1, y2)), (max(x1, x2), max(y1, y2))]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid ROI: {e}"}), 400
+
+    if data.get("replace"):
+        rois = camera.set_rois(new_rois)
+    else:
+        rois = camera.update_rois(new_rois)  # Merge with existing ROIs instead of replacing
+    if process_pipeline is not None:
+        process_pipeline.update_rois(camera.camera_id, rois)
+    roi_store.save(camera.camera_id, rois)
+    log.info("rois_updated", camera=camera.camera_id, version=camera.roi_index.version, rois=rois)
+    return jsonify({"status": "success", "rois": rois, "version": camera.roi_index.version})
+
+@app.route('/alert_rules', methods=['GET', 'POST'])
+def alert_rules():
+    """
+    GET the alert rules in effect; POST {"rules": [...]} to replace them all.
+    The new rules are validated, saved to ALERT_RULES_PATH and take effect on
+    the next frame, without a restart; an invalid set is rejected whole.
+    """
+    if request.method == 'POST':
+        try:
+            rules = rule_book.replace(request.json)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        return jsonify({"status": "success", "version": rules.version, "rules": rules.to_list()})
+    rules = rule_book.current()
+    return jsonify({"version": rules.version, "rules": rules.to_list()})
+
+# ASGI entry point: streaming routes run as coroutines, everything else goes to Flask.
+# Serve with `uvicorn app:asgi_app --host 0.0.0.0 --port 5000` or set SERVER_MODE = "asgi".
+asgi_app = StreamingASGI(app, registry, DEFAULT_CAMERA, event_log, inference_log,
+                         on_startup=start_engine, keepalive=SSE_KEEPALIVE)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    parser = argparse.ArgumentParser(description="SST Vision server")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--role", choices=("standalone", "coordinator", "worker"), default=CLUSTER_ROLE)
+    parser.add_argument("--coordinator", default=COORDINATOR_URL, help="coordinator base URL (worker role)")
+    parser.add_argument("--node-id", default=NODE_ID)
+    parser.add_argument("--node-url", default=NODE_URL, help="base URL the coordinator and browsers reach this node at")
+    args = parser.parse_args()
+    PORT, CLUSTER_ROLE, COORDINATOR_URL, NODE_ID, NODE_URL = (args.port, args.role, args.coordinator,
+                                                              args.node_id, args.node_url)
+    if SERVER_MODE == "asgi":
+        import uvicorn
+        uvicorn.run(asgi_app, host='0.0.0.0', port=PORT)
+    else:
+        start_engine()
+        app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
@@ -0,0 +1,215 @@
+import asyncio
+import time
+import weakref
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+from metrics import STAGE_SECONDS, STREAM_FRAMES
+
+
+class LoopSignal:
+    """
+    Thread-to-asyncio wake-up: producers call fire() from any thread, and every
+    coroutine awaiting wait() in the event loop resumes. One call_soon_threadsafe
+    per publish, however many coroutines are waiting.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._future = loop.create_future()
+
+    def fire(self):
+        self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        future, self._future = self._future, self.loop.create_future()
+        if not future.done():
+            future.set_result(None)
+
+    async def wait(self, timeout=None):
+        """Wait for the next fire(); returns False on timeout."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class StreamingASGI:
+    """
+    ASGI entry point serving /stream, /detections, /events and /inference from async
+    generators, so an idle viewer costs a suspended coroutine rather than an
+    OS thread. Every other route is handed to the Flask app unchanged, as is
+    /events when the client does not ask for text/event-stream (the history query).
+    """
+
+    STREAM_PATHS = ("/stream", "/events", "/inference", "/detections")
+
+    def __init__(self, flask_app, registry, default_camera, event_log, inference_log,
+                 on_startup=None, keepalive=15.0):
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.registry = registry
+        self.default_camera = default_camera
+        self.event_log = event_log
+        self.inference_log = inference_log
+        self.on_startup = on_startup
+        self.keepalive = keepalive
+        # Keyed by the producer itself: a removed camera's entry goes with its broadcaster
+        self._signals = weakref.WeakKeyDictionary()
+
+    def _signal(self, source):
+        """One LoopSignal per producer (camera broadcaster or log) per process."""
+        signal = self._signals.get(source)
+        if signal is None:
+            signal = LoopSignal(asyncio.get_running_loop())
+            source.add_listener(signal.fire)
+            self._signals[source] = signal
+        return signal
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http" and scope["path"] in self.STREAM_PATHS and self._streaming(scope):
+            query = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+            if scope["path"] == "/stream":
+                await self._stream(query, receive, send)
+            elif scope["path"] == "/detections":
+                await self._detections(query, receive, send)
+            else:
+                headers = dict(scope.get("headers") or [])
+                last_id = headers.get(b"last-event-id", b"").decode() or query.get("last_event_id", "0")
+                try:
+                    cursor = max(int(last_id), 0)
+                except ValueError:
+                    cursor = 0
+                if scope["path"] == "/events":
+                    await self._sse(self.event_log, cursor, lambda r: r.text(), receive, send)
+                else:
+                    await self._sse(self.inference_log, cursor, lambda r: r.message, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    def _streaming(self, scope):
+        if scope["path"] in ("/stream", "/detections"):
+            # Cameras this process does not run (e.g. on a cluster coordinator) go to Flask, which redirects
+            query = parse_qs(scope.get("query_string", b"").decode())
+            return self.registry.get(query.get("camera", [self.default_camera])[-1]) is not None
+        if scope["path"] != "/events":
+            return True
+        accept = dict(scope.get("headers") or []).get(b"accept", b"")
+        return b"text/event-stream" in accept
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.on_startup is not None:
+                    self.on_startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _watch_disconnect(receive, disconnected):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                return
+
+    async def _respond(self, send, status, content_type, body=None):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", content_type.encode()),
+                                (b"cache-control", b"no-cache")]})
+        if body is not None:
+            await send({"type": "http.response.body", "body": body})
+
+    async def _serve(self, chunks, receive, send):
+        """Send chunks from an async generator until it ends or the client disconnects."""
+        disconnected = asyncio.Event()
+        watcher = asyncio.create_task(self._watch_disconnect(receive, disconnected))
+        try:
+            async for chunk in chunks:
+                if disconnected.is_set():
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not disconnected.is_set():
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.cancel()
+            await chunks.aclose()
+
+    async def _stream(self, query, receive, send):
+        camera = self.registry.get(query.get("camera", self.default_camera))
+        if camera is None:
+            await self._respond(send, 404, "application/json",
+                                b'{"status": "error", "message": "Unknown camera"}')
+            return
+        await self._respond(send, 200, "multipart/x-mixed-replace; boundary=frame")
+        width = int(query["w"]) if query.get("w", "").isdigit() else None
+        quality = int(query["q"]) if query.get("q", "").isdigit() else None
+        await self._serve(self._frames(camera, width, quality), receive, send)
+
+    async def _frames(self, camera, width=None, quality=None):
+        broadcaster = camera.broadcaster
+        signal = self._signal(broadcaster)
+        broadcaster.attach()
+        try:
+            last_seq = 0
+            while not broadcaster.closed:
+                seq, frame = broadcaster.latest()
+                if seq == last_seq or frame is None:
+                    await signal.wait(self.keepalive)
+                    continue
+                last_seq = seq
+                # Only the first viewer of a variant encodes it, off the event loop
+                frame_bytes = frame.cached(width, quality)
+                if frame_bytes is None:
+                    frame_bytes = await asyncio.to_thread(frame.jpeg, width, quality)
+                start = time.perf_counter()
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                STAGE_SECONDS.observe(time.perf_counter() - start, camera.camera_id, "stream_write")
+                STREAM_FRAMES.inc(camera.camera_id)
+        finally:
+            broadcaster.detach()
+
+    async def _detections(self, query, receive, send):
+        camera = self.registry.get(query.get("camera", self.default_camera))
+        if camera is None:
+            await self._respond(send, 404, "application/json",
+                                b'{"status": "error", "message": "Unknown camera"}')
+            return
+        await self._respond(send, 200, "text/event-stream")
+        await self._serve(self._payloads(camera.detections), receive, send)
+
+    async def _payloads(self, channel):
+        """Newest-only SSE: a slow client skips payloads rather than queueing them."""
+        signal = self._signal(channel)
+        last_seq = 0
+        while not channel.closed:
+            seq, payload = channel.latest()
+            if seq == last_seq or payload is None:
+                if not await signal.wait(self.keepalive):
+                    yield b": keep-alive\n\n"
+                continue
+            last_seq = seq
+            yield f"data: {payload}\n\n".encode()
+
+    async def _sse(self, ring, cursor, render, receive, send):
+        await self._respond(send, 200, "text/event-stream")
+        await self._serve(self._records(ring, cursor, render), receive, send)
+
+    async def _records(self, ring, cursor, render):
+        signal = self._signal(ring)
+        while True:
+            records = ring.since(cursor)
+            if records:
+                for record in records:
+                    yield f"id: {record.seq}\ndata: {render(record)}\n\n".encode()
+                cursor = records[-1].seq
+                continue
+            if not await signal.wait(self.keepalive):
+                yield b": keep-alive\n\n"
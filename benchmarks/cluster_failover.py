@@ -0,0 +1,151 @@
+"""
+Camera placement and failover of the cluster protocol, with every node a local process.
+
+Starts a coordinator (cluster.Coordinator behind a plain HTTP server) and
+--nodes worker processes speaking the real heartbeat protocol over
+localhost. Node i reports i+1 times --frame-ms of inference per frame and
+raises one event per camera per second, forwarded to the coordinator. Once
+every camera is placed it prints each node's cameras and inference share,
+kills the busiest node and reports how long its cameras took to run again
+elsewhere, and how many forwarded events arrived (none twice; those the
+killed node raised after its last acknowledged heartbeat are lost).
+
+Run from the repository root:
+    python -m benchmarks.cluster_failover [--nodes 3] [--cameras 12] [--frame-ms 5] [--timeout 3]
+"""
+import argparse
+import json
+import multiprocessing as mp
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cluster import ClusterNode, Coordinator
+from eventlog import EventRing
+from logs import configure
+
+
+def serve(coordinator):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            report = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            body = json.dumps(coordinator.heartbeat(report)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def node_process(node_id, coordinator_url, frame_ms, interval, timeout, stop):
+    """A worker node without cameras or a model: it only reports, runs assignments and raises events."""
+    configure("ERROR")
+    running = {}
+    lock = threading.Lock()
+
+    def report():
+        with lock:
+            return frame_ms, {camera_id: {"capture": {"capture_fps": 10.0}} for camera_id in running}
+
+    def assign(specs):
+        with lock:
+            running.clear()
+            running.update((cam["camera_id"], cam) for cam in specs)
+
+    node = ClusterNode(node_id, f"http://127.0.0.1/{node_id}", coordinator_url, report, assign, interval=interval,
+                       node_timeout=timeout)
+    events = node.forward(None, "events")
+    node.start()
+    n = 0
+    while not stop.wait(1.0):
+        with lock:
+            camera_ids = list(running)
+        for camera_id in camera_ids:
+            n += 1
+            events.append(f"{node_id} event {n}", "bench", camera_id, None, n)
+
+
+def placement(coordinator):
+    stats = coordinator.stats()
+    return {node["node"]: (node["cameras"], node["share"], node["frame_ms"]) for node in stats["nodes"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--cameras", type=int, default=12)
+    parser.add_argument("--frame-ms", type=float, default=5.0, help="inference ms per frame of the fastest node")
+    parser.add_argument("--interval", type=float, default=0.5, help="heartbeat interval, seconds")
+    parser.add_argument("--timeout", type=float, default=3.0, help="heartbeats missed for this long lose a node")
+    args = parser.parse_args()
+    configure("ERROR")
+
+    event_log = EventRing(capacity=100000)
+    coordinator = Coordinator([{"camera_id": f"CAM{i + 1}", "source": f"rtsp://cam{i + 1}"}
+                               for i in range(args.cameras)], event_log, node_timeout=args.timeout)
+    server = serve(coordinator)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    ctx = mp.get_context("spawn")
+    processes = {}
+    # One stop event per node: a killed process may die holding its lock
+    stops = {}
+    # Nodes join one after another, each one measurably slower than the last
+    for i in range(args.nodes):
+        node_id = f"node{i + 1}"
+        stops[node_id] = ctx.Event()
+        processes[node_id] = ctx.Process(target=node_process, daemon=True,
+                                         args=(node_id, url, args.frame_ms * (i + 1), args.interval, args.timeout,
+                                               stops[node_id]))
+        processes[node_id].start()
+    deadline = time.time() + 30
+    while time.time() < deadline and len(coordinator.nodes) < args.nodes:
+        time.sleep(0.1)
+    # Re-plan once every node has measured itself
+    time.sleep(2 * args.interval)
+    coordinator.rebalance()
+    time.sleep(3.0)
+
+    print(f"{args.cameras} cameras at 10 fps on {args.nodes} nodes")
+    print(f"{'node':>8} {'ms/frame':>9} {'cameras':>8} {'share':>6}")
+    for node_id, (cameras, share, frame_ms) in sorted(placement(coordinator).items()):
+        print(f"{node_id:>8} {frame_ms:>9.1f} {len(cameras):>8} {share:>6.2f}")
+
+    victim, (orphans, _, _) = max(placement(coordinator).items(), key=lambda item: len(item[1][0]))
+    killed = time.time()
+    processes[victim].terminate()
+    recovered = None
+    while time.time() - killed < args.timeout + 30:
+        cameras = {camera_id: node.cameras for node in list(coordinator.nodes.values())
+                   for camera_id in node.cameras}
+        if victim not in coordinator.nodes and all(camera_id in cameras for camera_id in orphans):
+            recovered = time.time() - killed
+            break
+        time.sleep(0.05)
+    if recovered is None:
+        print(f"killed {victim} ({len(orphans)} cameras): cameras not running again after {args.timeout + 30:.0f}s")
+    else:
+        print(f"killed {victim} ({len(orphans)} cameras): running on the other nodes after {recovered:.2f}s "
+              f"(node timeout {args.timeout:.1f}s)")
+    for node_id, (cameras, share, frame_ms) in sorted(placement(coordinator).items()):
+        print(f"{node_id:>8} {frame_ms:>9.1f} {len(cameras):>8} {share:>6.2f}")
+
+    time.sleep(2 * args.interval)
+    for node_id, process in processes.items():
+        if node_id != victim:
+            stops[node_id].set()
+            process.join(timeout=5)
+    records = event_log.since(0)
+    keys = [(record.message.split()[0], record.track_id) for record in records]
+    print(f"events forwarded: {len(records)}, duplicates: {len(keys) - len(set(keys))}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Accuracy/latency comparison of detector backends on a recorded clip.
+
+The first configuration is the reference; every other one is scored by
+recall against it on vehicle, person and cell-phone detections, so the
+fastest variant that keeps recall on the classes the alerts use can be picked.
+
+Run from the repository root:
+    python -m benchmarks.detector_backends --video clip.mp4 \\
+        --configs m:pytorch:fp32,m:onnx:fp32,m:openvino:fp16,s:openvino:int8 \\
+        [--calibration-dir frames/] [--imgsz 640] [--max-frames 300]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from alerts import pairwise_overlap
+from benchmarks.frame_skipping import load_frames
+from detector import load_detector
+from pipeline import DETECTION_CLASSES
+
+CLASS_GROUPS = {
+    "vehicle": [1, 2, 3, 5, 7],
+    "person": [0],
+    "cell_phone": [67],
+}
+
+
+def detect_all(model, frames, imgsz):
+    # The arguments InferenceScheduler predicts with: only the classes the alerts use, and
+    # Ultralytics' default confidence (0.25) so ByteTrack still gets the weak boxes
+    options = {"imgsz": imgsz, "classes": DETECTION_CLASSES, "verbose": False}
+    outputs = []
+    latencies = []
+    model.predict(frames[0], **options)  # warm-up
+    for frame in frames:
+        start = time.perf_counter()
+        result = model.predict(frame, **options)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        outputs.append((result.boxes.xyxy.cpu().numpy(), result.boxes.cls.cpu().numpy().astype(int)))
+    return outputs, np.array(latencies)
+
+
+def group_recall(reference, candidate, class_ids, iou_threshold=0.5):
+    matched = total = 0
+    for (ref_boxes, ref_cls), (boxes, cls) in zip(reference, candidate):
+        ref_keep = np.isin(ref_cls, class_ids)
+        keep = np.isin(cls, class_ids)
+        total += int(ref_keep.sum())
+        if not ref_keep.any() or not keep.any():
+            continue
+        iou, _ = pairwise_overlap(ref_boxes[ref_keep], boxes[keep])
+        iou[ref_cls[ref_keep][:, None] != cls[keep][None, :]] = 0
+        matched += int((iou.max(axis=1) >= iou_threshold).sum())
+    return matched / total if total else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--configs", default="m:pytorch:fp32,m:onnx:fp32,m:openvino:fp32,m:openvino:int8")
+    parser.add_argument("--calibration-dir")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--cache-dir", default="models")
+    args = parser.parse_args()
+
+    frames, _ = load_frames(args.video, args.max_frames)
+    reference = None
+    header = f"{'config':<36} {'p50 ms':>8} {'p95 ms':>8}" + "".join(f" {g:>11}" for g in CLASS_GROUPS)
+    print(f"{len(frames)} frames from {args.video}")
+    print(header)
+    for config in args.configs.split(","):
+        size, backend, precision = config.split(":")
+        model, description = load_detector(size, backend, precision, args.imgsz, args.cache_dir,
+                                           args.calibration_dir)
+        outputs, latencies = detect_all(model, frames, args.imgsz)
+        if reference is None:
+            reference = outputs
+        recalls = "".join(f" {group_recall(reference, outputs, ids):>11.3f}" for ids in CLASS_GROUPS.values())
+        print(f"{description:<36} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f}{recalls}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Query latency of EventStore over a large synthetic event history.
+
+Fills a fresh SQLite file with --rows events spread over --days across
+stations, cameras, ROIs and event types, then times typical dashboard
+queries (first page and a deep page) and reports p50/p95 per query.
+
+Run from the repository root:
+    python -m benchmarks.event_store_query [--rows 2000000] [--days 90] [--db /tmp/events_bench.db]
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+from eventstore import EventStore
+
+EVENT_TYPES = ["idle_vehicle", "unattended_vehicle", "mobile_user", "vehicle_departed"]
+
+
+def populate(store, rows, days, seed=0):
+    rng = random.Random(seed)
+    start = time.time() - days * 86400
+    step = days * 86400 / rows
+    for i in range(rows):
+        station = rng.randrange(1, 21)
+        camera = f"CAM{station}_{rng.randrange(1, 5)}"
+        config = {"camera_id": camera, "station_number": f"Station{station}", "customer_id": f"Customer{station % 4}"}
+        store.add(rng.choice(EVENT_TYPES), "synthetic", config, f"Pump{rng.randrange(1, 9)}",
+                  rng.randrange(1, 100000), rng.uniform(0, 900), None, start + i * step)
+        if i % 5000 == 0:
+            store.flush(timeout=60)
+    store.flush(timeout=600)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--days", type=float, default=90)
+    parser.add_argument("--db", default="/tmp/events_bench.db")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    store = EventStore(args.db, batch_size=5000)
+    start = time.perf_counter()
+    populate(store, args.rows, args.days)
+    print(f"inserted {store.written} rows in {time.perf_counter() - start:.1f}s")
+
+    now = time.time()
+    last_week = (now - 7 * 86400, now)
+    _, deep_cursor = store.query(limit=5000, station_number="Station3")
+    queries = {
+        "latest 100": lambda: store.query(limit=100),
+        "station, last week": lambda: store.query(*last_week, station_number="Station3"),
+        "station + type, last week": lambda: store.query(*last_week, station_number="Station3",
+                                                         event_type=["unattended_vehicle"]),
+        "camera + roi": lambda: store.query(camera_id="CAM3_1", roi_label="Pump2"),
+        "track id": lambda: store.query(track_id=4242),
+        "station, page 51": lambda: store.query(station_number="Station3", cursor=deep_cursor),
+    }
+    print(f"{'query':>28} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, fn in queries.items():
+        p50, p95 = timed(fn, args.repeat)
+        print(f"{name:>28} {p50:>8.2f} {p95:>8.2f}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Per-frame post-processing cost in crowded scenes: per-box Python loop vs column stages.
+
+Synthesises a forecourt with N tracked boxes per frame (people, vehicles
+and phones drifting slowly across --rois pump ROIs) for every N in
+--detections and runs the same frames through the previous per-box loop and
+through FrameProcessor.alerts() over FrameColumns, each with its own track
+state. Both get the ROI assignment precomputed. Reports the per-frame p50 of
+the alert stage, of the alert stage plus the overlay's browser payload
+(captions are only formatted there now), the speedup, and the events each
+implementation raised under the default alert rules.
+
+Event counts differ by design, and by a lot for unattended alerts (idle and
+phone counts match). A vehicle now counts as attended by anyone in its ROI,
+not only people listed before it. Its last attended time is refreshed on
+every attended frame, so "unattended" means 30 s of continuous absence; the
+old loop only refreshed it once the vehicle was 30 s past its last refresh,
+so a single empty frame after that fired the alert. An unattended alert is
+also retracted as soon as someone steps into the ROI.
+
+Run from the repository root:
+    python -m benchmarks.frame_postprocess [--detections 50 300 1000] [--rois 8] [--frames 600]
+"""
+import argparse
+import statistics
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from alerts import EpisodeDebouncer, pairwise_overlap
+from eventlog import EventRing
+from logs import configure
+from overlay import Overlay
+from pipeline import (CONFIDENCE_THRESHOLD, MOVE_THRESHOLD, FrameColumns, FrameProcessor, cell_phone_class_id,
+                      person_class_id, vehicle_class_ids)
+from rois import ROIIndex
+from rules import RuleTimers
+from tracks import TrackStore
+
+# Thresholds of the previous hard-coded alerts (now the default rules)
+WARNING_TIME = 45
+PHONE_CONTAINMENT_THRESHOLD = 0.5
+
+NAMES = {0: "person", 1: "bicycle", 2: "car", 3: "motorcycle", 5: "bus", 7: "truck", 67: "cell phone"}
+
+
+class NullUploader:
+    def submit(self, path, frame=None, data=None):
+        return True
+
+
+def make_camera(camera_id):
+    return SimpleNamespace(camera_id=camera_id, config={"camera_id": camera_id}, tracked_vehicles=TrackStore(30),
+                           phone_debouncer=EpisodeDebouncer(5, 15), rule_timers=RuleTimers(5, 15))
+
+
+def make_scene(n_rois, n_dets, width=1920, height=1080, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = int(np.ceil(n_rois / 2))
+    cell_w, cell_h = width // columns, height // 2
+    rois = {f"Pump{i + 1}": [((i % columns) * cell_w, (i // columns) * cell_h),
+                             ((i % columns + 1) * cell_w - 10, (i // columns + 1) * cell_h - 10)]
+            for i in range(n_rois)}
+    # A busy forecourt: mostly people and cars, a few trucks and motorbikes, the odd phone
+    classes = rng.choice([person_class_id, 2, 7, 3, cell_phone_class_id], p=[0.45, 0.35, 0.08, 0.07, 0.05],
+                         size=n_dets)
+    sizes = np.where(classes[:, None] == cell_phone_class_id, 20, np.where(classes[:, None] == person_class_id,
+                                                                         [60, 160], [180, 120]))
+    origin = rng.uniform(0, [width - 200, height - 200], size=(n_dets, 2))
+    drift = rng.normal(0, 0.5, size=(n_dets, 2))
+    return rois, np.arange(1, n_dets + 1), classes, sizes, origin, drift, rng
+
+
+def frames(n_frames, n_dets, classes, sizes, origin, drift, rng, fps=2.0):
+    for n in range(n_frames):
+        xy = origin + drift * n
+        boxes = np.concatenate([xy, xy + sizes], axis=1).astype(int)
+        confidences = rng.uniform(0.5, 1.0, size=n_dets).astype(np.float32)
+        yield n / fps, classes, confidences, boxes
+
+
+class LegacyTrack:
+    __slots__ = ("start_time", "last_attended_time", "bbox", "alert_level", "unattended_alert_level")
+
+    def __init__(self, now, centroid):
+        self.start_time = self.last_attended_time = now
+        self.bbox = centroid
+        self.alert_level = 0
+        self.unattended_alert_level = -1
+
+
+def legacy_alerts(processor, camera, tracks, ids, classes, confidences, boxes, box_rois, roi_index, now, fps):
+    """The per-box loop FrameProcessor ran before the column stages (ROI drawing and summary included)."""
+    snapshots = []
+    overlay = Overlay()
+    for label, polygon, rect in zip(roi_index.labels, roi_index.polygons, roi_index.rects):
+        overlay.polygon(polygon, (255, 255, 0), 2)
+        overlay.text(f"ROI: {label}", (rect[0], rect[1] - 10), 0.6, (255, 255, 0), 2)
+    roi_person_count = {label: 0 for label in roi_index.labels}
+    roi_vehicle_count = {label: 0 for label in roi_index.labels}
+    persons = []
+    cell_phones = []
+    for track_id, cls, box, conf, roi_id in zip(ids, classes, boxes, confidences, box_rois):
+        if conf < CONFIDENCE_THRESHOLD:
+            continue
+        x1, y1, x2, y2 = map(int, box)
+        cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+        label = processor.class_names[cls]
+        overlay.rectangle((x1, y1), (x2, y2), (0, 255, 0), 2)
+        overlay.text(f'{label} ID: {track_id} ({conf:.2f})', (x1, y2 + 20), 0.6, (0, 255, 0), 2)
+        if roi_id < 0:
+            continue
+        roi_label = roi_index.label(roi_id)
+        if cls == person_class_id:
+            roi_person_count[roi_label] += 1
+            persons.append((track_id, (x1, y1, x2, y2), roi_id))
+        elif cls == cell_phone_class_id:
+            cell_phones.append((track_id, (x1, y1, x2, y2)))
+        elif cls in vehicle_class_ids:
+            roi_vehicle_count[roi_label] += 1
+            track = tracks.get(track_id)
+            if track is None:
+                track = tracks[track_id] = LegacyTrack(now, (cx, cy))
+            else:
+                prev_cx, prev_cy = track.bbox
+                if ((cx - prev_cx) ** 2 + (cy - prev_cy) ** 2) ** 0.5 > MOVE_THRESHOLD:
+                    track.start_time = track.last_attended_time = now
+                    track.bbox = (cx, cy)
+            dwell_duration = now - track.start_time
+            interval = int(dwell_duration // 180)
+            unattended_duration = now - track.last_attended_time
+            if unattended_duration > 30:
+                attended = False
+                for _, _, person_roi_id in persons:
+                    if person_roi_id == roi_id:
+                        attended = True
+                        track.last_attended_time = now
+                        if track.unattended_alert_level >= 0:
+                            track.unattended_alert_level = -1
+                            processor.event_log.retract(camera.camera_id, int(track_id), "unattended_vehicle")
+                        break
+                if not attended:
+                    unattended_interval = int(unattended_duration // 30)
+                    if unattended_interval > track.unattended_alert_level:
+                        msg = f'ALERT: Vehicle {track_id} unattended >{unattended_interval * 30}s'
+                        overlay.text(msg, (x1, y1 - 35), 0.5, (0, 165, 255), 2)
+                        filename = processor.save_event_frame(camera, snapshots, "unattended_vehicle", track_id,
+                                                              roi_label, now)
+                        processor.log_event(camera, roi_label, msg, "unattended_vehicle", track_id, filename,
+                                            unattended_duration, now)
+                        track.unattended_alert_level = unattended_interval
+            if interval > track.alert_level:
+                alert_color = (0, 0, 255)
+                msg = f'ALERT: {label} {track_id} idle for {interval * 3} minutes'
+                overlay.text(msg, (x1, y1 - 15), 0.5, alert_color, 2)
+                filename = processor.save_event_frame(camera, snapshots, "idle_vehicle", track_id, roi_label, now)
+                processor.log_event(camera, roi_label, msg, "idle_vehicle", track_id, filename, dwell_duration, now)
+                track.alert_level = interval
+            elif dwell_duration >= WARNING_TIME:
+                alert_color = (0, 255, 255)
+            else:
+                alert_color = (0, 255, 0)
+            overlay.rectangle((x1, y1), (x2, y2), alert_color, 2)
+            overlay.text(f'{label} ID: {track_id}', (x1, y2 + 20), 0.6, alert_color, 2)
+    phone_users = []
+    if persons and cell_phones:
+        _, containment = pairwise_overlap(np.array([b for _, b, _ in persons]), np.array([b for _, b in cell_phones]))
+        phone_users = [persons[i] for i in np.flatnonzero(containment.max(axis=1) >= PHONE_CONTAINMENT_THRESHOLD)]
+    fired = set(camera.phone_debouncer.update(pid for pid, _, _ in phone_users))
+    for pid, (px1, py1, px2, py2), person_roi_id in phone_users:
+        if not camera.phone_debouncer.is_active(pid):
+            continue
+        msg = f'ALERT: Person {pid} using mobile phone in ROI: {roi_index.label(person_roi_id)}'
+        overlay.text(msg, (px1, py1 - 30), 0.6, (255, 0, 0), 2)
+        overlay.rectangle((px1, py1), (px2, py2), (255, 0, 0), 2)
+        if pid in fired:
+            filename = processor.save_event_frame(camera, snapshots, "mobile_user", pid,
+                                                  roi_index.label(person_roi_id), now)
+            processor.log_event(camera, roi_index.label(person_roi_id), msg, "mobile_user", pid, filename, now=now)
+    y_offset = 30
+    for label in roi_person_count:
+        overlay.text(f"{label} - People: {roi_person_count[label]}", (20, y_offset), 0.6, (255, 255, 255), 2)
+        y_offset += 30
+        overlay.text(f"{label} - Vehicles: {roi_vehicle_count[label]}", (20, y_offset), 0.6, (255, 255, 255), 2)
+        y_offset += 40
+    overlay.text(f"FPS: {fps:.2f}", (20, y_offset), 0.7, (0, 255, 0), 2)
+    return overlay, snapshots
+
+
+def run(n_dets, n_rois, n_frames):
+    rois, ids, classes, sizes, origin, drift, rng = make_scene(n_rois, n_dets)
+    roi_index = ROIIndex(rois)
+    legacy = FrameProcessor(NAMES, NullUploader(), EventRing(capacity=100000), EventRing(capacity=10))
+    columnar = FrameProcessor(NAMES, NullUploader(), EventRing(capacity=100000), EventRing(capacity=10))
+    legacy_camera, columnar_camera = make_camera("legacy"), make_camera("columnar")
+    legacy_tracks = {}
+    timings = {name: ([], []) for name in ("per-box loop", "column stages")}
+    for now, classes_, confidences, boxes in frames(n_frames, n_dets, classes, sizes, origin, drift, rng):
+        box_rois = roi_index.primary(boxes)
+
+        start = time.perf_counter()
+        overlay, _ = legacy_alerts(legacy, legacy_camera, legacy_tracks, ids, classes_, confidences, boxes,
+                                   box_rois, roi_index, now, 2.0)
+        alerts = time.perf_counter()
+        overlay.to_payload()
+        timings["per-box loop"][0].append(alerts - start)
+        timings["per-box loop"][1].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        columnar_camera.tracked_vehicles.next_frame()
+        columns = FrameColumns(ids, classes_, confidences, boxes, box_rois, len(roi_index))
+        overlay, _ = columnar.alerts(columnar_camera, columns, roi_index, now, 2.0)
+        alerts = time.perf_counter()
+        overlay.to_payload()
+        timings["column stages"][0].append(alerts - start)
+        timings["column stages"][1].append(time.perf_counter() - start)
+    return {name: (statistics.median(alert), statistics.median(payload), processor.event_log.last_seq)
+            for (name, (alert, payload)), processor in zip(timings.items(), (legacy, columnar))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--detections", type=int, nargs="+", default=[50, 300, 1000])
+    parser.add_argument("--rois", type=int, default=8)
+    parser.add_argument("--frames", type=int, default=600)
+    args = parser.parse_args()
+    # Alert warnings would otherwise be formatted to stderr on every firing
+    configure("ERROR")
+
+    print(f"{args.rois} ROIs, {args.frames} frames; p50 ms per frame")
+    print(f"{'detections':>10} {'':>14} {'alerts':>8} {'+payload':>9} {'events':>7}")
+    for n_dets in args.detections:
+        results = run(n_dets, args.rois, args.frames)
+        for name, (alert, payload, events) in results.items():
+            print(f"{n_dets:>10} {name:>14} {alert * 1000:>8.3f} {payload * 1000:>9.3f} {events:>7}")
+        (legacy_alert, legacy_payload, _), (alert, payload, _) = results.values()
+        print(f"{n_dets:>10} {'speedup':>14} {legacy_alert / alert:>7.1f}x {legacy_payload / payload:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
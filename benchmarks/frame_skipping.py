@@ -0,0 +1,102 @@
+"""
+Effective FPS vs detection recall for fixed detector strides on a recorded clip.
+
+Stride 1 (detector on every frame) is the reference; for larger strides the
+skipped frames are filled by TrackPropagator, exactly as the live scheduler does.
+
+Run from the repository root:
+    python -m benchmarks.frame_skipping --video clip.mp4 [--strides 1,2,3,4,6] [--max-frames 600]
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+from alerts import pairwise_overlap
+from propagation import TrackPropagator
+from scheduler import create_tracker
+
+CLASSES_OF_INTEREST = [0, 1, 2, 3, 5, 7, 67]
+
+
+def load_frames(path, max_frames):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames, fps
+
+
+def boxes_of(result):
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.zeros((0, 4), np.float32), np.zeros(0, int)
+    keep = np.isin(result.boxes.cls.cpu().numpy().astype(int), CLASSES_OF_INTEREST)
+    return result.boxes.xyxy.cpu().numpy()[keep], result.boxes.cls.cpu().numpy().astype(int)[keep]
+
+
+def run(model, frames, fps, stride):
+    tracker = create_tracker("bytetrack.yaml", frame_rate=int(fps))
+    propagator = TrackPropagator()
+    outputs = []
+    start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        timestamp = i / fps
+        if i % stride == 0:
+            result = model.predict(frame, verbose=False)[0]
+            tracks = tracker.update(result.boxes.cpu().numpy(), frame)
+            if len(tracks):
+                result = result[tracks[:, -1].astype(int)]
+                result.update(boxes=torch.as_tensor(tracks[:, :-1].astype(np.float32)))
+                propagator.observe_result(result, timestamp)
+            outputs.append(boxes_of(result))
+        else:
+            outputs.append(boxes_of(propagator.result(frame, timestamp, model.names)))
+    elapsed = time.perf_counter() - start
+    return outputs, len(frames) / elapsed
+
+
+def recall(reference, candidate, iou_threshold=0.5):
+    matched = total = 0
+    for (ref_boxes, ref_cls), (boxes, cls) in zip(reference, candidate):
+        total += len(ref_boxes)
+        if not len(ref_boxes) or not len(boxes):
+            continue
+        iou, _ = pairwise_overlap(ref_boxes, boxes)
+        iou[ref_cls[:, None] != cls[None, :]] = 0
+        matched += int((iou.max(axis=1) >= iou_threshold).sum())
+    return matched / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--model", default="yolov8m.pt")
+    parser.add_argument("--strides", default="1,2,3,4,6")
+    parser.add_argument("--max-frames", type=int, default=600)
+    args = parser.parse_args()
+
+    model = YOLO(args.model)
+    frames, fps = load_frames(args.video, args.max_frames)
+    strides = [int(s) for s in args.strides.split(",")]
+    reference, reference_fps = run(model, frames, fps, 1)
+
+    print(f"{len(frames)} frames @ {fps:.1f} fps source, model {args.model}")
+    print(f"{'stride':>6} {'eff. FPS':>9} {'speed-up':>9} {'recall@0.5':>11}")
+    for stride in strides:
+        if stride == 1:
+            outputs, eff_fps = reference, reference_fps
+        else:
+            outputs, eff_fps = run(model, frames, fps, stride)
+        print(f"{stride:>6} {eff_fps:>9.1f} {eff_fps / reference_fps:>8.2f}x {recall(reference, outputs):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
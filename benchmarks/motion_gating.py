@@ -0,0 +1,61 @@
+"""
+CPU cost of a recorded clip with and without motion-gated inference.
+
+Replays the clip twice through benchmarks.replay (same ROIs, same model), once
+detecting every frame and once with --motion-gate, each in its own process so
+the CPU seconds of every thread are counted. Prints CPU time, detector passes
+and events for both runs. Use a long overnight recording (e.g. a 24h clip) to
+measure the night-time saving; alerts should stay the same.
+
+Run from the repository root:
+    python -m benchmarks.motion_gating --video night_24h.mp4 --rois rois.json [--max-frames 0]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def replay(args, gated, report_path):
+    command = [sys.executable, "-m", "benchmarks.replay", "--video", args.video, "--storage", "memory",
+               "--model-size", args.model_size, "--backend", args.backend, "--precision", args.precision,
+               "--max-frames", str(args.max_frames), "--report", report_path]
+    if args.rois:
+        command += ["--rois", args.rois]
+    if gated:
+        command.append("--motion-gate")
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(report_path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--rois", help="ROI JSON file; motion outside the ROIs is ignored")
+    parser.add_argument("--model-size", default="m")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--precision", default="fp32")
+    parser.add_argument("--max-frames", type=int, default=0)
+    args = parser.parse_args()
+
+    reports = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for gated in (False, True):
+            reports[gated] = replay(args, gated, os.path.join(tmp, f"report_{gated}.json"))
+
+    full, gated = reports[False], reports[True]
+    print(f"{args.video}: {full['frames']} frames")
+    print(f"{'':>14} {'CPU s':>9} {'detector':>9} {'events':>7}")
+    for name, report in (("every frame", full), ("motion-gated", gated)):
+        print(f"{name:>14} {report['cpu_seconds']:>9.1f} {report['inference']['detected_frames']:>9} "
+              f"{report['events']:>7}")
+    if gated["cpu_seconds"]:
+        print(f"CPU reduction: {full['cpu_seconds'] / gated['cpu_seconds']:.1f}x; "
+              f"scene static on {gated['inference']['motion']['static_frames'] / max(gated['frames'], 1):.0%} of frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Headless replay of the detection/alert pipeline with per-stage timings.
+
+Feeds a video file, a directory of frames or recorded detections (JSONL, one
+frame per line with "ids", "classes", "boxes" and optional "conf"/"time"; no
+model needed) through the same FrameProcessor the server uses. Alert timers
+follow the recording's own timestamps, so idle/unattended alerts fire at
+max speed exactly as they would live. Snapshots go to a local directory (or
+memory) and alerts to a JSONL file; nothing touches RTSP or GCS.
+
+Prints per-stage timings, p50/p95/p99 frame latency and FPS, and exits
+non-zero when a --max-p95-ms / --max-p99-ms / --min-fps gate is missed, so a
+CPU-only CI job can catch performance regressions.
+
+Run from the repository root:
+    python -m benchmarks.replay --video clip.mp4 [--rois rois.json] [--alert-rules rules.json] [--realtime]
+    python -m benchmarks.replay --frames frames/ --fps 15 [--record detections.jsonl]
+    python -m benchmarks.replay --detections detections.jsonl [--video clip.mp4]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+from ultralytics.utils import yaml_load
+from ultralytics.utils.checks import check_yaml
+
+from cameras import Camera
+from clips import ClipRecorder
+from cropping import crop, merge_crop_results
+from eventlog import EventRing
+from logs import configure as configure_logging
+from pipeline import FrameProcessor, DETECTION_CLASSES, PHONE_ALERT_FRAMES, PHONE_RELEASE_FRAMES
+from rules import RuleBook
+from scheduler import create_tracker, track_result
+from uploader import SnapshotUploader, create_backend
+
+STAGES = ("decode", "motion", "inference", "tracking", "roi_assignment", "alerts", "draw", "encode", "upload")
+
+
+def video_source(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+
+    def frames():
+        index = 0
+        try:
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    return
+                yield index / fps, frame, None
+                index += 1
+        finally:
+            cap.release()
+    return fps, frames()
+
+
+def frames_dir_source(path, fps):
+    paths = sorted(glob.glob(os.path.join(path, "*.jpg")) + glob.glob(os.path.join(path, "*.png")))
+    if not paths:
+        raise SystemExit(f"No .jpg/.png frames in {path}")
+
+    def frames():
+        for index, frame_path in enumerate(paths):
+            yield index / fps, cv2.imread(frame_path), None
+    return fps, frames()
+
+
+def detections_source(path, fps, video=None, size=(1280, 720)):
+    """Recorded detections, drawn on the matching video frames or on a blank canvas."""
+    if video:
+        fps, images = video_source(video)
+        images = (frame for _, frame, _ in images)
+    else:
+        blank = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        images = iter(lambda: blank.copy(), None)
+
+    def frames():
+        with open(path) as f:
+            for index, line in enumerate(f):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                frame = next(images, None)
+                if frame is None:
+                    return
+                yield record.get("time", index / fps), frame, record
+    return fps, frames()
+
+
+def detections_result(frame, record, names):
+    """Build a tracked Results object from one recorded detections line."""
+    ids = record.get("ids", [])
+    data = np.zeros((len(ids), 7), dtype=np.float32)
+    if len(ids):
+        data[:, :4] = np.asarray(record["boxes"], dtype=np.float32).reshape(-1, 4)
+        data[:, 4] = ids
+        data[:, 5] = record.get("conf", [1.0] * len(ids))
+        data[:, 6] = record["classes"]
+    result = Results(frame, path="", names=names, boxes=torch.as_tensor(data))
+    result.speed = {"preprocess": 0.0, "inference": 0.0, "postprocess": 0.0}
+    return result
+
+
+def detections_record(result, timestamp):
+    boxes = result.boxes
+    if boxes is None or boxes.id is None:
+        return {"time": timestamp, "ids": [], "classes": [], "conf": [], "boxes": []}
+    return {
+        "time": timestamp,
+        "ids": boxes.id.cpu().numpy().astype(int).tolist(),
+        "classes": boxes.cls.cpu().numpy().astype(int).tolist(),
+        "conf": [round(float(c), 4) for c in boxes.conf.cpu().numpy()],
+        "boxes": [[round(float(v), 1) for v in box] for box in boxes.xyxy.cpu().numpy()],
+    }
+
+
+def detect(model, camera, frame, timestamp, stages, imgsz):
+    """Detector pass (or motion-model fill-in) plus tracking, as InferenceScheduler does it."""
+    start = time.perf_counter()
+    moving = camera.motion.check(frame, timestamp, camera.roi_index)
+    stages["motion"] = time.perf_counter() - start
+    start = time.perf_counter()
+    if not moving or not camera.policy.should_detect():
+        result = camera.propagator.result(frame, timestamp, model.names, hold=not moving)
+        stages["tracking"] = time.perf_counter() - start
+        return result
+    regions = camera.crop_regions(frame) if camera.crop_mode == "roi" else None
+    results = model.predict(crop(frame, regions) if regions else [frame], verbose=False,
+                            imgsz=imgsz, classes=DETECTION_CLASSES)
+    result = merge_crop_results(frame, model.names, regions, results) if regions else results[0]
+    camera.policy.observe(result.speed.get("inference"))
+    checkpoint = time.perf_counter()
+    stages["inference"] = checkpoint - start
+    result = track_result(camera.tracker, result)
+    camera.propagator.observe_result(result, timestamp)
+    stages["tracking"] = time.perf_counter() - checkpoint
+    return result
+
+
+def summarize(values_ms):
+    values = np.asarray(values_ms, dtype=np.float64)
+    if not len(values):
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"mean": round(float(values.mean()), 3), "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3), "p99": round(float(p99), 3), "max": round(float(values.max()), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    source = parser.add_argument_group("source (one of --video, --frames, --detections)")
+    source.add_argument("--video", help="video file (with --detections: frames to draw on)")
+    source.add_argument("--frames", help="directory of .jpg/.png frames, replayed in name order")
+    source.add_argument("--detections", help="recorded detections JSONL; skips the model")
+    source.add_argument("--fps", type=float, default=15.0, help="frame rate for --frames and --detections")
+    source.add_argument("--size", default="1280x720", help="blank canvas WxH for --detections without --video")
+    parser.add_argument("--realtime", action="store_true",
+                        help="pace frames at source rate, dropping frames the pipeline falls behind on")
+    parser.add_argument("--max-frames", type=int, default=0)
+    parser.add_argument("--rois", help='JSON file {"label": [[x1, y1], [x2, y2]] or [[x, y], ...] polygon}')
+    parser.add_argument("--alert-rules", help="JSON file of alert rules (see rules.py); the built-in rules if omitted")
+    parser.add_argument("--camera-id", default="CAM1")
+    parser.add_argument("--inference-mode", default="full", choices=("full", "fixed", "adaptive"))
+    parser.add_argument("--detect-stride", type=int, default=1)
+    parser.add_argument("--render-mode", default="server", choices=("server", "client"))
+    parser.add_argument("--crop-mode", default="full", choices=("full", "roi"))
+    parser.add_argument("--motion-gate", action="store_true", help="skip the detector while the ROIs are static")
+    parser.add_argument("--model-size", default="m")
+    parser.add_argument("--backend", default="pytorch")
+    parser.add_argument("--precision", default="fp32")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--tracker", default="bytetrack.yaml")
+    parser.add_argument("--storage", default="local", choices=("local", "memory"))
+    parser.add_argument("--out", default="replay_out", help="snapshot directory for --storage local")
+    parser.add_argument("--alerts-out", help="write every alert/event as a JSON line here")
+    parser.add_argument("--clips", action="store_true", help="also store an MP4 clip around every alert")
+    parser.add_argument("--record", help="write the tracked detections as JSONL (replayable with --detections)")
+    parser.add_argument("--report", help="write the timing report as JSON here")
+    parser.add_argument("--max-p95-ms", type=float)
+    parser.add_argument("--max-p99-ms", type=float)
+    parser.add_argument("--min-fps", type=float)
+    parser.add_argument("--verbose", action="store_true", help="log alerts, uploads and per-frame summaries")
+    args = parser.parse_args()
+    configure_logging("DEBUG" if args.verbose else "ERROR")
+
+    if sum(bool(s) for s in (args.frames, args.detections, args.video and not args.detections)) != 1:
+        parser.error("give exactly one of --video, --frames or --detections")
+
+    model = None
+    if args.detections:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        fps, frames = detections_source(args.detections, args.fps, args.video, (width, height))
+        names = yaml_load(check_yaml("coco.yaml"))["names"]
+        description = "recorded detections"
+    else:
+        from detector import load_detector
+        model, description = load_detector(args.model_size, args.backend, args.precision, args.imgsz)
+        names = model.names
+        fps, frames = video_source(args.video) if args.video else frames_dir_source(args.frames, args.fps)
+
+    camera = Camera(args.camera_id, args.video or args.frames or args.detections,
+                    phone_trigger_frames=PHONE_ALERT_FRAMES, phone_release_frames=PHONE_RELEASE_FRAMES,
+                    inference_mode=args.inference_mode, detect_stride=args.detect_stride,
+                    track_ttl_frames=yaml_load(check_yaml(args.tracker)).get("track_buffer", 30),
+                    render_mode=args.render_mode, crop_mode=args.crop_mode, motion_gate=args.motion_gate,
+                    crop_tile_size=args.imgsz)
+    camera.tracker = create_tracker(args.tracker, frame_rate=int(round(fps)))
+    if args.rois:
+        with open(args.rois) as f:
+            camera.update_rois(json.load(f))
+
+    uploader = SnapshotUploader(create_backend(args.storage, root=args.out), workers=2)
+    event_log = EventRing(capacity=1000)
+    clips = ClipRecorder(uploader) if args.clips else None
+    processor = FrameProcessor(names, uploader, event_log, EventRing(capacity=200), "replay", clips=clips,
+                               rules=RuleBook(args.alert_rules))
+    alerts_file = open(args.alerts_out, "w") if args.alerts_out else None
+    record_file = open(args.record, "w") if args.record else None
+
+    timings = {stage: [] for stage in STAGES}
+    latencies = []
+    processed = dropped = alerts = cursor = published = 0
+    # Alert timers run on the recording's clock, anchored at the replay's start
+    epoch = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    first_ts = None
+    try:
+        while not args.max_frames or processed + dropped < args.max_frames:
+            stages = {}
+            start = time.perf_counter()
+            item = next(frames, None)
+            if item is None:
+                break
+            timestamp, frame, record = item
+            stages["decode"] = time.perf_counter() - start
+            first_ts = timestamp if first_ts is None else first_ts
+
+            if args.realtime:
+                due = wall_start + (timestamp - first_ts)
+                lag = time.perf_counter() - due
+                if lag < 0:
+                    time.sleep(-lag)
+                elif lag > 1.0 / fps:
+                    # The live capture thread would have overwritten this frame already
+                    dropped += 1
+                    continue
+
+            if record is not None:
+                result = detections_result(frame, record, names)
+            else:
+                result = detect(model, camera, frame, timestamp, stages, args.imgsz)
+            if record_file is not None:
+                record_file.write(json.dumps(detections_record(result, timestamp)) + "\n")
+
+            processor.process_result(camera, result, now=epoch + timestamp - first_ts, stages=stages)
+
+            # One /stream viewer at the default quality
+            start = time.perf_counter()
+            seq, encoded = camera.broadcaster.latest()
+            if seq != published:
+                published = seq
+                encoded.jpeg()
+            stages["encode"] = time.perf_counter() - start
+
+            for stage, seconds in stages.items():
+                timings[stage].append(seconds * 1000)
+            latencies.append(sum(stages.values()) * 1000)
+            processed += 1
+
+            for event in event_log.since(cursor):
+                cursor = event.seq
+                alerts += 1
+                if alerts_file is not None:
+                    alerts_file.write(json.dumps({"frame": processed, "time": round(timestamp, 3),
+                                                  **event.to_dict()}) + "\n")
+    finally:
+        if clips is not None:
+            clips.close(timeout=30.0)
+        uploader.close(timeout=30.0)
+        for f in (alerts_file, record_file):
+            if f is not None:
+                f.close()
+    elapsed = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_start
+
+    busy = sum(latencies) / 1000
+    report = {
+        "source": args.video or args.frames or args.detections,
+        "pipeline": description,
+        "frames": processed,
+        "dropped": dropped,
+        "events": alerts,
+        "fps": round(processed / busy, 2) if busy else 0.0,
+        "wall_fps": round(processed / elapsed, 2) if elapsed else 0.0,
+        # Every thread of the process (model, encoders, uploads), as top would count it
+        "cpu_seconds": round(cpu_seconds, 2),
+        "inference": {**camera.policy.stats(), "motion": camera.motion.stats()} if model is not None else None,
+        "latency_ms": summarize(latencies),
+        "stages_ms": {stage: summarize(values) for stage, values in timings.items() if values},
+        "uploads": uploader.stats(),
+        "clips": clips.stats() if clips is not None else None,
+    }
+
+    print(f"{report['source']}: {processed} frames ({dropped} dropped), {description}")
+    print(f"{'stage':>15} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+    for stage, row in list(report["stages_ms"].items()) + [("total", report["latency_ms"])]:
+        print(f"{stage:>15} {row['mean']:>8.2f} {row['p50']:>8.2f} {row['p95']:>8.2f} "
+              f"{row['p99']:>8.2f} {row['max']:>8.2f}")
+    print(f"FPS: {report['fps']:.1f} pipeline, {report['wall_fps']:.1f} wall, {report['cpu_seconds']:.1f} CPU s; "
+          f"{alerts} events, {report['uploads']['uploaded']} snapshots stored")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.max_p95_ms is not None and report["latency_ms"]["p95"] > args.max_p95_ms:
+        failures.append(f"p95 latency {report['latency_ms']['p95']:.1f}ms > {args.max_p95_ms}ms")
+    if args.max_p99_ms is not None and report["latency_ms"]["p99"] > args.max_p99_ms:
+        failures.append(f"p99 latency {report['latency_ms']['p99']:.1f}ms > {args.max_p99_ms}ms")
+    if args.min_fps is not None and report["fps"] < args.min_fps:
+        failures.append(f"{report['fps']:.1f} FPS < {args.min_fps}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
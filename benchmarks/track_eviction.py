@@ -0,0 +1,107 @@
+"""
+Regression check: a vehicle ByteTrack keeps following must not depart while its score is low.
+
+Feeds FrameProcessor one parked car in an ROI with the same track ID for
+--seconds, its confidence alternating between 0.8 and --low-conf (below the
+alert threshold, above ByteTrack's) every --period frames, then drops the ID.
+The car must depart exactly once, after the ID is gone, and the idle and
+unattended alerts must fire as if the score had never dipped. Exits non-zero
+otherwise.
+
+Run from the repository root:
+    python -m benchmarks.track_eviction [--seconds 240] [--fps 15] [--period 60] [--low-conf 0.6]
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from cameras import Camera
+from eventlog import EventRing
+from logs import configure
+from pipeline import FrameProcessor
+
+NAMES = {0: "person", 2: "car", 67: "cell phone"}
+TRACK_ID = 7
+
+
+class NullUploader:
+    def submit(self, path, frame=None, data=None):
+        return True
+
+
+class Column:
+    """Array with the .cpu().numpy() accessors of an Ultralytics Boxes column."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class TrackedResult:
+    """Minimal tracked Results: one car, or nothing once the tracker has let it go."""
+
+    def __init__(self, frame, confidence=None):
+        self.orig_img = frame
+        self.speed = {"preprocess": 0.0, "inference": 0.0, "postprocess": 0.0}
+        present = confidence is not None
+        self.boxes = type("Boxes", (), {})()
+        self.boxes.id = Column(np.array([TRACK_ID], dtype=np.float32)) if present else None
+        self.boxes.cls = Column(np.array([2.0] * present, dtype=np.float32))
+        self.boxes.conf = Column(np.array([confidence] * present, dtype=np.float32))
+        self.boxes.xyxy = Column(np.array([[200, 150, 400, 300]] * present, dtype=np.float32).reshape(-1, 4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=240.0)
+    parser.add_argument("--fps", type=float, default=15.0)
+    parser.add_argument("--period", type=int, default=60, help="frames between confidence changes")
+    parser.add_argument("--low-conf", type=float, default=0.6)
+    args = parser.parse_args()
+    configure(level="ERROR")
+
+    camera = Camera("CAM1", "synthetic")
+    camera.set_rois({"Pump1": [[0, 0], [640, 480]]})
+    events = EventRing(capacity=10000)
+    processor = FrameProcessor(NAMES, NullUploader(), events, EventRing())
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    present_frames = int(args.seconds * args.fps)
+    gone_frames = camera.tracked_vehicles.ttl_frames + 5
+    for n in range(present_frames + gone_frames):
+        confidence = None
+        if n < present_frames:
+            confidence = 0.8 if (n // args.period) % 2 == 0 else args.low_conf
+        processor.process_result(camera, TrackedResult(frame.copy(), confidence), now=n / args.fps)
+
+    counts = {}
+    departures = []
+    for record in events.since(0):
+        counts[record.event_type] = counts.get(record.event_type, 0) + 1
+        if record.event_type == "vehicle_departed":
+            departures.append(record.timestamp)
+    print(f"{args.seconds:.0f} s at {args.fps:.0f} fps, confidence 0.8/{args.low_conf} every {args.period} frames")
+    for event_type, count in sorted(counts.items()):
+        print(f"  {event_type:<20} {count}")
+
+    failures = []
+    if len(departures) != 1 or departures[0] * args.fps < present_frames:
+        failures.append(f"departed {len(departures)}x, expected once after the ID was dropped")
+    if args.seconds >= 180 and not counts.get("idle_vehicle"):
+        failures.append("no idle alert")
+    if args.seconds >= 30 and not counts.get("unattended_vehicle"):
+        failures.append("no unattended alert")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK: one departure, after the tracker dropped the ID")
+
+
+if __name__ == "__main__":
+    main()
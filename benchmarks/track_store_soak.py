@@ -0,0 +1,105 @@
+"""
+Week-long soak of TrackStore: memory must stay flat while track IDs climb.
+
+Replays recorded detections (JSONL, one frame per line with "ids", "classes"
+and "boxes" keys) in a loop with ever-increasing track IDs, or synthesises a
+forecourt with vehicles arriving and leaving. Exits non-zero if traced memory
+after the warm-up grows by more than --max-growth-kb.
+
+Run from the repository root:
+    python -m benchmarks.track_store_soak [--detections recorded.jsonl] [--days 7] [--fps 2]
+"""
+import argparse
+import json
+import random
+import sys
+import tracemalloc
+
+import numpy as np
+
+from tracks import TrackStore
+
+VEHICLE_CLASS_IDS = {1, 2, 3, 5, 7}
+
+
+def recorded_frames(path):
+    with open(path) as f:
+        frames = [json.loads(line) for line in f if line.strip()]
+    max_id = max((max(fr["ids"]) for fr in frames if fr.get("ids")), default=0) + 1
+    loop = 0
+    while True:
+        for fr in frames:
+            ids = [i + loop * max_id for i in fr.get("ids", [])]
+            yield [(i, box) for i, cls, box in zip(ids, fr.get("classes", []), fr.get("boxes", []))
+                   if cls in VEHICLE_CLASS_IDS]
+        loop += 1
+
+
+def synthetic_frames(seed=0, lanes=6, mean_stay_frames=600):
+    rng = random.Random(seed)
+    next_id = 1
+    occupants = {}
+    while True:
+        for lane in range(lanes):
+            if lane not in occupants and rng.random() < 0.01:
+                occupants[lane] = [next_id, rng.expovariate(1 / mean_stay_frames)]
+                next_id += 1
+        detections = []
+        for lane, state in list(occupants.items()):
+            state[1] -= 1
+            if state[1] <= 0:
+                del occupants[lane]
+                continue
+            # Occasional missed detections, as ByteTrack would report
+            if rng.random() < 0.95:
+                x = 100 + lane * 200
+                detections.append((state[0], (x, 300, x + 150, 420)))
+        yield detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--detections", help="recorded detections JSONL (synthetic if omitted)")
+    parser.add_argument("--days", type=float, default=7.0)
+    parser.add_argument("--fps", type=float, default=2.0)
+    parser.add_argument("--ttl-frames", type=int, default=30)
+    parser.add_argument("--max-growth-kb", type=float, default=64.0)
+    args = parser.parse_args()
+
+    frames = recorded_frames(args.detections) if args.detections else synthetic_frames()
+    total = int(args.days * 86400 * args.fps)
+    checkpoints = 14
+    store = TrackStore(args.ttl_frames)
+
+    tracemalloc.start()
+    baseline = None
+    peak_growth = 0.0
+    highest_id = 0
+    for n in range(1, total + 1):
+        now = n / args.fps
+        store.next_frame()
+        store.evict_stale()
+        detections = next(frames)
+        if detections:
+            ids = np.array([track_id for track_id, _ in detections])
+            boxes = np.array([box for _, box in detections]).reshape(-1, 4)
+            store.observe(ids, now, (boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2, "Unknown")
+            highest_id = max(highest_id, int(ids.max()))
+        if n % (total // checkpoints) == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            if baseline is None:
+                baseline = current
+            growth = (current - baseline) / 1024
+            peak_growth = max(peak_growth, growth)
+            print(f"day {now / 86400:5.2f}: {len(store):4d} live tracks, {store.departed:7d} departed, "
+                  f"highest id {highest_id:7d}, memory {current / 1024:8.1f} KiB ({growth:+.1f} KiB)")
+    tracemalloc.stop()
+
+    if peak_growth > args.max_growth_kb:
+        print(f"FAIL: memory grew by {peak_growth:.1f} KiB after warm-up")
+        sys.exit(1)
+    print(f"OK: memory growth after warm-up stayed within {args.max_growth_kb:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
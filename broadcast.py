@@ -0,0 +1,97 @@
+import threading
+import time
+
+from metrics import STAGE_SECONDS, STREAM_FRAMES
+
+
+class FrameBroadcaster:
+    """
+    Latest-frame buffer shared by every /stream viewer.
+
+    A single producer publishes EncodedFrame objects; any number of subscribers
+    wait for the next frame and pull the JPEG variant they asked for. Only the newest frame is kept, so a slow viewer
+    simply skips frames instead of holding up the producer.
+    """
+
+    def __init__(self, name=""):
+        self.name = name
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._closed = False
+        self._subscribers = 0
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call callback() from the producer thread after every publish and on close."""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _notify_listeners(self):
+        for callback in list(self._listeners):
+            callback()
+
+    def publish(self, frame):
+        with self._cond:
+            self._frame = frame
+            self._seq += 1
+            self._cond.notify_all()
+        self._notify_listeners()
+
+    def latest(self):
+        """Return (sequence, frame) of the newest frame, or (0, None)."""
+        with self._cond:
+            return self._seq, self._frame
+
+    def wait(self, last_seq, timeout=None):
+        """Block until a frame newer than last_seq is published."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq or self._closed, timeout)
+            return self._seq, self._frame
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._notify_listeners()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def subscribers(self):
+        return self._subscribers
+
+    def attach(self):
+        with self._cond:
+            self._subscribers += 1
+
+    def detach(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def subscribe(self, width=None, quality=None, timeout=5.0):
+        """Yield MJPEG multipart chunks, always jumping to the newest frame."""
+        self.attach()
+        try:
+            last_seq = 0
+            while not self._closed:
+                seq, frame = self.wait(last_seq, timeout)
+                if seq == last_seq or frame is None:
+                    continue
+                last_seq = seq
+                frame_bytes = frame.jpeg(width, quality)
+                # The generator resumes once the server has written the chunk to the socket
+                start = time.perf_counter()
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                STAGE_SECONDS.observe(time.perf_counter() - start, self.name, "stream_write")
+                STREAM_FRAMES.inc(self.name)
+        finally:
+            self.detach()
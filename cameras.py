@@ -0,0 +1,173 @@
+import threading
+
+from broadcast import FrameBroadcaster
+from clips import ClipBuffer
+from capture import FrameGrabber
+from cropping import plan_crops
+from motion import MotionGate
+from propagation import DetectionPolicy, TrackPropagator
+from rois import ROIIndex
+from rules import RuleTimers
+from tracks import TrackStore
+
+
+class Camera:
+    """Per-camera state: source, labels, ROIs, tracker and tracked vehicles."""
+
+    def __init__(self, camera_id, source, station_number="Station1", customer_id="Customer1",
+                 phone_trigger_frames=5, phone_release_frames=15,
+                 inference_mode="full", detect_stride=1, target_latency_ms=66.0,
+                 track_ttl_frames=30, render_mode="server", crop_mode="full",
+                 clip_seconds=12.0, clip_max_bytes=16 * 1024 * 1024, motion_gate=False,
+                 crop_tile_size=640):
+        if render_mode not in ("server", "client"):
+            raise ValueError(f"Unknown render mode: {render_mode}")
+        if crop_mode not in ("full", "roi"):
+            raise ValueError(f"Unknown crop mode: {crop_mode}")
+        self.camera_id = camera_id
+        self.source = source
+        self.config = {
+            "camera_id": camera_id,
+            "station_number": station_number,
+            "customer_id": customer_id,
+        }
+        # Define multiple ROIs for gas station; compiled for vectorized lookups.
+        # Replaced whole on every edit (copy-on-write), so readers never need the lock.
+        self.roi_index = ROIIndex()
+        self._roi_lock = threading.Lock()
+        self.tracked_vehicles = TrackStore(track_ttl_frames)
+        # Alert rule timers and phone debouncers of the tracks in view
+        self.rule_timers = RuleTimers(phone_trigger_frames, phone_release_frames)
+        # Store the actual frame dimensions for coordinate scaling
+        self.frame_dimensions = {"width": 640, "height": 480}
+        self.render_mode = render_mode
+        # "roi": run the detector only on the ROI regions of the frame
+        self.crop_mode = crop_mode
+        # Crops larger than the detector input are tiled rather than downscaled into it
+        self.crop_tile_size = crop_tile_size
+        self._crop_plan = (None, None, None)
+        self.broadcaster = FrameBroadcaster(camera_id)
+        # Latest per-frame detection payload (JSON) for client-side rendering
+        self.detections = FrameBroadcaster(camera_id)
+        self.grabber = FrameGrabber(source, name=camera_id)
+        self.tracker = None
+        # Which frames get a detector pass; the rest are filled in by the motion model
+        self.policy = DetectionPolicy(inference_mode, detect_stride, target_latency_ms)
+        self.propagator = TrackPropagator()
+        # Skips the detector while nothing moves inside the ROIs
+        self.motion = MotionGate(motion_gate)
+        # Recent encoded frames for pre-event clips; 0 seconds or bytes disables them
+        self.clip_buffer = ClipBuffer(clip_seconds, clip_max_bytes) if clip_seconds and clip_max_bytes else None
+        self.last_seq = 0
+        self.prev_time = None
+
+    @property
+    def rois(self):
+        return self.roi_index.rois
+
+    def update_rois(self, new_rois):
+        """Merge new ROIs and swap in a freshly compiled index."""
+        with self._roi_lock:
+            rois = dict(self.roi_index.rois)
+            rois.update(new_rois)
+            self.roi_index = ROIIndex(rois, self.roi_index.version + 1)
+            return self.roi_index.rois
+
+    def set_rois(self, rois):
+        """Replace the whole ROI set."""
+        with self._roi_lock:
+            self.roi_index = ROIIndex(rois, self.roi_index.version + 1)
+            return self.roi_index.rois
+
+    def crop_regions(self, frame):
+        """Crop regions for the current ROIs and frame size (None = full frame), recomputed only on change."""
+        roi_index, shape, regions = self._crop_plan
+        if roi_index is not self.roi_index or shape != frame.shape[:2]:
+            roi_index, shape = self.roi_index, frame.shape[:2]
+            regions = plan_crops(roi_index.rects, shape[1], shape[0], tile_size=self.crop_tile_size)
+            self._crop_plan = (roi_index, shape, regions)
+        return regions
+
+    def spec(self):
+        """Constructor arguments that rebuild this camera elsewhere (e.g. in a worker process)."""
+        return {
+            "camera_id": self.camera_id,
+            "source": self.source,
+            "station_number": self.config.get("station_number", "Station1"),
+            "customer_id": self.config.get("customer_id", "Customer1"),
+            "phone_trigger_frames": self.rule_timers.phone_trigger_frames,
+            "phone_release_frames": self.rule_timers.phone_release_frames,
+            "inference_mode": self.policy.mode,
+            "detect_stride": self.policy.stride,
+            "target_latency_ms": self.policy.target_latency_ms,
+            "track_ttl_frames": self.tracked_vehicles.ttl_frames,
+            "render_mode": self.render_mode,
+            "crop_mode": self.crop_mode,
+            "clip_seconds": self.clip_buffer.max_seconds if self.clip_buffer else 0,
+            "clip_max_bytes": self.clip_buffer.max_bytes if self.clip_buffer else 0,
+            "motion_gate": self.motion.enabled,
+            "crop_tile_size": self.crop_tile_size,
+        }
+
+    def start(self):
+        self.grabber.start()
+
+    def stop(self):
+        self.grabber.stop()
+        self.broadcaster.close()
+        self.detections.close()
+
+    def to_dict(self):
+        return {
+            "camera_id": self.camera_id,
+            "source": self.source,
+            "config": self.config,
+            "rois": self.rois,
+            "roi_version": self.roi_index.version,
+            "frame_dimensions": self.frame_dimensions,
+            "render_mode": self.render_mode,
+            "crop_mode": self.crop_mode,
+            "viewers": self.broadcaster.subscribers,
+            "inference": {**self.policy.stats(), "motion": self.motion.stats()},
+            "capture": self.grabber.stats(),
+            "tracked_vehicles": len(self.tracked_vehicles),
+            "alert_rules": self.rule_timers.stats(),
+            "clip_buffer": self.clip_buffer.stats() if self.clip_buffer else None,
+        }
+
+
+class CameraRegistry:
+    """Thread-safe set of active cameras, keyed by camera id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cameras = {}
+
+    def add(self, camera, start=True):
+        with self._lock:
+            if camera.camera_id in self._cameras:
+                raise KeyError(f"Camera {camera.camera_id} already exists")
+            self._cameras[camera.camera_id] = camera
+        if start:
+            camera.start()
+        return camera
+
+    def remove(self, camera_id):
+        with self._lock:
+            camera = self._cameras.pop(camera_id, None)
+        if camera is not None:
+            camera.stop()
+        return camera
+
+    def get(self, camera_id):
+        with self._lock:
+            return self._cameras.get(camera_id)
+
+    def cameras(self):
+        """Snapshot list, safe to iterate while cameras are added or removed."""
+        with self._lock:
+            return list(self._cameras.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cameras)
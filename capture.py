@@ -0,0 +1,132 @@
+import time
+import threading
+
+import cv2
+
+from logs import get_logger
+from metrics import STAGE_SECONDS
+
+log = get_logger("capture")
+
+
+class FrameGrabber:
+    """
+    Capture thread that keeps only the newest decoded frame of one source.
+
+    Frames the consumer never picked up are overwritten (and counted as
+    dropped) instead of queueing, so a slow detector never makes the view
+    lag behind reality. Failed or ended streams are reopened with
+    exponential backoff.
+    """
+
+    def __init__(self, source, name=None, reconnect_delay=1.0, max_reconnect_delay=30.0,
+                 smoothing=0.1, sink=None):
+        self.source = source
+        self.name = name or str(source)
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.smoothing = smoothing
+        # Optional sink(frame, timestamp) also handed every decoded frame (e.g. a shared-memory ring)
+        self.sink = sink
+        self._lock = threading.Lock()
+        self._frame = None
+        self._seq = 0
+        self._read_seq = 0
+        self._timestamp = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self.connected = False
+        self.captured = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.capture_fps = 0.0
+        self.latency_ms = None
+        self.latency_max_ms = 0.0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"capture-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.source)
+        # Keep the decoder's own queue as short as the backend allows
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            cap = self._open()
+            if not cap.isOpened():
+                cap.release()
+                log.warning("source_unavailable", camera=self.name, retry_in=round(delay, 1))
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            self.connected = True
+            prev = None
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                ok, frame = cap.read()
+                if not ok:
+                    log.warning("stream_ended", camera=self.name, retry_in=round(delay, 1))
+                    break
+                STAGE_SECONDS.observe(time.perf_counter() - start, self.name, "capture")
+                now = time.time()
+                # A healthy read resets the backoff
+                delay = self.reconnect_delay
+                if prev is not None and now > prev:
+                    self.capture_fps += self.smoothing * (1.0 / (now - prev) - self.capture_fps)
+                prev = now
+                with self._lock:
+                    if self._frame is not None and self._read_seq != self._seq:
+                        self.dropped += 1
+                    self._frame = frame
+                    self._seq += 1
+                    self._timestamp = now
+                    self.captured += 1
+                if self.sink is not None:
+                    self.sink(frame, now)
+            cap.release()
+            self.connected = False
+            if self._stop.is_set():
+                break
+            self.reconnects += 1
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def read(self, last_seq=0):
+        """Return (seq, frame, timestamp) if a frame newer than last_seq exists, else (last_seq, None, None)."""
+        with self._lock:
+            if self._seq == last_seq or self._frame is None:
+                return last_seq, None, None
+            self._read_seq = self._seq
+            return self._seq, self._frame, self._timestamp
+
+    def record_latency(self, capture_time, now=None):
+        """Record capture-to-publish latency for a frame captured at capture_time."""
+        latency_ms = ((now or time.time()) - capture_time) * 1000
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += self.smoothing * (latency_ms - self.latency_ms)
+        self.latency_max_ms = max(self.latency_max_ms, latency_ms)
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "capture_fps": round(self.capture_fps, 2),
+            "captured_frames": self.captured,
+            "dropped_frames": self.dropped,
+            "reconnects": self.reconnects,
+            "latency_ms": self.latency_ms,
+            "latency_max_ms": self.latency_max_ms,
+        }
@@ -0,0 +1,240 @@
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from logs import get_logger
+
+log = get_logger("clips")
+
+
+class ClipBuffer:
+    """
+    Recent JPEG frames of one camera, bounded both by age and by total bytes.
+
+    Whichever limit is hit first evicts the oldest frames, so a camera never
+    holds more than max_bytes of video however high its resolution or rate.
+    """
+
+    def __init__(self, max_seconds=12.0, max_bytes=16 * 1024 * 1024):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self._frames = deque()  # (timestamp, jpeg bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def append(self, timestamp, data):
+        with self._lock:
+            self._frames.append((timestamp, data))
+            self._bytes += len(data)
+            while self._frames and (self._bytes > self.max_bytes
+                                    or timestamp - self._frames[0][0] > self.max_seconds):
+                _, old = self._frames.popleft()
+                self._bytes -= len(old)
+                self.evicted += 1
+
+    @property
+    def latest(self):
+        with self._lock:
+            return self._frames[-1][0] if self._frames else None
+
+    def window(self, start, end):
+        """Frames with start <= timestamp <= end, oldest first."""
+        with self._lock:
+            return [(ts, data) for ts, data in self._frames if start <= ts <= end]
+
+    def stats(self):
+        with self._lock:
+            span = self._frames[-1][0] - self._frames[0][0] if self._frames else 0.0
+            return {"frames": len(self._frames), "bytes": self._bytes, "seconds": round(span, 1),
+                    "max_bytes": self.max_bytes, "max_seconds": self.max_seconds, "evicted": self.evicted}
+
+
+def write_mp4(frames, fps):
+    """Encode a list of JPEG frames as MP4 (mp4v) and return the file's bytes."""
+    first = cv2.imdecode(np.frombuffer(frames[0], dtype=np.uint8), cv2.IMREAD_COLOR)
+    height, width = first.shape[:2]
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    try:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+        if not writer.isOpened():
+            raise ValueError("No MP4 encoder available")
+        try:
+            writer.write(first)
+            for data in frames[1:]:
+                image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if image is None:
+                    continue
+                if image.shape[:2] != (height, width):
+                    image = cv2.resize(image, (width, height))
+                writer.write(image)
+        finally:
+            writer.release()
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+class ClipRecorder:
+    """
+    Fills each camera's ClipBuffer and turns alerts into pre/post-event MP4 clips.
+
+    record() and trigger() only enqueue, in order, for a background thread that
+    JPEG-encodes published frames into the buffers (reusing the stream's bytes
+    when a viewer already encoded them). A trigger takes the buffered frames of
+    the pre-event seconds, collects the following post-event seconds as they
+    arrive, and then goes to an assembler thread that writes the MP4 and hands
+    it to the uploader under the given path. A clip counts as uploaded once
+    the backend has stored it; one the uploader spooled or lost counts as failed.
+    """
+
+    def __init__(self, uploader, pre_seconds=5.0, post_seconds=5.0, max_pending=32, quality=None):
+        self.uploader = uploader
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_pending = max_pending
+        self.quality = quality
+        self._queue = queue.Queue()
+        self._clips = queue.Queue()
+        self._open = []  # clips still collecting post-event frames
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # Frames waiting for the encoder; capped so a slow encoder drops frames instead of growing
+        self._queued_frames = 0
+        self._counters = {"triggered": 0, "uploaded": 0, "failed": 0, "frames_dropped": 0}
+        self._threads = [threading.Thread(target=self._encoder, name="clip-encoder", daemon=True),
+                         threading.Thread(target=self._assembler, name="clip-assembler", daemon=True)]
+        for t in self._threads:
+            t.start()
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def record(self, camera, frame, timestamp):
+        """Queue a published EncodedFrame for the camera's clip buffer; never blocks."""
+        if camera.clip_buffer is None:
+            return
+        with self._lock:
+            if self._queued_frames >= self.max_pending:
+                self._counters["frames_dropped"] += 1
+                return
+            self._queued_frames += 1
+        self._queue.put(("frame", camera.clip_buffer, frame, timestamp))
+
+    def trigger(self, camera, path, timestamp):
+        """Upload a clip around timestamp to path once its post-event frames are buffered."""
+        if camera.clip_buffer is None:
+            return
+        self._count("triggered")
+        self._queue.put(("trigger", camera.clip_buffer, (camera.camera_id, path), timestamp))
+
+    def _encoder(self):
+        while not self._stop.is_set():
+            try:
+                kind, buffer, item, timestamp = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                self._close_stalled()
+                continue
+            if kind == "trigger":
+                self._open_clip(buffer, item, timestamp)
+                continue
+            with self._lock:
+                self._queued_frames -= 1
+            try:
+                data = item.jpeg(quality=self.quality)
+            except Exception as e:
+                log.error("clip_frame_encode_failed", error=str(e))
+                continue
+            buffer.append(timestamp, data)
+            still_open = []
+            for clip in self._open:
+                if clip["buffer"] is not buffer:
+                    still_open.append(clip)
+                elif timestamp > clip["end"]:
+                    self._clips.put(clip)
+                else:
+                    clip["frames"].append((timestamp, data))
+                    still_open.append(clip)
+            self._open = still_open
+            self._close_stalled()
+
+    def _open_clip(self, buffer, item, timestamp):
+        camera_id, path = item
+        for clip in self._open:
+            # Alerts raised on the same frame share one clip
+            if clip["buffer"] is buffer and clip["timestamp"] == timestamp:
+                clip["paths"].append(path)
+                return
+        self._open.append({
+            "camera_id": camera_id, "buffer": buffer, "timestamp": timestamp, "paths": [path],
+            "end": timestamp + self.post_seconds,
+            "frames": buffer.window(timestamp - self.pre_seconds, timestamp + self.post_seconds),
+            # Wall-clock limit in case the camera stops delivering frames mid-clip
+            "deadline": time.time() + 2 * self.post_seconds,
+        })
+
+    def _close_stalled(self):
+        now = time.time()
+        stalled = [clip for clip in self._open if now > clip["deadline"]]
+        for clip in stalled:
+            self._open.remove(clip)
+            self._clips.put(clip)
+
+    def _assembler(self):
+        while not self._stop.is_set():
+            try:
+                clip = self._clips.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._assemble(clip["camera_id"], clip["frames"], clip["paths"])
+
+    def _assemble(self, camera_id, frames, paths):
+        if len(frames) < 2:
+            self._count("failed", len(paths))
+            log.warning("clip_too_short", camera=camera_id, paths=paths, frames=len(frames))
+            return
+        fps = (len(frames) - 1) / max(frames[-1][0] - frames[0][0], 1e-3)
+        try:
+            data = write_mp4([data for _, data in frames], fps)
+        except Exception as e:
+            self._count("failed", len(paths))
+            log.error("clip_encode_failed", camera=camera_id, paths=paths, error=str(e))
+            return
+        for path in paths:
+            # Counted once the upload has finished, so flush() also waits for the uploads
+            if not self.uploader.submit(path, data=data, on_done=self._uploaded):
+                self._count("failed")
+        log.info("clip_recorded", camera=camera_id, paths=paths, frames=len(frames),
+                 seconds=round(frames[-1][0] - frames[0][0], 1), bytes=len(data))
+
+    def _uploaded(self, stored):
+        self._count("uploaded" if stored else "failed")
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "queued_frames": self._queued_frames, "open_clips": len(self._open),
+                    "pre_seconds": self.pre_seconds, "post_seconds": self.post_seconds}
+
+    def flush(self, timeout=None):
+        """Wait until every triggered clip has been stored (or given up on)."""
+        deadline = None if timeout is None else time.time() + timeout
+        while self._counters["uploaded"] + self._counters["failed"] < self._counters["triggered"]:
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout=None):
+        self.flush(timeout)
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=1.0)
@@ -0,0 +1,459 @@
+"""
+Camera sharding across several nodes, each running the usual pipeline.
+
+A coordinator owns the camera list and assigns every camera to one worker
+node. Workers POST a JSON heartbeat to the coordinator's /cluster/heartbeat
+every interval seconds with their measured inference cost, per-camera stats,
+the event log/store calls made since the last acknowledged heartbeat and,
+now and then, their /metrics text; the reply carries the cameras the node
+should be running. A node that misses heartbeats for node_timeout seconds
+is dropped and its cameras go to the survivors.
+"""
+import json
+import statistics
+import threading
+import time
+import urllib.request
+import uuid
+from collections import deque
+
+from logs import get_logger
+
+log = get_logger("cluster")
+
+
+def _plain(value):
+    """json.dumps default for NumPy scalars and sets."""
+    if hasattr(value, "item"):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def _with_label(line, label, value):
+    name, brace, rest = line.partition("{")
+    if brace:
+        return f"{name}{{{label}={json.dumps(value)},{rest}"
+    name, _, sample = line.partition(" ")
+    return f"{name}{{{label}={json.dumps(value)}}} {sample}"
+
+
+def merge_metrics(texts, label="node"):
+    """
+    Merge Prometheus text expositions {source: text} into one, grouped by metric family.
+    Samples get a `label` label naming their source, except those of the None entry (the local ones).
+    """
+    families = {}  # name -> (HELP/TYPE lines, samples)
+    for source, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if line.startswith(("# HELP ", "# TYPE ")):
+                family = families.setdefault(line.split(" ", 3)[2], ([], []))
+                if line not in family[0]:
+                    family[0].append(line)
+            elif line and not line.startswith("#") and family is not None:
+                family[1].append(line if source is None else _with_label(line, label, source))
+    lines = []
+    for header, samples in families.values():
+        lines += header + samples
+    return "\n".join(lines) + "\n"
+
+
+class NodeState:
+    """What the coordinator knows about one worker node, as of its last heartbeat."""
+
+    __slots__ = ("node_id", "url", "instance", "frame_ms", "cameras", "metrics", "acked", "joined", "last_seen")
+
+    def __init__(self, node_id, url, instance, now):
+        self.node_id = node_id
+        self.url = url
+        self.instance = instance
+        self.frame_ms = None
+        self.cameras = {}  # camera_id -> stats reported by the node
+        self.metrics = ""
+        self.acked = 0
+        self.joined = self.last_seen = now
+
+
+class Coordinator:
+    """
+    Assigns cameras to worker nodes by measured capacity and merges what they report.
+
+    A camera costs fps x the node's inference ms per frame, i.e. the share of
+    one second the node spends detecting it; cameras are placed on the node
+    whose share stays lowest. Nodes that have not measured their inference
+    time yet count as the median node (default_frame_ms if none has), cameras
+    not reporting a frame rate as default_fps. Cameras only move when their
+    node is lost or on rebalance(), so ByteTrack and alert state are kept.
+    Forwarded event calls are replayed into event_log/event_store, so the
+    coordinator's /events, SSE and history show every node's alerts.
+    """
+
+    def __init__(self, cameras=(), event_log=None, event_store=None, node_timeout=5.0, default_frame_ms=50.0,
+                 default_fps=15.0, on_rois=None):
+        self.cameras = {cam["camera_id"]: dict(cam) for cam in cameras}
+        self.event_log = event_log
+        self.event_store = event_store
+        self.node_timeout = node_timeout
+        self.default_frame_ms = default_frame_ms
+        self.default_fps = default_fps
+        # on_rois(camera_id, rois): a node reported an ROI edit
+        self.on_rois = on_rois
+        self.nodes = {}  # node_id -> NodeState
+        self.assignment = {}  # camera_id -> node_id, or None while no node can take it
+        self._camera_fps = {}  # camera_id -> capture fps last reported, kept across moves
+        self._expired_acks = {}  # node_id -> (instance, acked) of a lost node, in case it comes back
+        self.reassigned = 0
+        self._lock = threading.Lock()
+
+    # --- capacity ------------------------------------------------------------
+
+    def _frame_ms(self, node):
+        if node.frame_ms:
+            return node.frame_ms
+        measured = [n.frame_ms for n in self.nodes.values() if n.frame_ms]
+        return statistics.median(measured) if measured else self.default_frame_ms
+
+    def _fps(self, camera_id):
+        return self._camera_fps.get(camera_id) or self.default_fps
+
+    def _share(self, node_id, camera_ids):
+        """Share of one second the node spends on inference for these cameras."""
+        return sum(self._fps(camera_id) for camera_id in camera_ids) * self._frame_ms(self.nodes[node_id]) / 1000
+
+    def _place(self, camera_ids):
+        """Assign cameras (busiest first) to the node that stays least loaded; None if no node is up."""
+        if not camera_ids:
+            return
+        loads = {node_id: [] for node_id in self.nodes}
+        for camera_id, node_id in self.assignment.items():
+            if node_id in loads and camera_id not in camera_ids:
+                loads[node_id].append(camera_id)
+        for camera_id in sorted(camera_ids, key=self._fps, reverse=True):
+            if not loads:
+                self.assignment[camera_id] = None
+                continue
+            node_id = min(loads, key=lambda n: (self._share(n, loads[n] + [camera_id]), len(loads[n]), n))
+            loads[node_id].append(camera_id)
+            if self.assignment.get(camera_id) not in (None, node_id):
+                self.reassigned += 1
+            self.assignment[camera_id] = node_id
+            log.info("cluster_camera_assigned", camera=camera_id, node=node_id,
+                     share=round(self._share(node_id, loads[node_id]), 3))
+        for node_id, camera_ids in loads.items():
+            if self._share(node_id, camera_ids) > 1:
+                log.warning("cluster_node_overcommitted", node=node_id, cameras=len(camera_ids),
+                            share=round(self._share(node_id, camera_ids), 3))
+
+    def _expire(self, now):
+        lost = [node_id for node_id, node in self.nodes.items() if now - node.last_seen > self.node_timeout]
+        for node_id in lost:
+            node = self.nodes.pop(node_id)
+            self._expired_acks[node_id] = (node.instance, node.acked)
+            orphans = [camera_id for camera_id, owner in self.assignment.items() if owner == node_id]
+            log.warning("cluster_node_lost", node=node_id, cameras=len(orphans))
+            self._place(orphans)
+
+    # --- protocol ------------------------------------------------------------
+
+    def heartbeat(self, report):
+        """
+        Handle one worker heartbeat: {"node", "url", "instance", "frame_ms", "cameras",
+        "messages": [[seq, message], ...], "metrics"}. Returns {"cameras": [spec, ...], "ack": seq}.
+        """
+        node_id = report["node"]
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            node = self.nodes.get(node_id)
+            if node is None or node.instance != report.get("instance"):
+                # New node, or a restart: its message sequence starts over
+                node = self.nodes[node_id] = NodeState(node_id, report["url"], report.get("instance"), now)
+                instance, acked = self._expired_acks.pop(node_id, (None, 0))
+                if instance is not None and instance == node.instance:
+                    # Back after a timeout: what we acknowledged before is not replayed again
+                    node.acked = acked
+                log.info("cluster_node_joined", node=node_id, url=report["url"])
+            node.url = report["url"]
+            node.last_seen = now
+            node.frame_ms = report.get("frame_ms") or node.frame_ms
+            node.cameras = report.get("cameras") or {}
+            for camera_id, stats in node.cameras.items():
+                fps = (stats.get("capture") or {}).get("capture_fps")
+                if fps:
+                    self._camera_fps[camera_id] = fps
+            if report.get("metrics") is not None:
+                node.metrics = report["metrics"]
+            messages = [message for seq, message in report.get("messages", ()) if seq > node.acked]
+            node.acked = max([node.acked] + [seq for seq, _ in report.get("messages", ())])
+            edited = self._sync_rois(node)
+            self._place([camera_id for camera_id in self.cameras if self.assignment.get(camera_id) is None])
+            cameras = [dict(spec) for camera_id, spec in self.cameras.items()
+                       if self.assignment.get(camera_id) == node_id]
+            ack = node.acked
+        self._replay(messages)
+        if self.on_rois is not None:
+            for camera_id, rois in edited:
+                self.on_rois(camera_id, rois)
+        return {"cameras": cameras, "ack": ack}
+
+    def _sync_rois(self, node):
+        """Adopt ROI edits made on the node that runs a camera, so they survive a move."""
+        edited = []
+        for camera_id, stats in node.cameras.items():
+            spec = self.cameras.get(camera_id)
+            rois = stats.get("rois")
+            if spec is not None and self.assignment.get(camera_id) == node.node_id and rois is not None \
+                    and rois != (spec.get("rois") or {}):
+                spec["rois"] = rois
+                edited.append((camera_id, rois))
+        return edited
+
+    def _replay(self, messages):
+        logs = {"events": self.event_log, "store": self.event_store}
+        for kind, target, args in messages:
+            target = logs.get(target)
+            if target is None:
+                continue
+            if kind == "log":
+                target.append(*args)
+            elif kind == "add":
+                target.add(*args)
+            elif kind == "retract":
+                target.retract(*args)
+
+    # --- cameras -------------------------------------------------------------
+
+    def add_camera(self, spec):
+        """Add a camera to the cluster and place it; raises KeyError if the id is taken."""
+        with self._lock:
+            if spec["camera_id"] in self.cameras:
+                raise KeyError(f"Camera {spec['camera_id']} already exists")
+            self.cameras[spec["camera_id"]] = dict(spec)
+            self._place([spec["camera_id"]])
+            return self.assignment[spec["camera_id"]]
+
+    def remove_camera(self, camera_id):
+        with self._lock:
+            self.assignment.pop(camera_id, None)
+            self._camera_fps.pop(camera_id, None)
+            return self.cameras.pop(camera_id, None)
+
+    def rebalance(self):
+        """Re-plan every camera from scratch (e.g. after adding nodes); returns how many moved."""
+        with self._lock:
+            self._expire(time.time())
+            before = dict(self.assignment)
+            self.assignment = {camera_id: None for camera_id in self.cameras}
+            self._place(list(self.cameras))
+            moved = sum(before.get(camera_id) not in (None, node_id)
+                        for camera_id, node_id in self.assignment.items())
+            self.reassigned += moved
+        log.info("cluster_rebalanced", moved=moved)
+        return moved
+
+    def owner_url(self, camera_id):
+        """Base URL of the node running camera_id, or None."""
+        with self._lock:
+            node = self.nodes.get(self.assignment.get(camera_id))
+            return node.url if node else None
+
+    # --- views ---------------------------------------------------------------
+
+    def camera_list(self):
+        """Every cluster camera with its node and the stats that node last reported."""
+        with self._lock:
+            cameras = []
+            for camera_id, spec in self.cameras.items():
+                node_id = self.assignment.get(camera_id)
+                node = self.nodes.get(node_id)
+                stats = node.cameras.get(camera_id, {}) if node else {}
+                cameras.append({**spec, **stats, "node": node_id})
+            return cameras
+
+    def metrics(self, own_text):
+        """The coordinator's /metrics followed by every live node's, labelled with the node."""
+        with self._lock:
+            texts = {node_id: node.metrics for node_id, node in self.nodes.items()}
+        return merge_metrics({None: own_text, **texts})
+
+    def node_shares(self):
+        with self._lock:
+            self._expire(time.time())
+            return {node_id: self._share(node_id, [c for c, n in self.assignment.items() if n == node_id])
+                    for node_id in self.nodes}
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            nodes = []
+            for node_id, node in self.nodes.items():
+                camera_ids = [c for c, n in self.assignment.items() if n == node_id]
+                nodes.append({
+                    "node": node_id,
+                    "url": node.url,
+                    "frame_ms": node.frame_ms,
+                    "share": round(self._share(node_id, camera_ids), 3),
+                    "cameras": camera_ids,
+                    "last_seen_s": round(now - node.last_seen, 2),
+                    "acked": node.acked,
+                })
+            return {
+                "nodes": nodes,
+                "unassigned": [c for c, n in self.assignment.items() if n is None],
+                "reassigned": self.reassigned,
+            }
+
+
+class _Forwarder:
+    """EventRing/EventStore look-alike that writes through to the local one and forwards the call."""
+
+    def __init__(self, target, node, kind):
+        self.target = target
+        self.node = node
+        self.kind = kind
+
+    def append(self, *args):
+        self.node.send(("log", self.kind, args))
+        return self.target.append(*args) if self.target is not None else None
+
+    def add(self, *args):
+        self.node.send(("add", self.kind, args))
+        if self.target is not None:
+            self.target.add(*args)
+
+    def retract(self, *args):
+        self.node.send(("retract", self.kind, args))
+        if self.target is not None:
+            self.target.retract(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+
+class ClusterNode:
+    """
+    Worker side of the protocol: heartbeats the coordinator and applies its camera assignment.
+
+    report() returns (inference ms per frame or None, {camera_id: stats}),
+    assign(specs) makes the node run exactly the given cameras and metrics()
+    the node's /metrics text (sent every metrics_interval seconds). Event
+    log/store calls made through forward() wrappers are queued with a sequence
+    number and resent until a heartbeat reply acknowledges them. While the
+    coordinator is unreachable the node keeps running its cameras, but only
+    for as long as the coordinator would still count it alive: after
+    node_timeout (less one interval) without a successful heartbeat it
+    releases them, since by then they are handed to other nodes.
+    """
+
+    def __init__(self, node_id, url, coordinator_url, report, assign, metrics=None, interval=1.0,
+                 metrics_interval=5.0, timeout=2.0, max_outbox=10000, batch=1000, node_timeout=5.0):
+        self.node_id = node_id
+        self.url = url
+        self.coordinator_url = coordinator_url.rstrip("/")
+        self.report = report
+        self.assign = assign
+        self.metrics = metrics
+        self.interval = interval
+        self.metrics_interval = metrics_interval
+        self.timeout = timeout
+        self.node_timeout = node_timeout
+        self.batch = batch
+        # A fresh instance id tells the coordinator to restart our message sequence
+        self.instance = uuid.uuid4().hex
+        self._outbox = deque(maxlen=max_outbox)
+        self._seq = 0
+        self._outbox_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_metrics = 0.0
+        self._last_ok = None  # When the last acknowledged heartbeat was sent
+        self._holding = False  # Running cameras the coordinator assigned
+        self.heartbeats = 0
+        self.failures = 0
+        self.dropped = 0
+        self.connected = False
+
+    def forward(self, target, kind):
+        """Wrap the local event log ("events") or store ("store") so its writes also reach the coordinator."""
+        return _Forwarder(target, self, kind)
+
+    def send(self, message):
+        with self._outbox_lock:
+            if len(self._outbox) == self._outbox.maxlen:
+                self.dropped += 1
+            self._seq += 1
+            self._outbox.append((self._seq, message))
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cluster-node", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+
+    def _run(self):
+        while True:
+            try:
+                self.heartbeat()
+            except Exception as e:
+                self.failures += 1
+                if self.connected:
+                    log.warning("cluster_coordinator_unreachable", node=self.node_id, error=str(e))
+                self.connected = False
+                self._release_if_expired()
+            if self._stop.wait(self.interval):
+                break
+
+    def _release_if_expired(self):
+        # A heartbeat early, so the coordinator never gives our cameras to another node while we run them
+        if self._holding and time.time() - self._last_ok >= self.node_timeout - self.interval:
+            log.warning("cluster_cameras_released", node=self.node_id,
+                        seconds_without_heartbeat=round(time.time() - self._last_ok, 1))
+            self.assign([])
+            self._holding = False
+
+    def heartbeat(self):
+        frame_ms, cameras = self.report()
+        with self._outbox_lock:
+            messages = list(self._outbox)[:self.batch]
+        body = {"node": self.node_id, "url": self.url, "instance": self.instance, "frame_ms": frame_ms,
+                "cameras": cameras, "messages": messages}
+        now = time.time()
+        if self.metrics is not None and now - self._last_metrics >= self.metrics_interval:
+            body["metrics"] = self.metrics()
+        request = urllib.request.Request(self.coordinator_url + "/cluster/heartbeat",
+                                         data=json.dumps(body, default=_plain).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            reply = json.load(response)
+        if "metrics" in body:
+            self._last_metrics = now
+        with self._outbox_lock:
+            while self._outbox and self._outbox[0][0] <= reply["ack"]:
+                self._outbox.popleft()
+        if not self.connected:
+            log.info("cluster_coordinator_connected", node=self.node_id, coordinator=self.coordinator_url)
+        self.connected = True
+        self.heartbeats += 1
+        self._last_ok = now
+        self.assign(reply["cameras"])
+        self._holding = bool(reply["cameras"])
+
+    def stats(self):
+        return {
+            "node": self.node_id,
+            "coordinator": self.coordinator_url,
+            "connected": self.connected,
+            "heartbeats": self.heartbeats,
+            "failures": self.failures,
+            "outbox": len(self._outbox),
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,104 @@
+import math
+
+import numpy as np
+
+
+def _merge_overlapping(rects):
+    """Merge rectangles that touch or overlap until none do."""
+    rects = [list(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]:
+                    rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rects
+
+
+def _tile(rect, tile_size, overlap):
+    """Split one region into a grid of tiles no larger than tile_size, overlapping by `overlap` px."""
+    x1, y1, x2, y2 = rect
+    w, h = x2 - x1, y2 - y1
+    nx = max(1, math.ceil((w - overlap) / (tile_size - overlap)))
+    ny = max(1, math.ceil((h - overlap) / (tile_size - overlap)))
+    tw, th = math.ceil((w + (nx - 1) * overlap) / nx), math.ceil((h + (ny - 1) * overlap) / ny)
+    tiles = []
+    for iy in range(ny):
+        for ix in range(nx):
+            tx1 = min(x1 + ix * (tw - overlap), x2 - tw) if nx > 1 else x1
+            ty1 = min(y1 + iy * (th - overlap), y2 - th) if ny > 1 else y1
+            tiles.append((tx1, ty1, min(tx1 + tw, x2), min(ty1 + th, y2)))
+    return tiles
+
+
+def plan_crops(roi_rects, frame_width, frame_height, margin=48, max_crops=2, tile_size=640,
+               overlap=64, min_savings=0.2):
+    """
+    Regions of the frame worth running the detector on, given the ROI rectangles.
+
+    ROIs (padded by `margin` so boxes straddling an edge are still found) are
+    grouped into clusters; if there are more than max_crops clusters they are
+    collapsed into their union. Regions larger than tile_size (the detector's
+    input size) are tiled.
+    Returns None when cropping would not save at least min_savings of the
+    frame area, meaning "run on the full frame".
+    """
+    if not len(roi_rects):
+        return None
+    padded = [(max(0, int(x1) - margin), max(0, int(y1) - margin),
+               min(frame_width, int(x2) + margin), min(frame_height, int(y2) + margin))
+              for x1, y1, x2, y2 in roi_rects]
+    clusters = _merge_overlapping(padded)
+    if len(clusters) > max_crops:
+        clusters = [[min(c[0] for c in clusters), min(c[1] for c in clusters),
+                     max(c[2] for c in clusters), max(c[3] for c in clusters)]]
+    area = sum((c[2] - c[0]) * (c[3] - c[1]) for c in clusters)
+    if area > (1 - min_savings) * frame_width * frame_height:
+        return None
+    regions = []
+    for cluster in clusters:
+        if max(cluster[2] - cluster[0], cluster[3] - cluster[1]) > tile_size:
+            regions.extend(_tile(cluster, tile_size, overlap))
+        else:
+            regions.append(tuple(cluster))
+    return regions
+
+
+def crop(frame, regions):
+    return [np.ascontiguousarray(frame[y1:y2, x1:x2]) for x1, y1, x2, y2 in regions]
+
+
+def merge_crop_results(frame, names, regions, results, iou_threshold=0.5):
+    """
+    Map per-crop detections back to full-frame coordinates and merge them
+    into one Results object for the full frame, de-duplicating boxes found
+    in overlapping crops with class-aware NMS.
+    """
+    import torch
+    from torchvision.ops import batched_nms
+    from ultralytics.engine.results import Results
+
+    parts = []
+    speed = {"preprocess": 0.0, "inference": 0.0, "postprocess": 0.0}
+    for (x1, y1, _, _), result in zip(regions, results):
+        data = result.boxes.data.clone()
+        if len(data):
+            data[:, [0, 2]] += x1
+            data[:, [1, 3]] += y1
+            parts.append(data)
+        for key in speed:
+            speed[key] += result.speed.get(key) or 0.0
+    data = torch.cat(parts) if parts else torch.zeros((0, 6))
+    if len(parts) > 1:
+        keep = batched_nms(data[:, :4], data[:, 4], data[:, 5].long(), iou_threshold)
+        data = data[keep]
+    merged = Results(frame, path="", names=names, boxes=data)
+    merged.speed = speed
+    return merged
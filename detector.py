@@ -0,0 +1,217 @@
+import os
+import glob
+import time
+import shutil
+import tempfile
+import contextlib
+
+import cv2
+import numpy as np
+
+from logs import get_logger
+
+log = get_logger("model")
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+PRECISIONS = ("fp32", "fp16", "int8")
+MODEL_SIZES = ("n", "s", "m", "l", "x")
+
+
+def weights_for(size):
+    if size not in MODEL_SIZES:
+        raise ValueError(f"Unknown model size: {size}")
+    return f"yolov8{size}.pt"
+
+
+def check_precision(backend, precision):
+    """
+    Reject a backend/precision combination that would run at some other precision.
+
+    The .pt weights always run in fp32; fp16 and int8 need an exported backend.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend: {backend}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown model precision: {precision}")
+    if backend == "pytorch" and precision != "fp32":
+        raise ValueError(f"The pytorch backend runs fp32 only; use onnx or openvino for {precision}")
+
+
+def artifact_path(size, backend, precision, imgsz, cache_dir="models"):
+    """Where the exported model for this combination is cached on disk (cache_dir=None: a temporary directory)."""
+    if cache_dir is None:
+        cache_dir = os.path.join(tempfile.gettempdir(), "sst-models")
+    stem = f"yolov8{size}_{imgsz}_{precision}"
+    if backend == "onnx":
+        return os.path.join(cache_dir, f"{stem}.onnx")
+    if backend == "openvino":
+        return os.path.join(cache_dir, f"{stem}_openvino_model")
+    return weights_for(size)
+
+
+def calibration_images(frames_dir, limit=300):
+    """Recorded forecourt frames used to calibrate INT8 quantization."""
+    paths = sorted(glob.glob(os.path.join(frames_dir, "*.jpg")) + glob.glob(os.path.join(frames_dir, "*.png")))
+    if not paths:
+        raise ValueError(f"No calibration frames found in {frames_dir}")
+    step = max(1, len(paths) // limit)
+    return paths[::step][:limit]
+
+
+def _calibration_yaml(frames_dir, cache_dir, names):
+    """Minimal dataset YAML pointing Ultralytics' INT8 calibration at our own frames."""
+    path = os.path.join(cache_dir, "calibration.yaml")
+    with open(path, "w") as f:
+        f.write(f"path: {os.path.abspath(frames_dir)}\ntrain: .\nval: .\nnames:\n")
+        for class_id, name in names.items():
+            f.write(f"  {class_id}: {name}\n")
+    return path
+
+
+def _letterbox(image, imgsz):
+    h, w = image.shape[:2]
+    scale = imgsz / max(h, w)
+    resized = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - resized.shape[0]) // 2, (imgsz - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    # BGR HWC uint8 -> RGB NCHW float32 in [0, 1], as the exported graph expects
+    return canvas[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+
+
+def _quantize_onnx(fp32_path, int8_path, frames_dir, imgsz):
+    """Static INT8 post-training quantization of an ONNX model with ONNX Runtime."""
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_static
+
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(calibration_images(frames_dir))
+
+        def get_next(self):
+            path = next(self._paths, None)
+            if path is None:
+                return None
+            return {input_name: _letterbox(cv2.imread(path), imgsz)}
+
+    # Quantize next to the target and rename, so an interrupted run never leaves a cached half model
+    partial = f"{int8_path}.{os.getpid()}.partial.onnx"
+    quantize_static(fp32_path, partial, FrameReader(),
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    os.replace(partial, int8_path)
+    return int8_path
+
+
+@contextlib.contextmanager
+def _export_lock(cache_dir, size):
+    """
+    Hold an exclusive lock on exporting yolov8{size} while in the block.
+
+    Inference worker processes start together and Ultralytics exports next to
+    the shared .pt weights, so without it they would write the same file at once.
+    """
+    try:
+        import fcntl
+    except ImportError:  # Windows: no advisory locks; one worker at a time is up to the operator
+        yield
+        return
+    with open(os.path.join(cache_dir, f"yolov8{size}.export.lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def export_model(size="m", backend="onnx", precision="fp32", imgsz=640, cache_dir="models",
+                 calibration_dir=None):
+    """
+    Export (once) and cache an ONNX/OpenVINO variant; returns the artifact path.
+
+    With cache_dir=None the artifact goes to a temporary directory and is
+    exported again whenever that is cleared, e.g. on every container restart.
+    """
+    from ultralytics import YOLO
+
+    check_precision(backend, precision)
+    options = {"format": backend, "imgsz": imgsz, "dynamic": True, "half": precision == "fp16"}
+    if backend == "onnx" and precision == "fp16":
+        # Ultralytics exports on the CPU unless told otherwise and quietly drops half there,
+        # which would cache an fp32 graph under the fp16 name
+        import torch
+        if not torch.cuda.is_available():
+            raise ValueError("ONNX fp16 export needs a CUDA GPU; use openvino fp16 on CPU")
+        options["device"] = 0
+    target = artifact_path(size, backend, precision, imgsz, cache_dir)
+    if backend == "pytorch" or os.path.exists(target):
+        return target
+    if precision == "int8" and not calibration_dir:
+        raise ValueError("INT8 export needs calibration_dir with recorded frames")
+    cache_dir = os.path.dirname(target)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    if backend == "onnx" and precision == "int8":
+        fp32 = export_model(size, "onnx", "fp32", imgsz, cache_dir)
+        with _export_lock(cache_dir, size):
+            if os.path.exists(target):
+                return target
+            return _quantize_onnx(fp32, target, calibration_dir, imgsz)
+
+    with _export_lock(cache_dir, size):
+        # Another process may have exported it while we waited for the lock
+        if os.path.exists(target):
+            return target
+        model = YOLO(weights_for(size))
+        if precision == "int8":
+            options.update(int8=True, data=_calibration_yaml(calibration_dir, cache_dir, model.names))
+        exported = model.export(**options)
+        # Ultralytics writes next to the weights; move the artifact into the cache under a
+        # temporary name, then rename it, so the cache never holds a half-moved artifact
+        partial = f"{target}.{os.getpid()}.partial"
+        shutil.move(str(exported), partial)
+        os.replace(partial, target)
+    return target
+
+
+def load_detector(size="m", backend="pytorch", precision="fp32", imgsz=640, cache_dir="models",
+                  calibration_dir=None):
+    """
+    Load the detector for the configured backend, exporting it first if needed.
+
+    Any failure (missing runtime or GPU, failed export or calibration) falls
+    back to the PyTorch .pt weights of the same size. An unknown or unsupported
+    backend/precision combination raises ValueError. Returns (model, description).
+    """
+    from ultralytics import YOLO
+
+    check_precision(backend, precision)
+    if backend != "pytorch":
+        try:
+            path = export_model(size, backend, precision, imgsz, cache_dir, calibration_dir)
+            model = YOLO(path, task="detect")
+            return model, f"{backend} {precision} yolov8{size} @ {imgsz}"
+        except Exception as e:
+            log.warning("backend_unavailable", backend=backend, precision=precision, error=str(e),
+                        fallback="pytorch")
+    return YOLO(weights_for(size)), f"pytorch fp32 yolov8{size} @ {imgsz}"
+
+
+def warm_up(model, imgsz=640, batch=1, runs=2, **predict_kwargs):
+    """
+    Run the model on blank imgsz x imgsz frames until it has reached its steady speed.
+
+    The first predict calls pay for lazy setup (CUDA context, cuDNN autotuning,
+    ONNX Runtime/OpenVINO graph compilation for the input shape), so they run
+    here at startup rather than on the first camera frames. Each run is one
+    batch of batch frames, the largest the scheduler sends. Returns the model's
+    milliseconds per frame in the last run.
+    """
+    frames = [np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)] * batch
+    ms = None
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        model.predict(frames, verbose=False, imgsz=imgsz, **predict_kwargs)
+        ms = (time.perf_counter() - start) * 1000 / batch
+    return ms
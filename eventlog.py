@@ -0,0 +1,116 @@
+import time
+import threading
+
+
+class EventRecord:
+    """One structured log entry; seq increases monotonically per log."""
+
+    __slots__ = ("seq", "timestamp", "event_type", "camera_id", "roi_label", "track_id",
+                 "message", "filename", "retracted")
+
+    def __init__(self, seq, timestamp, event_type, camera_id, roi_label, track_id, message, filename):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.event_type = event_type
+        self.camera_id = camera_id
+        self.roi_label = roi_label
+        self.track_id = track_id
+        self.message = message
+        self.filename = filename
+        self.retracted = False
+
+    def text(self):
+        """Human-readable line, as shown in the dashboard lists."""
+        text = self.message
+        if self.roi_label is not None:
+            text = f"{self.roi_label}: {text}"
+        if self.camera_id is not None:
+            text = f"[{self.camera_id}] {text}"
+        if self.filename:
+            text += f" (Frame: {self.filename})"
+        return text
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class EventRing:
+    """
+    Fixed-capacity ring buffer of EventRecords with blocking, cursor-based reads.
+
+    Readers remember the last seq they saw and call wait(cursor) to get every
+    newer record, so a reconnecting SSE client passing Last-Event-ID neither
+    misses (while still retained) nor repeats events. A cursor past the newest
+    seq was issued before a restart and reads from the start.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._buffer = [None] * capacity
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call callback() from the writer's thread after every append."""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def append(self, message, event_type="info", camera_id=None, roi_label=None, track_id=None, filename=None,
+               timestamp=None):
+        with self._cond:
+            self._seq += 1
+            record = EventRecord(self._seq, time.time() if timestamp is None else timestamp, event_type,
+                                 camera_id, roi_label, track_id, message, filename)
+            self._buffer[self._seq % self.capacity] = record
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback()
+        return record
+
+    def _since(self, cursor):
+        if cursor > self._seq:
+            # Last-Event-ID from before a restart (seq starts over at 1): replay what is retained
+            cursor = 0
+        start = max(cursor + 1, self._seq - self.capacity + 1, 1)
+        return [self._buffer[seq % self.capacity] for seq in range(start, self._seq + 1)]
+
+    def since(self, cursor):
+        """Records newer than cursor that are still retained, oldest first."""
+        with self._cond:
+            return self._since(cursor)
+
+    def wait(self, cursor, timeout=None):
+        """Block until records newer than cursor exist (or timeout) and return them."""
+        with self._cond:
+            if cursor > self._seq:
+                cursor = 0
+            self._cond.wait_for(lambda: self._seq > cursor, timeout)
+            return self._since(cursor)
+
+    def latest(self, n):
+        """The newest n records that have not been retracted, oldest first."""
+        with self._cond:
+            records = [r for r in self._since(0) if not r.retracted]
+        return records[-n:]
+
+    def retract(self, camera_id, track_id, event_type, since=None):
+        """Hide one track's records from since on from snapshots (they stay in the SSE history)."""
+        with self._cond:
+            for record in self._since(0):
+                if (record.camera_id == camera_id and record.track_id == track_id
+                        and record.event_type == event_type and (since is None or record.timestamp >= since)):
+                    record.retracted = True
+
+    def __len__(self):
+        return min(self._seq, self.capacity)
@@ -0,0 +1,214 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger("eventstore")
+
+COLUMNS = ("id", "ts", "event_type", "camera_id", "station_number", "customer_id", "roi_label",
+           "track_id", "dwell_seconds", "snapshot_path", "message", "retracted")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    event_type TEXT NOT NULL,
+    camera_id TEXT,
+    station_number TEXT,
+    customer_id TEXT,
+    roi_label TEXT,
+    track_id INTEGER,
+    dwell_seconds REAL,
+    snapshot_path TEXT,
+    message TEXT,
+    retracted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_camera_ts ON events (camera_id, ts);
+CREATE INDEX IF NOT EXISTS events_station_ts ON events (station_number, ts);
+CREATE INDEX IF NOT EXISTS events_roi_ts ON events (roi_label, ts);
+CREATE INDEX IF NOT EXISTS events_type_ts ON events (event_type, ts);
+CREATE INDEX IF NOT EXISTS events_track_ts ON events (track_id, ts);
+"""
+
+# Query filter -> column (all exact matches; event_type also accepts a list)
+FILTERS = {
+    "camera_id": "camera_id",
+    "station_number": "station_number",
+    "customer_id": "customer_id",
+    "roi_label": "roi_label",
+    "event_type": "event_type",
+    "track_id": "track_id",
+}
+
+
+class EventStore:
+    """
+    Events as structured rows in SQLite, indexed by time and by every filter column.
+
+    add() and retract() only enqueue; a writer thread commits them in batches
+    (every flush_interval seconds or batch_size rows), so the frame loop never
+    waits on disk. Queries use keyset pagination over (ts, id), which stays
+    fast however deep the page.
+    """
+
+    def __init__(self, path="events.db", batch_size=500, flush_interval=0.5, max_queue=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self.written = 0
+        self.dropped = 0
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        self._thread = threading.Thread(target=self._writer, name="event-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL lets the dashboard query while the writer commits
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # --- writes ------------------------------------------------------------
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            log.warning("event_store_queue_full")
+
+    def add(self, event_type, message, camera_config=None, roi_label=None, track_id=None,
+            dwell_seconds=None, snapshot_path=None, timestamp=None):
+        config = camera_config or {}
+        self._put(("add", (time.time() if timestamp is None else timestamp, event_type,
+                           config.get("camera_id"), config.get("station_number"), config.get("customer_id"),
+                           roi_label, None if track_id is None else int(track_id),
+                           None if dwell_seconds is None else round(float(dwell_seconds), 1),
+                           snapshot_path, message)))
+
+    def retract(self, camera_id, track_id, event_type, since=None):
+        """
+        Mark one track's events of a type from since on as retracted (kept, but hidden by default).
+        Tracker ids restart with the process, so since should bound the retraction to the current episode.
+        """
+        self._put(("retract", (camera_id, int(track_id), event_type, float("-inf") if since is None else since)))
+
+    def _writer(self):
+        conn = self._connect()
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size and time.time() < deadline:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            try:
+                self._write(conn, batch)
+            except sqlite3.Error as e:
+                log.error("event_store_write_failed", error=str(e), rows=len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def _write(self, conn, batch):
+        with conn:
+            rows = []
+            for kind, values in batch:
+                if kind == "add":
+                    rows.append(values)
+                    continue
+                # Keep order: insert what came before this retraction first
+                if rows:
+                    self._insert(conn, rows)
+                    rows = []
+                conn.execute("UPDATE events SET retracted = 1 WHERE camera_id = ? AND track_id = ? "
+                             "AND event_type = ? AND ts >= ? AND retracted = 0", values)
+            if rows:
+                self._insert(conn, rows)
+
+    def _insert(self, conn, rows):
+        conn.executemany("INSERT INTO events (ts, event_type, camera_id, station_number, customer_id, roi_label, "
+                         "track_id, dwell_seconds, snapshot_path, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         rows)
+        self.written += len(rows)
+
+    # --- reads -------------------------------------------------------------
+
+    def query(self, start=None, end=None, limit=100, cursor=None, include_retracted=False, **filters):
+        """
+        Newest-first page of events matching every given filter and [start, end) time range.
+        Returns (rows as dicts, next_cursor); pass next_cursor back for the following page.
+        """
+        where, params = [], []
+        for name, value in filters.items():
+            if value is None or value == [] or name not in FILTERS:
+                continue
+            if isinstance(value, (list, tuple)):
+                where.append(f"{FILTERS[name]} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                where.append(f"{FILTERS[name]} = ?")
+                params.append(value)
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("ts < ?")
+            params.append(end)
+        if not include_retracted:
+            where.append("retracted = 0")
+        if cursor:
+            cursor_ts, cursor_id = cursor.split(":")
+            where.append("(ts, id) < (?, ?)")
+            params.extend([float(cursor_ts), int(cursor_id)])
+        sql = f"SELECT {', '.join(COLUMNS)} FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = [dict(zip(COLUMNS, row)) for row in self._reader().execute(sql, params)]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['ts']!r}:{rows[-1]['id']}"
+        for row in rows:
+            row["retracted"] = bool(row["retracted"])
+        return rows, next_cursor
+
+    def stats(self):
+        return {"path": self.path, "queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far is committed."""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5.0)
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import JPEG_ENCODE_SECONDS
+
+try:
+    from turbojpeg import TurboJPEG
+    _turbo = TurboJPEG()
+except Exception:  # PyTurboJPEG or libjpeg-turbo not installed
+    _turbo = None
+
+DEFAULT_QUALITY = 80
+MIN_WIDTH = 160
+
+
+def encode_jpeg(image, quality=DEFAULT_QUALITY):
+    """JPEG-encode a BGR image, using libjpeg-turbo directly when available."""
+    if _turbo is not None:
+        return _turbo.encode(image, quality=quality)
+    success, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not success:
+        raise ValueError("Failed to encode image.")
+    return buffer.tobytes()
+
+
+def jpeg_backend():
+    return "turbojpeg" if _turbo is not None else "opencv"
+
+
+class EncodedFrame:
+    """
+    An annotated frame plus its JPEG variants, keyed by (width, quality).
+
+    Each variant is encoded at most once, on first request, by whichever
+    thread asks for it (an MJPEG viewer or a snapshot upload worker); every
+    other consumer of the same frame gets the cached bytes. The image must
+    not be modified after the frame is published.
+    """
+
+    def __init__(self, seq, image, default_quality=DEFAULT_QUALITY):
+        self.seq = seq
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        self.default_quality = default_quality
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._variants = {}
+        self._resized = {}
+
+    def _normalize(self, width, quality):
+        if not width or width >= self.width:
+            width = self.width
+        else:
+            width = max(int(width), MIN_WIDTH)
+        quality = int(quality) if quality else self.default_quality
+        return width, min(max(quality, 10), 95)
+
+    @classmethod
+    def from_jpeg(cls, seq, data, width, height, quality=DEFAULT_QUALITY):
+        """Wrap bytes encoded elsewhere; the image is only decoded if another variant is asked for."""
+        frame = cls.__new__(cls)
+        frame.seq = seq
+        frame.image = None
+        frame._jpeg = data
+        frame.height, frame.width = height, width
+        frame.default_quality = quality
+        frame._lock = threading.Lock()
+        frame._key_locks = {}
+        frame._variants = {frame._normalize(None, quality): data}
+        frame._resized = {}
+        return frame
+
+    def _scaled(self, width):
+        if self.image is None:
+            self.image = cv2.imdecode(np.frombuffer(self._jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if width == self.width:
+            return self.image
+        image = self._resized.get(width)
+        if image is None:
+            height = max(1, round(self.height * width / self.width))
+            image = cv2.resize(self.image, (width, height), interpolation=cv2.INTER_AREA)
+            self._resized[width] = image
+        return image
+
+    def cached(self, width=None, quality=None):
+        """The variant's bytes if already encoded, else None (never encodes)."""
+        return self._variants.get(self._normalize(width, quality))
+
+    def jpeg(self, width=None, quality=None):
+        key = self._normalize(width, quality)
+        data = self._variants.get(key)
+        if data is not None:
+            return data
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Per-variant lock: concurrent requests for the same variant wait for one encode
+        with key_lock:
+            data = self._variants.get(key)
+            if data is None:
+                start = time.perf_counter()
+                data = encode_jpeg(self._scaled(key[0]), key[1])
+                JPEG_ENCODE_SECONDS.observe(time.perf_counter() - start)
+                self._variants[key] = data
+        return data
+
+    def variants(self):
+        return list(self._variants)
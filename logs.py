@@ -0,0 +1,100 @@
+import json
+import logging
+import sys
+import threading
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `burst` records per (logger, event) every `interval`
+    seconds. The next record let through carries a count of the ones it
+    suppressed, so a flood shows up as one line with suppressed=N.
+    """
+
+    def __init__(self, burst=10, interval=10.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._lock = threading.Lock()
+        # (logger, event) -> [window start, records let through, suppressed]
+        self._windows = {}
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                window = self._windows[key] = [now, 0, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+            if window[1] >= self.burst:
+                window[2] += 1
+                return False
+            window[1] += 1
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, event and the call's fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class StructuredLogger:
+    """
+    Thin wrapper over a stdlib logger taking an event name plus key=value fields:
+        log.info("uploaded", path=path)
+    Disabled levels return before any formatting happens.
+    """
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(f"sst.{name}")
+
+    def _log(self, level, event, fields):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, event, extra={"fields": fields})
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+
+def get_logger(name):
+    return StructuredLogger(name)
+
+
+def configure(level="INFO", burst=10, interval=10.0, stream=None):
+    """Send sst.* loggers to stream (stderr) as rate-limited JSON lines; safe to call again."""
+    root = logging.getLogger("sst")
+    root.setLevel(level)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(RateLimitFilter(burst, interval))
+    root.addHandler(handler)
+    return root
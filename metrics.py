@@ -0,0 +1,182 @@
+import bisect
+import threading
+import time
+
+# Seconds; spans a cached JPEG hit (~0.1ms) up to a stalled model pass
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label tuple; inc() takes the label values positionally."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, values, (), count) for values, count in items]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label tuple, as Prometheus expects.
+
+    observe() is a bisect and three additions under a lock, cheap enough to
+    call several times per frame.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values = {}
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def samples(self):
+        with self._lock:
+            items = [(values, list(state[0]), state[1], state[2]) for values, state in self._values.items()]
+        samples = []
+        for values, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                samples.append((self.name + "_bucket", values, (("le", _format_value(bound)),), cumulative))
+            samples.append((self.name + "_sum", values, (), total))
+            samples.append((self.name + "_count", values, (), count))
+        return samples
+
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+class Collector:
+    """Metric read at scrape time from existing state: fn() returns {label values tuple: value}."""
+
+    def __init__(self, name, help_text, kind, labels, fn):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.fn = fn
+
+    def samples(self):
+        return [(self.name, tuple(values), (), value) for values, value in self.fn().items()]
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise KeyError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def collector(self, name, help_text, fn, labels=(), kind="gauge"):
+        return self._register(Collector(name, help_text, kind, labels, fn))
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, values, extra, value in samples:
+                lines.append(f"{name}{_format_labels(metric.labels, values, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Time per pipeline stage and camera: capture, inference (a batch split evenly across its cameras),
+# tracking, propagation, roi_assignment, alerts, draw, upload, stream_write
+STAGE_SECONDS = REGISTRY.histogram("sst_stage_seconds", "Time spent per frame in each pipeline stage",
+                                   ("camera", "stage"))
+# Time per frame spent evaluating each alert rule (scheduling, firing, debouncing) per camera
+RULE_SECONDS = REGISTRY.histogram("sst_rule_seconds", "Time spent per frame evaluating each alert rule",
+                                  ("camera", "rule"),
+                                  buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                                           0.005, 0.01))
+JPEG_ENCODE_SECONDS = REGISTRY.histogram("sst_jpeg_encode_seconds", "Time to JPEG-encode one frame variant")
+FRAMES = REGISTRY.counter("sst_frames_total", "Frames through the alert pipeline", ("camera",))
+DETECTIONS = REGISTRY.counter("sst_detections_total", "Tracked detections seen", ("camera",))
+EVENTS = REGISTRY.counter("sst_events_total", "Alerts and track events logged", ("camera", "type"))
+STREAM_FRAMES = REGISTRY.counter("sst_stream_frames_total", "MJPEG frames written to viewers", ("camera",))
@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap per-camera change detector that decides whether a frame needs the detector.
+
+    Each frame is downscaled to `width` pixels of blurred grayscale and compared
+    with a slowly adapting background, counting only pixels inside the camera's
+    ROIs (the whole frame if it has none). While the changed share stays below
+    `motion_fraction` for `cooldown` seconds the scene counts as static, and the
+    detector only runs every `keepalive` seconds; any motion restores full-rate
+    detection immediately. A disabled gate always answers "detect".
+    """
+
+    def __init__(self, enabled=False, width=160, pixel_threshold=20, motion_fraction=0.002,
+                 cooldown=3.0, keepalive=10.0, learning_rate=0.02):
+        self.enabled = enabled
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.motion_fraction = motion_fraction
+        self.cooldown = cooldown
+        self.keepalive = keepalive
+        self.learning_rate = learning_rate
+        self._background = None
+        self._mask = (None, None, None)  # (roi_index, shape, bool mask or None)
+        self.score = 0.0
+        self.last_motion = None
+        self.last_detect = None
+        self.motion_frames = 0
+        self.static_frames = 0
+
+    def _small(self, frame):
+        height = max(1, round(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_LINEAR)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def _roi_mask(self, roi_index, frame_shape, small_shape):
+        cached_index, cached_shape, mask = self._mask
+        if cached_index is roi_index and cached_shape == small_shape:
+            return mask
+        mask = None
+        if roi_index is not None and len(roi_index):
+            # Centres of the small frame's pixels, mapped back to full-frame coordinates
+            scale = frame_shape[1] / small_shape[1]
+            ys, xs = np.mgrid[0:small_shape[0], 0:small_shape[1]]
+            points = np.stack([(xs.ravel() + 0.5) * scale, (ys.ravel() + 0.5) * scale], axis=1)
+            mask = (roi_index.locate(points) >= 0).reshape(small_shape)
+            if not mask.any():
+                mask = None
+        self._mask = (roi_index, small_shape, mask)
+        return mask
+
+    def check(self, frame, timestamp, roi_index=None):
+        """True if this frame should go through the detector."""
+        if not self.enabled:
+            return True
+        small = self._small(frame)
+        if self._background is None or self._background.shape != small.shape:
+            self._background = small.astype(np.float32)
+            self.last_motion = self.last_detect = timestamp
+            self.motion_frames += 1
+            return True
+        changed = np.abs(small.astype(np.float32) - self._background) > self.pixel_threshold
+        mask = self._roi_mask(roi_index, frame.shape[:2], small.shape)
+        self.score = float(changed[mask].mean() if mask is not None else changed.mean())
+        cv2.accumulateWeighted(small, self._background, self.learning_rate)
+        if self.score >= self.motion_fraction:
+            self.last_motion = timestamp
+        if (timestamp - self.last_motion < self.cooldown
+                or timestamp - self.last_detect >= self.keepalive):
+            self.last_detect = timestamp
+            self.motion_frames += 1
+            return True
+        self.static_frames += 1
+        return False
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "motion_score": round(self.score, 4),
+            "motion_frames": self.motion_frames,
+            "static_frames": self.static_frames,
+        }
@@ -0,0 +1,98 @@
+from itertools import repeat
+
+import cv2
+import numpy as np
+
+
+def _hex(color):
+    """OpenCV BGR tuple -> CSS #rrggbb."""
+    b, g, r = (int(c) for c in color)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+class Overlay:
+    """
+    Drawing operations recorded for one frame.
+
+    The frame loop records what it wants drawn; the ops are then either
+    rendered server-side with OpenCV (draw) or shipped to the browser as a
+    compact JSON list (to_payload) and rendered on the ROI canvas, so in
+    client-render mode OpenCV only draws frames that become snapshots.
+    """
+
+    __slots__ = ("ops",)
+
+    def __init__(self):
+        self.ops = []
+
+    def rectangle(self, pt1, pt2, color, thickness=2):
+        self.ops.append(("r", int(pt1[0]), int(pt1[1]), int(pt2[0]), int(pt2[1]), color, thickness))
+
+    def polygon(self, points, color, thickness=2):
+        self.ops.append(("p", [(int(x), int(y)) for x, y in points], color, thickness))
+
+    def text(self, text, org, scale, color, thickness=2):
+        self.ops.append(("t", text, int(org[0]), int(org[1]), scale, color, thickness))
+
+    def boxes(self, boxes, colors, captions, scale=0.6, thickness=2):
+        """
+        A batch of rectangles, each with a caption under it, recorded as one op.
+
+        boxes is an (N, 4) array and colors one BGR colour or an (N, 3) array
+        of them; captions is a callable returning the N caption strings, only
+        called when the batch is rendered, so the frame loop never formats
+        text per box.
+        """
+        self.ops.append(("b", boxes, colors, captions, scale, thickness))
+
+    def extend(self, other):
+        """Append another overlay's ops, e.g. ones recorded once and reused every frame."""
+        self.ops.extend(other.ops)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def draw(self, image):
+        for op in self.ops:
+            if op[0] == "b":
+                _, boxes, colors, captions, scale, thickness = op
+                colors = repeat(colors) if isinstance(colors, tuple) else map(tuple, colors.tolist())
+                for (x1, y1, x2, y2), color, caption in zip(boxes.tolist(), colors, captions()):
+                    cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
+                    cv2.putText(image, caption, (x1, y2 + 20), cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness)
+            elif op[0] == "r":
+                _, x1, y1, x2, y2, color, thickness = op
+                cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
+            elif op[0] == "p":
+                _, points, color, thickness = op
+                cv2.polylines(image, [np.array(points, dtype=np.int32)], True, color, thickness)
+            else:
+                _, text, x, y, scale, color, thickness = op
+                cv2.putText(image, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness)
+        return image
+
+    def to_payload(self):
+        """
+        ["r", x1, y1, x2, y2, "#rrggbb"], ["p", [x, y, x, y, ...], "#rrggbb"],
+        ["t", text, x, y, scale, "#rrggbb"] and, per batch of boxes,
+        ["b", [x1, y1, x2, y2, ...], "#rrggbb" or ["#rrggbb", ...], [caption, ...], scale] entries.
+        """
+        payload = []
+        for op in self.ops:
+            if op[0] == "r":
+                payload.append(["r", op[1], op[2], op[3], op[4], _hex(op[5])])
+            elif op[0] == "p":
+                payload.append(["p", [c for point in op[1] for c in point], _hex(op[2])])
+            elif op[0] == "b":
+                _, boxes, colors, captions, scale, _ = op
+                if isinstance(colors, tuple):
+                    colors = _hex(colors)
+                elif len(colors):
+                    palette, index = np.unique(colors, axis=0, return_inverse=True)
+                    colors = np.array([_hex(color) for color in palette])[index.ravel()].tolist()
+                else:
+                    colors = []
+                payload.append(["b", boxes.ravel().tolist(), colors, captions(), scale])
+            else:
+                payload.append(["t", op[1], op[2], op[3], op[4], _hex(op[5])])
+        return payload
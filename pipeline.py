@@ -0,0 +1,439 @@
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+from alerts import containment
+from jpegcache import EncodedFrame
+from logs import get_logger
+from metrics import DETECTIONS, EVENTS, FRAMES, RULE_SECONDS, STAGE_SECONDS
+from overlay import Overlay
+from rules import RuleBook
+
+log = get_logger("pipeline")
+
+CONFIDENCE_THRESHOLD = 0.7
+
+person_class_id = 0
+cell_phone_class_id = 67
+vehicle_class_ids = [1, 2, 3, 5, 7]
+
+# Only these classes are kept by the detector's NMS; everything else is never scored downstream
+DETECTION_CLASSES = [person_class_id, cell_phone_class_id] + vehicle_class_ids
+
+# Movement (pixels) that ends a vehicle's dwell; alert thresholds themselves live in the rules (rules.py)
+MOVE_THRESHOLD = 40
+
+# Phone alert: frames to confirm/clear an episode, unless a phone rule sets its own
+PHONE_ALERT_FRAMES = 5
+PHONE_RELEASE_FRAMES = 15
+
+# Kind of every class id, looked up for a whole frame at once; ids past the table count as OTHER
+OTHER, PERSON, PHONE, VEHICLE = range(4)
+CLASS_KINDS = np.full(256, OTHER, dtype=np.int8)
+CLASS_KINDS[person_class_id] = PERSON
+CLASS_KINDS[cell_phone_class_id] = PHONE
+CLASS_KINDS[vehicle_class_ids] = VEHICLE
+
+# Box colours (BGR): plain detection, vehicle dwelling past its idle warning, idle alert on this frame
+GREEN = (0, 255, 0)
+YELLOW = (0, 255, 255)
+RED = (0, 0, 255)
+BOX_COLORS = np.array([GREEN, YELLOW, RED])
+
+
+# Stages timed inside process_result (exported as sst_stage_seconds)
+PIPELINE_STAGES = ("roi_assignment", "alerts", "draw", "upload")
+
+
+def _lap(stages, name, start):
+    """Add the time since start to stages[name] (if timing is on) and return the new start."""
+    now = time.perf_counter()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + (now - start)
+    return now
+
+
+class FrameColumns:
+    """
+    One frame's detections as parallel arrays, with the masks and per-ROI counts the alert stages share.
+
+    persons, phones and vehicles are the row indices of the confident
+    detections of each kind whose footprint lies in an ROI.
+    """
+
+    __slots__ = ("ids", "classes", "confidences", "boxes", "box_rois", "confident", "cx", "cy",
+                 "persons", "phones", "vehicles", "person_count", "vehicle_count")
+
+    def __init__(self, ids, classes, confidences, boxes, box_rois, roi_count):
+        self.ids = ids
+        self.classes = classes
+        self.confidences = confidences
+        self.boxes = boxes
+        self.box_rois = box_rois
+        self.confident = confidences >= CONFIDENCE_THRESHOLD
+        centroids = (boxes[:, :2] + boxes[:, 2:]) // 2
+        self.cx, self.cy = centroids[:, 0], centroids[:, 1]
+        kinds = np.where(self.confident & (box_rois >= 0), CLASS_KINDS.take(classes, mode="clip"), OTHER)
+        self.persons = np.flatnonzero(kinds == PERSON)
+        self.phones = np.flatnonzero(kinds == PHONE)
+        self.vehicles = np.flatnonzero(kinds == VEHICLE)
+        self.person_count = np.bincount(box_rois[self.persons], minlength=roi_count)
+        self.vehicle_count = np.bincount(box_rois[self.vehicles], minlength=roi_count)
+
+
+class FrameProcessor:
+    """
+    Per-frame tracking, idle/unattended/phone alert logic and overlay rendering.
+
+    Independent of Flask, the model and the storage backend: the live server
+    and the offline replay harness feed it the same tracked Results and
+    differ only in the uploader and event logs they hand in.
+    """
+
+    def __init__(self, class_names, uploader, event_log, inference_log, snapshot_folder="videos-dev",
+                 stream_quality=80, event_store=None, clips=None, rules=None):
+        self.class_names = class_names
+        self.uploader = uploader
+        self.event_log = event_log
+        self.event_store = event_store
+        self.clips = clips
+        self.inference_log = inference_log
+        self.snapshot_folder = snapshot_folder
+        self.stream_quality = stream_quality
+        # Alert rules in effect (RuleBook); the built-in defaults unless given
+        self.rules = rules if rules is not None else RuleBook()
+        self._roi_ops = (None, None)  # (roi_index, Overlay of its outlines)
+
+    def log_event(self, camera, roi_label, msg, event_type="info", track_id=None, filename=None,
+                  dwell=None, now=None):
+        EVENTS.inc(camera.camera_id, event_type)
+        if self.event_store is not None:
+            self.event_store.add(event_type, msg, camera.config, roi_label, track_id, dwell,
+                                 filename and f"{self.snapshot_folder}/{filename}", now)
+        return self.event_log.append(msg, event_type, camera.camera_id, roi_label,
+                                     None if track_id is None else int(track_id), filename, now)
+
+    def save_event_frame(self, camera, snapshots, event_type, track_id, roi_label="Unknown", now=None):
+        """Name an event snapshot and queue it for upload once the frame's overlays are finished."""
+        timestamp = (datetime.now() if now is None else datetime.fromtimestamp(now)).strftime("%Y%m%d_%H%M%S")
+        camera_id = camera.config.get("camera_id", "CAM1")
+        station_number = camera.config.get("station_number", "Station1")
+        customer_id = camera.config.get("customer_id", "Customer1")
+        filename = f"{event_type}_ID{track_id}_{roi_label}_{customer_id}_{camera_id}_{station_number}_{timestamp}.jpg"
+
+        blob_path = f"{self.snapshot_folder}/{filename}"
+
+        snapshots.append(blob_path)
+        return filename
+
+    def _captions(self, columns, rows, confidence=True):
+        """Deferred "name ID: id (conf)" captions of the given rows, formatted only when drawn."""
+        def captions():
+            names = [self.class_names[cls] for cls in columns.classes[rows].tolist()]
+            ids = columns.ids[rows].tolist()
+            if not confidence:
+                return [f"{name} ID: {track_id}" for name, track_id in zip(names, ids)]
+            return [f"{name} ID: {track_id} ({conf:.2f})"
+                    for name, track_id, conf in zip(names, ids, columns.confidences[rows].tolist())]
+        return captions
+
+    def _roi_overlay(self, roi_index):
+        """ROI outlines and names, recorded once per ROI set."""
+        cached_index, overlay = self._roi_ops
+        if cached_index is not roi_index:
+            overlay = Overlay()
+            for label, polygon, rect in zip(roi_index.labels, roi_index.polygons, roi_index.rects):
+                overlay.polygon(polygon, (255, 255, 0), 2)
+                overlay.text(f"ROI: {label}", (rect[0], rect[1] - 10), 0.6, (255, 255, 0), 2)
+            self._roi_ops = (roi_index, overlay)
+        return overlay
+
+    def alerts(self, camera, columns, roi_index, now, fps=0.0):
+        """
+        Run the alert stages over one frame's columns; return (overlay, snapshot paths).
+
+        Every stage works on whole columns; only rows whose alert rule fires,
+        or whose timers change, on this frame are handled one by one.
+        """
+        rules = self.rules.current().for_camera(camera.camera_id, roi_index)
+        costs = {}
+        snapshots = []
+        # Drawing is recorded, then rendered here or in the browser depending on camera.render_mode
+        overlay = Overlay()
+        overlay.extend(self._roi_overlay(roi_index))
+        confident = np.flatnonzero(columns.confident)
+        overlay.boxes(columns.boxes[confident], GREEN, self._captions(columns, confident))
+        self._vehicle_alerts(camera, columns, rules, now, overlay, snapshots, costs)
+        self._phone_alerts(camera, columns, rules, now, overlay, snapshots, costs)
+        for name, seconds in costs.items():
+            RULE_SECONDS.observe(seconds, camera.camera_id, name)
+
+        text_color = (255, 255, 255)
+        y_offset = 30
+        for label, people, vehicles in zip(roi_index.labels, columns.person_count.tolist(),
+                                           columns.vehicle_count.tolist()):
+            overlay.text(f"{label} - People: {people}", (20, y_offset), 0.6, text_color, 2)
+            y_offset += 30
+            overlay.text(f"{label} - Vehicles: {vehicles}", (20, y_offset), 0.6, text_color, 2)
+            y_offset += 40
+        overlay.text(f"FPS: {fps:.2f}", (20, y_offset), 0.7, (0, 255, 0), 2)
+        return overlay, snapshots
+
+    def _retract(self, camera, track_id, event_type, since):
+        """Retract a track's alerts of one rule raised since its timer started (not older episodes)."""
+        since = float(since)
+        self.event_log.retract(camera.camera_id, track_id, event_type, since)
+        if self.event_store is not None:
+            self.event_store.retract(camera.camera_id, track_id, event_type, since)
+
+    def _schedule(self, camera, rules, track_id, roi_id, start_time, last_attended, attended, restart, costs):
+        """(Re)start the timers of a vehicle's idle and unattended rules for the ROI it is now in."""
+        timers = camera.rule_timers
+        idle_rules, unattended_rules = rules.timed(roi_id)
+        in_effect = {rule.name for rule in idle_rules + unattended_rules}
+        for name in timers.names(track_id):
+            # A vehicle that moved starts a new episode; rules that no longer apply stop
+            if restart or name not in in_effect:
+                timers.stop(track_id, name)
+        for rule in idle_rules + unattended_rules:
+            start = time.perf_counter()
+            state = timers.timer(track_id, rule.name)
+            if rule.kind == "unattended" and attended:
+                if timers.stop(track_id, rule.name):
+                    self._retract(camera, track_id, rule.name, state[1])
+            elif state is None or state[3] is not rule:
+                since = start_time if rule.kind == "idle" else last_attended
+                timers.start(track_id, rule, since, state[2] if state else 0)
+            costs[rule.name] = costs.get(rule.name, 0.0) + time.perf_counter() - start
+
+    def _vehicle_alerts(self, camera, columns, rules, now, overlay, snapshots, costs):
+        """
+        Idle and unattended vehicle alerts, driven by the rules' timers.
+
+        Movement, ROI occupancy and dwell are column operations over the frame's
+        vehicles; timers are only (re)scheduled for vehicles that are new, moved,
+        changed ROI or whose ROI filled or emptied, and only due timers are popped.
+        """
+        timers = camera.rule_timers
+        rebind = timers.bind(rules)
+        rows = columns.vehicles
+        if not len(rows):
+            return
+        store = camera.tracked_vehicles
+        ids, cx, cy, box_rois = columns.ids[rows], columns.cx[rows], columns.cy[rows], columns.box_rois[rows]
+        labels = rules.roi_index.label_array[box_rois]
+        tracks, is_new, roi_changed = store.observe(ids, now, cx, cy, labels)
+
+        # A vehicle that moves away from where it stopped starts a new dwell
+        moved = ~is_new & (np.hypot(cx - store.cx[tracks], cy - store.cy[tracks]) > MOVE_THRESHOLD)
+        if moved.any():
+            store.start_time[tracks[moved]] = now
+            store.last_attended_time[tracks[moved]] = now
+            store.cx[tracks[moved]] = cx[moved]
+            store.cy[tracks[moved]] = cy[moved]
+
+        # Anyone standing in the vehicle's ROI on this frame attends it
+        attended = columns.person_count[box_rois] > 0
+        was_attended = store.attended[tracks]
+        store.attended[tracks] = attended
+        store.last_attended_time[tracks[attended]] = now
+
+        restart = is_new | moved
+        reschedule = np.ones_like(restart) if rebind else restart | roi_changed
+        for i in np.flatnonzero(reschedule):
+            track = tracks[i]
+            self._schedule(camera, rules, int(ids[i]), box_rois[i], store.start_time[track],
+                           store.last_attended_time[track], attended[i], restart[i], costs)
+        # Someone walked up to the vehicle, or everyone left it
+        for i in np.flatnonzero((attended != was_attended) & ~reschedule):
+            track_id = int(ids[i])
+            for rule in rules.timed(box_rois[i])[1]:
+                start = time.perf_counter()
+                if attended[i]:
+                    state = timers.timer(track_id, rule.name)
+                    if timers.stop(track_id, rule.name):
+                        self._retract(camera, track_id, rule.name, state[1])
+                else:
+                    timers.start(track_id, rule, store.last_attended_time[tracks[i]])
+                costs[rule.name] = costs.get(rule.name, 0.0) + time.perf_counter() - start
+
+        idle_fired = np.zeros(len(rows), dtype=bool)
+        due = timers.due(now)
+        if due:
+            # Frame row of every store row seen on this frame
+            frame_rows = np.full(len(store), -1)
+            frame_rows[tracks] = np.arange(len(tracks))
+            waiting = []
+            for track_id, state in due:
+                start = time.perf_counter()
+                _, since, level, rule = state
+                row = store.row(track_id)
+                i = frame_rows[row] if row is not None else -1
+                if i < 0:
+                    # Alerts only fire on a frame showing the vehicle
+                    waiting.append((track_id, state))
+                    continue
+                if rule not in rules.timed(box_rois[i])[rule.kind == "unattended"]:
+                    # Scheduled under rules since replaced
+                    self._schedule(camera, rules, track_id, box_rois[i], store.start_time[tracks[i]],
+                                   store.last_attended_time[tracks[i]], attended[i], False, costs)
+                    continue
+                level = max(rule.level_at(now - since), level + 1)
+                roi_label = labels[i]
+                x1, y1 = columns.boxes[rows[i], :2].tolist()
+                msg = rule.format(self.class_names[int(columns.classes[rows[i]])], track_id, roi_label,
+                                  rule.threshold(level))
+                if rule.kind == "idle":
+                    idle_fired[i] = True
+                    overlay.text(msg, (x1, y1 - 15), 0.5, RED, 2)
+                else:
+                    overlay.text(msg, (x1, y1 - 35), 0.5, (0, 165, 255), 2)
+                log.warning("alert", camera=camera.camera_id, type=rule.name,
+                            track_id=track_id, roi=roi_label, message=msg)
+                filename = self.save_event_frame(camera, snapshots, rule.name, track_id, roi_label, now)
+                self.log_event(camera, roi_label, msg, rule.name, track_id, filename, now - since, now)
+                timers.fired(track_id, state, level)
+                costs[rule.name] = costs.get(rule.name, 0.0) + time.perf_counter() - start
+            timers.requeue(waiting)
+
+        # Green, yellow once dwelling past the idle rule's warning, red on the frame an idle alert fires
+        shade = (now - store.start_time[tracks] >= rules.warning[box_rois]).view(np.int8)
+        shade[idle_fired] = 2
+        overlay.boxes(columns.boxes[rows], BOX_COLORS[shade], self._captions(columns, rows, confidence=False))
+
+    def _phone_alerts(self, camera, columns, rules, now, overlay, snapshots, costs):
+        """Person using a cell phone, debounced per person track and phone rule."""
+        if not rules.phone:
+            return
+        persons = columns.persons
+        # Largest share of any phone's box lying inside each person box
+        holding = np.zeros(len(persons))
+        if len(persons) and len(columns.phones):
+            holding = containment(columns.boxes[persons], columns.boxes[columns.phones]).max(axis=1)
+
+        for rule in rules.phone:
+            start = time.perf_counter()
+            users = persons[(holding >= rule.containment) & rules.where[rule][columns.box_rois[persons]]]
+            debouncer = camera.rule_timers.debouncer(rule)
+            # Fire once per episode, after the phone has been seen for several consecutive frames
+            fired = set(debouncer.update(columns.ids[users].tolist()))
+            for row in users.tolist():
+                pid = int(columns.ids[row])
+                if not debouncer.is_active(pid):
+                    continue
+                px1, py1, px2, py2 = columns.boxes[row].tolist()
+                person_roi = rules.roi_index.label(columns.box_rois[row])
+                alert_msg = rule.format(self.class_names[int(columns.classes[row])], pid, person_roi, 0.0)
+                overlay.text(alert_msg, (px1, py1 - 30), 0.6, (255, 0, 0), 2)
+                overlay.rectangle((px1, py1), (px2, py2), (255, 0, 0), 2)
+                if pid in fired:
+                    log.warning("alert", camera=camera.camera_id, type=rule.name,
+                                track_id=pid, roi=person_roi, message=alert_msg)
+                    filename = self.save_event_frame(camera, snapshots, rule.name, pid, person_roi, now)
+                    self.log_event(camera, person_roi, alert_msg, rule.name, pid, filename, now=now)
+            costs[rule.name] = costs.get(rule.name, 0.0) + time.perf_counter() - start
+
+    def process_result(self, camera, result, capture_time=None, now=None, stages=None):
+        """
+        Run the alert logic for one tracked result of a camera and publish the annotated frame.
+
+        now overrides the wall clock (replays drive alert timers from the recording's
+        timestamps); stages, if given, also receives the seconds spent per pipeline stage.
+        """
+        stages = {} if stages is None else stages
+        try:
+            self._process(camera, result, capture_time, now, stages)
+        finally:
+            for stage in PIPELINE_STAGES:
+                if stage in stages:
+                    STAGE_SECONDS.observe(stages[stage], camera.camera_id, stage)
+
+    def _process(self, camera, result, capture_time, now, stages):
+        frame = result.orig_img
+        current_time = time.time() if now is None else now
+        # Grab the compiled index once so a concurrent /update_rois cannot change it mid-frame
+        roi_index = camera.roi_index
+        tracked_vehicles = camera.tracked_vehicles
+        tracked_vehicles.next_frame()
+
+        # Update frame dimensions for coordinate scaling
+        camera.frame_dimensions["height"], camera.frame_dimensions["width"] = frame.shape[:2]
+
+        prev_time = camera.prev_time or current_time
+        fps = 1.0 / (current_time - prev_time) if current_time > prev_time else 0.0
+        camera.prev_time = current_time
+        FRAMES.inc(camera.camera_id)
+
+        if result.boxes.id is None:
+            # Nothing tracked: the frame still goes to the stream and the clip buffer, so clips
+            # have no holes when everyone has left
+            ids = classes = np.zeros(0, dtype=int)
+            confidences = np.zeros(0, dtype=np.float32)
+            boxes = np.zeros((0, 4), dtype=int)
+        else:
+            ids = result.boxes.id.cpu().numpy().astype(int)
+            classes = result.boxes.cls.cpu().numpy().astype(int)
+            confidences = result.boxes.conf.cpu().numpy()
+            boxes = result.boxes.xyxy.cpu().numpy().astype(int)
+        DETECTIONS.inc(camera.camera_id, amount=len(ids))
+
+        # Every ID in the result is still followed by ByteTrack, however weak its box or wherever
+        # it is; vehicles it has given up on leave the store with their total dwell time
+        tracked_vehicles.touch(ids, current_time)
+        for track in tracked_vehicles.evict_stale():
+            camera.rule_timers.drop_track(track.track_id)
+            self.log_event(camera, track.roi_label, f"Vehicle {track.track_id} departed after {track.total_dwell:.0f}s",
+                           "vehicle_departed", track.track_id, dwell=track.total_dwell, now=current_time)
+
+        # Assign every box to ROIs in one vectorized call
+        start = time.perf_counter()
+        box_rois = roi_index.primary(boxes)
+        start = _lap(stages, "roi_assignment", start)
+
+        columns = FrameColumns(ids, classes, confidences, boxes, box_rois, len(roi_index))
+        overlay, snapshots = self.alerts(camera, columns, roi_index, current_time, fps)
+        start = _lap(stages, "alerts", start)
+
+        # Encoded lazily and at most once per (width, quality), shared by viewers and uploads
+        seq = tracked_vehicles.frame_index
+        if camera.render_mode == "client":
+            # Stream the raw frame; only frames that become evidence get overlays burned in
+            encoded = EncodedFrame(seq, frame, self.stream_quality)
+            evidence = EncodedFrame(seq, overlay.draw(frame.copy()), self.stream_quality) if snapshots else None
+            camera.detections.publish(json.dumps({
+                "seq": seq,
+                "width": frame.shape[1],
+                "height": frame.shape[0],
+                "detections": [[t, c, round(f, 3), *b] for t, c, f, b in
+                               zip(ids.tolist(), classes.tolist(), confidences.tolist(), boxes.tolist())],
+                "overlay": overlay.to_payload(),
+            }, separators=(",", ":")))
+        else:
+            encoded = evidence = EncodedFrame(seq, overlay.draw(frame), self.stream_quality)
+        start = _lap(stages, "draw", start)
+
+        for blob_path in snapshots:
+            self.uploader.submit(blob_path, frame=evidence)
+            if self.clips is not None:
+                # The same event as a clip from the seconds around it, next to the snapshot
+                self.clips.trigger(camera, blob_path.rsplit(".", 1)[0] + ".mp4", current_time)
+        _lap(stages, "upload", start)
+
+        frame_summary = [self.class_names[cls] for cls in classes.tolist()]
+        summary_text = f"{camera.camera_id} {len(frame_summary)}: " + ', '.join(frame_summary)
+        inference_time = result.speed['inference']
+        fps = 1000 / inference_time if inference_time > 0 else 0
+        fps_text = f"FPS: {fps:.1f}"
+
+        summary_text += f", {inference_time:.1f}ms, {fps_text}"
+        log.debug("inference", camera=camera.camera_id, detections=len(frame_summary),
+                  inference_ms=round(inference_time, 1))
+        self.inference_log.append(summary_text, "inference", camera.camera_id)
+
+        camera.broadcaster.publish(encoded)
+        if self.clips is not None:
+            self.clips.record(camera, encoded, current_time)
+        if capture_time is not None:
+            camera.grabber.record_latency(capture_time)
@@ -0,0 +1,87 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for the running server: a background thread samples
+    every other thread's Python stack every `interval` seconds and counts
+    identical stacks. Costs nothing while stopped; output is in the collapsed
+    format flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._stacks = Counter()
+        self._samples = 0
+        self._started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None, reset=True):
+        if self.running:
+            return self
+        if interval:
+            self.interval = max(float(interval), 0.001)
+        if reset:
+            with self._lock:
+                self._stacks.clear()
+                self._samples = 0
+        self._stop.clear()
+        self._started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                parts = []
+                while frame is not None and len(parts) < self.max_depth:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                parts.append(names.get(ident, str(ident)))
+                sampled.append(";".join(reversed(parts)))
+            with self._lock:
+                self._stacks.update(sampled)
+                self._samples += 1
+
+    def collapsed(self):
+        """One "thread;outer;...;inner count" line per distinct stack."""
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common()) + "\n"
+
+    def stats(self, top=20):
+        with self._lock:
+            leaves = Counter()
+            for stack, count in self._stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            return {
+                "running": self.running,
+                "interval": self.interval,
+                "samples": self._samples,
+                "started_at": self._started_at,
+                "top_functions": [{"function": name, "samples": count} for name, count in leaves.most_common(top)],
+            }
@@ -0,0 +1,130 @@
+import math
+
+import numpy as np
+
+
+class DetectionPolicy:
+    """
+    Decides, frame by frame, whether a camera runs the detector or only propagates tracks.
+
+    Modes:
+        "full"      detect on every frame
+        "fixed"     detect on every `stride`-th frame
+        "adaptive"  stride = ceil(measured inference ms / target_latency_ms), capped at max_stride
+    """
+
+    MODES = ("full", "fixed", "adaptive")
+
+    def __init__(self, mode="full", stride=1, target_latency_ms=66.0, max_stride=8, smoothing=0.2):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown inference mode: {mode}")
+        self.mode = mode
+        self.stride = 1 if mode == "full" else max(1, int(stride))
+        self.target_latency_ms = target_latency_ms
+        self.max_stride = max_stride
+        self.smoothing = smoothing
+        self.inference_ms = None
+        self.detected = 0
+        self.propagated = 0
+        self._countdown = 0
+
+    def should_detect(self):
+        if self._countdown <= 0:
+            self._countdown = self.stride - 1
+            self.detected += 1
+            return True
+        self._countdown -= 1
+        self.propagated += 1
+        return False
+
+    def observe(self, inference_ms):
+        """Feed the measured per-frame inference time of a detection pass."""
+        if inference_ms is None:
+            return
+        if self.inference_ms is None:
+            self.inference_ms = inference_ms
+        else:
+            self.inference_ms += self.smoothing * (inference_ms - self.inference_ms)
+        if self.mode == "adaptive" and self.target_latency_ms > 0:
+            stride = math.ceil(self.inference_ms / self.target_latency_ms)
+            self.stride = min(max(stride, 1), self.max_stride)
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "stride": self.stride,
+            "inference_ms": self.inference_ms,
+            "detected_frames": self.detected,
+            "propagated_frames": self.propagated,
+        }
+
+
+class TrackPropagator:
+    """
+    Constant-velocity motion model that carries tracked boxes across frames
+    the detector skips, so dwell and idle timers keep advancing between detections.
+    """
+
+    def __init__(self, max_age=1.0, smoothing=0.5):
+        self.max_age = max_age
+        self.smoothing = smoothing
+        # track_id -> [box, velocity (px/s), cls, conf, timestamp]
+        self._tracks = {}
+
+    def observe(self, ids, boxes, classes, confidences, timestamp):
+        """Update the model from a detection frame."""
+        for track_id, box, cls, conf in zip(ids, boxes, classes, confidences):
+            box = np.asarray(box, dtype=np.float32)
+            prev = self._tracks.get(int(track_id))
+            velocity = np.zeros(4, dtype=np.float32)
+            if prev is not None:
+                dt = timestamp - prev[4]
+                if dt > 0:
+                    measured = (box - prev[0]) / dt
+                    velocity = prev[1] + self.smoothing * (measured - prev[1])
+            self._tracks[int(track_id)] = [box, velocity, int(cls), float(conf), timestamp]
+        self._expire(timestamp)
+
+    def observe_result(self, result, timestamp):
+        if result.boxes is None or result.boxes.id is None:
+            self._expire(timestamp)
+            return
+        self.observe(result.boxes.id.cpu().numpy().astype(int),
+                     result.boxes.xyxy.cpu().numpy(),
+                     result.boxes.cls.cpu().numpy().astype(int),
+                     result.boxes.conf.cpu().numpy(),
+                     timestamp)
+
+    def _expire(self, timestamp):
+        stale = [t for t, state in self._tracks.items() if timestamp - state[4] > self.max_age]
+        for track_id in stale:
+            del self._tracks[track_id]
+
+    def predict(self, timestamp, hold=False):
+        """
+        Return an (N, 7) array of [x1, y1, x2, y2, track_id, conf, cls] extrapolated to timestamp.
+        hold keeps every track where it was last seen, however long ago (static scenes).
+        """
+        if not hold:
+            self._expire(timestamp)
+        rows = []
+        for track_id, (box, velocity, cls, conf, seen) in self._tracks.items():
+            x1, y1, x2, y2 = box if hold else box + velocity * (timestamp - seen)
+            rows.append((x1, y1, x2, y2, track_id, conf, cls))
+        return np.array(rows, dtype=np.float32).reshape(-1, 7)
+
+    def result(self, frame, timestamp, names, hold=False):
+        """Build an Ultralytics Results object from the extrapolated (or held) tracks."""
+        import torch
+        from ultralytics.engine.results import Results
+
+        data = self.predict(timestamp, hold)
+        h, w = frame.shape[:2]
+        data[:, [0, 2]] = data[:, [0, 2]].clip(0, w)
+        data[:, [1, 3]] = data[:, [1, 3]].clip(0, h)
+        result = Results(frame, path="", names=names, boxes=torch.as_tensor(data))
+        result.speed = {"preprocess": 0.0, "inference": 0.0, "postprocess": 0.0}
+        return result
+
+    def __len__(self):
+        return len(self._tracks)
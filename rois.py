@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+UNKNOWN_ROI = "Unknown"
+
+# Side of one ROI mask cell in pixels; footprints are resolved to this precision
+MASK_CELL = 2
+
+# Largest ROI coordinate accepted (8K frames fit); the mask is sized from the ROIs' extent
+MAX_ROI_COORD = 8192
+
+
+def roi_polygon(value):
+    """Vertices of an ROI given as a rectangle [(x1, y1), (x2, y2)] or a polygon [(x, y), ...] (3+ points)."""
+    points = [(int(x), int(y)) for x, y in value]
+    if any(not (0 <= c <= MAX_ROI_COORD) for point in points for c in point):
+        raise ValueError(f"ROI points must lie within 0..{MAX_ROI_COORD} pixels")
+    if len(points) == 2:
+        (x1, y1), (x2, y2) = points
+        x1, x2 = sorted((x1, x2))
+        y1, y2 = sorted((y1, y2))
+        return [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+    if len(points) < 3:
+        raise ValueError("An ROI needs two corners or at least three polygon points")
+    return points
+
+
+def _rasterize(polygon, ox, oy, height, width, cell):
+    """Bool mask (height, width) of the cells whose centres lie inside polygon (even-odd rule)."""
+    px = ox + (np.arange(width, dtype=np.float64) + 0.5) * cell
+    py = oy + (np.arange(height, dtype=np.float64) + 0.5) * cell
+    px, py = px[None, :], py[:, None]
+    inside = np.zeros((height, width), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[:1]):
+        if y1 == y2:
+            continue
+        crosses = (y1 > py) != (y2 > py)
+        x_at = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (px < x_at)
+    return inside
+
+
+class ROIIndex:
+    """
+    Immutable, versioned set of polygon ROIs compiled for vectorized lookups.
+
+    Built once whenever the ROIs change (see Camera.update_rois) and swapped
+    in whole, so the frame loop never sees a half-edited set. Every ROI is
+    rasterized into one label grid covering the ROIs' extent (first ROI in
+    insertion order wins where they overlap); a detection is assigned by
+    looking up its footprint, the bottom-centre of the box, in that grid.
+    """
+
+    def __init__(self, rois=None, version=0, cell=MASK_CELL):
+        self.rois = dict(rois or {})
+        self.version = version
+        self.labels = list(self.rois)
+        # Label per ROI index for whole columns of them; index -1 maps to UNKNOWN_ROI
+        self.label_array = np.array(self.labels + [UNKNOWN_ROI], dtype=object)
+        self.polygons = [roi_polygon(value) for value in self.rois.values()]
+        # Bounding rectangles, for drawing, cropping and overlaps()
+        rects = np.array([(min(x for x, _ in p), min(y for _, y in p), max(x for x, _ in p), max(y for _, y in p))
+                          for p in self.polygons], dtype=np.float32).reshape(-1, 4)
+        self.rects = rects
+        # Column vectors, shape (1, R), broadcast against (N, 1) box coordinates
+        self._rx1 = rects[:, 0][None, :]
+        self._ry1 = rects[:, 1][None, :]
+        self._rx2 = rects[:, 2][None, :]
+        self._ry2 = rects[:, 3][None, :]
+        self.cell = cell
+        self._compile_mask()
+
+    def _compile_mask(self):
+        if not len(self.labels):
+            self._origin = (0, 0)
+            self.mask = np.full((0, 0), -1, dtype=np.int16)
+            return
+        ox, oy = int(self.rects[:, 0].min()), int(self.rects[:, 1].min())
+        width = int(self.rects[:, 2].max() - ox) // self.cell + 1
+        height = int(self.rects[:, 3].max() - oy) // self.cell + 1
+        self._origin = (ox, oy)
+        self.mask = np.full((height, width), -1, dtype=np.int16)
+        # Paint in reverse so earlier ROIs end up on top
+        for roi_id in range(len(self.labels) - 1, -1, -1):
+            x1, y1, x2, y2 = self.rects[roi_id]
+            c1, r1 = (int(x1) - ox) // self.cell, (int(y1) - oy) // self.cell
+            c2, r2 = (int(x2) - ox) // self.cell + 1, (int(y2) - oy) // self.cell + 1
+            inside = _rasterize(self.polygons[roi_id], ox + c1 * self.cell, oy + r1 * self.cell,
+                                r2 - r1, c2 - c1, self.cell)
+            self.mask[r1:r2, c1:c2][inside] = roi_id
+
+    def __len__(self):
+        return len(self.labels)
+
+    def overlaps(self, boxes):
+        """Return an (N, R) bool matrix: True where box n intersects ROI r's bounding rectangle."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        x1, y1, x2, y2 = (boxes[:, i:i + 1] for i in range(4))
+        return (x1 < self._rx2) & (x2 > self._rx1) & (y1 < self._ry2) & (y2 > self._ry1)
+
+    def locate(self, points):
+        """ROI index of every (x, y) point, -1 outside all ROIs; one mask lookup per point."""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        result = np.full(len(points), -1, dtype=np.intp)
+        if not len(self.labels):
+            return result
+        cols = np.floor((points[:, 0] - self._origin[0]) / self.cell).astype(np.intp)
+        rows = np.floor((points[:, 1] - self._origin[1]) / self.cell).astype(np.intp)
+        valid = (cols >= 0) & (cols < self.mask.shape[1]) & (rows >= 0) & (rows < self.mask.shape[0])
+        result[valid] = self.mask[rows[valid], cols[valid]]
+        return result
+
+    def assign(self, boxes):
+        """
+        Assign every box to ROIs in one call.
+
+        Returns (primary, overlaps): primary[n] is the ROI containing box n's
+        footprint (-1 if none), overlaps is the bounding-rectangle membership
+        matrix from overlaps().
+        """
+        return self.primary(boxes), self.overlaps(boxes)
+
+    def primary(self, boxes):
+        """Just the footprint ROI of every box (-1 if none), without the overlap matrix."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        footprints = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, boxes[:, 3]], axis=1)
+        return self.locate(footprints)
+
+    def label(self, roi_id):
+        return self.labels[roi_id] if roi_id >= 0 else UNKNOWN_ROI
+
+    def labels_for(self, overlap_row):
+        """All ROI labels a box falls into, given its row of the overlap matrix."""
+        return [self.labels[i] for i in np.flatnonzero(overlap_row)]
+
+
+class ROIStore:
+    """ROI sets of every camera in one JSON file, so edits survive restarts."""
+
+    def __init__(self, path="rois.json"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        """{camera_id: rois}; empty if the file does not exist yet."""
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self, camera_id, rois):
+        if not self.path:
+            return
+        with self._lock:
+            sets = self.load()
+            sets[camera_id] = rois
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(sets, f, indent=2)
+            # Atomic replace: a crash mid-write leaves the previous file intact
+            os.replace(tmp, self.path)
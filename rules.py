@@ -0,0 +1,384 @@
+import heapq
+import itertools
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from alerts import EpisodeDebouncer
+from logs import get_logger
+from rois import UNKNOWN_ROI
+
+log = get_logger("rules")
+
+RULE_KINDS = ("idle", "unattended", "phone")
+
+# Alert text per kind; fields: label (class name), track_id, roi, seconds and minutes (the threshold passed)
+DEFAULT_MESSAGES = {
+    "idle": "ALERT: {label} {track_id} idle for {minutes:g} minutes",
+    "unattended": "ALERT: Vehicle {track_id} unattended >{seconds:g}s",
+    "phone": "ALERT: Person {track_id} using mobile phone in ROI: {roi}",
+}
+
+# The alerts the pipeline has always raised, for every camera and ROI
+DEFAULT_RULES = [
+    {"name": "idle_vehicle", "kind": "idle", "after": 180, "repeat": 180, "warning": 45},
+    {"name": "unattended_vehicle", "kind": "unattended", "after": 30, "repeat": 30},
+    {"name": "mobile_user", "kind": "phone", "containment": 0.5},
+]
+
+
+class Rule:
+    """
+    One declarative alert rule, validated from its JSON spec.
+
+    "idle" fires once a vehicle has stood still for `after` seconds and again
+    every `repeat` seconds after that (never again if 0); its box turns yellow
+    from `warning` seconds. "unattended" counts the same way from the last
+    moment anyone stood in the vehicle's ROI. "phone" fires once per episode
+    of a person holding a phone (at least `containment` of its box inside
+    theirs) for `trigger_frames` frames, the camera's setting if omitted.
+    `cameras` and `rois` restrict where the rule applies; where several rules
+    share a name the most specific one wins, so a rule scoped to one ROI
+    overrides a camera-wide or global rule of the same name.
+    """
+
+    __slots__ = ("name", "kind", "cameras", "rois", "after", "repeat", "warning", "containment",
+                 "trigger_frames", "release_frames", "message")
+
+    def __init__(self, spec):
+        if not isinstance(spec, dict):
+            raise ValueError("A rule must be an object")
+        self.name = spec.get("name")
+        if not self.name or not isinstance(self.name, str):
+            raise ValueError("Every rule needs a name")
+        self.kind = spec.get("kind")
+        if self.kind not in RULE_KINDS:
+            raise ValueError(f"Rule {self.name}: unknown kind {self.kind!r}")
+        self.cameras = self._names(spec, "cameras")
+        self.rois = self._names(spec, "rois")
+        self.after = self._number(spec, "after", 0)
+        self.repeat = self._number(spec, "repeat", self.after)
+        self.warning = self._number(spec, "warning", self.after)
+        if self.kind != "phone" and (self.after <= 0 or self.repeat < 0 or self.warning < 0):
+            raise ValueError(f"Rule {self.name}: after must be positive, repeat and warning not negative")
+        self.containment = self._number(spec, "containment", 0.5)
+        if not 0 < self.containment <= 1:
+            raise ValueError(f"Rule {self.name}: containment must be in (0, 1]")
+        self.trigger_frames = spec.get("trigger_frames")
+        self.release_frames = spec.get("release_frames")
+        for frames in (self.trigger_frames, self.release_frames):
+            # bool is an int subclass; true is not a frame count
+            if frames is not None and (type(frames) is not int or frames < 1):
+                raise ValueError(f"Rule {self.name}: trigger_frames and release_frames must be positive integers")
+        self.message = spec.get("message", DEFAULT_MESSAGES[self.kind])
+        if not isinstance(self.message, str):
+            raise ValueError(f"Rule {self.name}: message must be a string")
+        try:
+            self.format(label="car", track_id=1, roi="ROI", seconds=1.0)
+        except (KeyError, IndexError, ValueError, AttributeError, TypeError) as e:
+            raise ValueError(f"Rule {self.name}: bad message template ({e})")
+
+    def _number(self, spec, key, default):
+        value = spec.get(key, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"Rule {self.name}: {key} must be a number")
+        return float(value)
+
+    def _names(self, spec, key):
+        names = spec.get(key)
+        if names is None:
+            return None
+        if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+            raise ValueError(f"Rule {self.name}: {key} must be a list of names")
+        return frozenset(names)
+
+    @property
+    def specificity(self):
+        return 2 * (self.rois is not None) + (self.cameras is not None)
+
+    def applies(self, camera_id, roi_label):
+        return ((self.cameras is None or camera_id in self.cameras)
+                and (self.rois is None or roi_label in self.rois))
+
+    def threshold(self, level):
+        """Seconds the condition has lasted when the alert of this level (1, 2, ...) fires."""
+        return self.after + (level - 1) * self.repeat
+
+    def level_at(self, elapsed):
+        """Alert level reached after elapsed seconds (0 before `after`)."""
+        if elapsed < self.after:
+            return 0
+        return 1 + int((elapsed - self.after) // self.repeat) if self.repeat else 1
+
+    def format(self, label, track_id, roi, seconds):
+        return self.message.format(label=label, track_id=track_id, roi=roi, seconds=seconds,
+                                   minutes=round(seconds / 60, 1))
+
+    def to_dict(self):
+        spec = {"name": self.name, "kind": self.kind}
+        if self.cameras is not None:
+            spec["cameras"] = sorted(self.cameras)
+        if self.rois is not None:
+            spec["rois"] = sorted(self.rois)
+        if self.kind == "phone":
+            spec["containment"] = self.containment
+            if self.trigger_frames is not None:
+                spec["trigger_frames"] = self.trigger_frames
+            if self.release_frames is not None:
+                spec["release_frames"] = self.release_frames
+        else:
+            spec.update(after=self.after, repeat=self.repeat)
+            if self.kind == "idle":
+                spec["warning"] = self.warning
+        if self.message != DEFAULT_MESSAGES[self.kind]:
+            spec["message"] = self.message
+        return spec
+
+
+def parse_rules(specs):
+    """Rules from a JSON list of rule objects (or {"rules": [...]}); raises ValueError if any is invalid."""
+    if isinstance(specs, dict):
+        specs = specs.get("rules")
+    if not isinstance(specs, list):
+        raise ValueError("Alert rules must be a list of rule objects")
+    rules = [Rule(spec) for spec in specs]
+    kinds = {}
+    for rule in rules:
+        if kinds.setdefault(rule.name, rule.kind) != rule.kind:
+            raise ValueError(f"Rules named {rule.name} must all be of the same kind")
+    return rules
+
+
+class CameraRules:
+    """
+    The rules of one RuleSet in effect for each ROI of a camera, as lookup tables.
+
+    Tables are indexed by ROI id, with the last slot for detections outside
+    every ROI, so index -1 works as it does for ROIIndex.label_array.
+    """
+
+    def __init__(self, rule_set, camera_id, roi_index):
+        self.version = rule_set.version
+        self.roi_index = roi_index
+        labels = roi_index.labels + [UNKNOWN_ROI]
+        self.by_roi = {kind: [] for kind in RULE_KINDS}
+        for label in labels:
+            chosen = {}
+            for rule in rule_set.rules:
+                if rule.applies(camera_id, label) and (rule.name not in chosen or
+                                                       rule.specificity >= chosen[rule.name].specificity):
+                    chosen[rule.name] = rule
+            for kind in RULE_KINDS:
+                self.by_roi[kind].append(tuple(rule for rule in chosen.values() if rule.kind == kind))
+        # Every distinct rule in effect somewhere on this camera, and where (bool per ROI slot)
+        self.rules = {}
+        self.where = {}
+        for slot, label in enumerate(labels):
+            for kind in RULE_KINDS:
+                for rule in self.by_roi[kind][slot]:
+                    self.rules[rule.name] = rule
+                    self.where.setdefault(rule, np.zeros(len(labels), dtype=bool))[slot] = True
+        self.phone = [rule for rule in self.where if rule.kind == "phone"]
+        # Dwell after which a vehicle's box turns yellow; inf where no idle rule applies
+        self.warning = np.array([min((rule.warning for rule in rules), default=np.inf)
+                                 for rules in self.by_roi["idle"]])
+
+    def timed(self, roi_id):
+        """Idle and unattended rules for a vehicle in ROI roi_id."""
+        return self.by_roi["idle"][roi_id], self.by_roi["unattended"][roi_id]
+
+
+class RuleSet:
+    """An immutable, versioned list of rules; compiled per camera and ROI set on first use."""
+
+    def __init__(self, rules, version=0):
+        self.rules = tuple(rules)
+        self.version = version
+        self._compiled = {}  # camera_id -> CameraRules
+
+    def for_camera(self, camera_id, roi_index):
+        compiled = self._compiled.get(camera_id)
+        if compiled is None or compiled.roi_index is not roi_index:
+            compiled = self._compiled[camera_id] = CameraRules(self, camera_id, roi_index)
+        return compiled
+
+    def to_list(self):
+        return [rule.to_dict() for rule in self.rules]
+
+
+class RuleBook:
+    """
+    The alert rules in effect, read from a JSON file and reloaded whenever it changes.
+
+    Without a file the DEFAULT_RULES apply. current() is called every frame
+    and looks at the file's mtime at most every check_interval seconds; a
+    file that fails to parse is logged and the previous rules stay in effect.
+    """
+
+    def __init__(self, path=None, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = 0.0
+        self.rules = RuleSet(parse_rules(DEFAULT_RULES))
+        self._load()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        with self._lock:
+            self._checked = time.monotonic()
+            mtime = self._stat() if self.path else None
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            try:
+                if mtime is None:
+                    rules = parse_rules(DEFAULT_RULES)
+                else:
+                    with open(self.path) as f:
+                        rules = parse_rules(json.load(f))
+            except (OSError, ValueError) as e:
+                log.error("alert_rules_invalid", path=self.path, error=str(e))
+                return
+            self.rules = RuleSet(rules, self.rules.version + 1)
+            log.info("alert_rules_loaded", path=self.path, version=self.rules.version, rules=len(rules))
+
+    def current(self):
+        if self.path and time.monotonic() - self._checked >= self.check_interval:
+            self._load()
+        return self.rules
+
+    def replace(self, specs):
+        """Validate, save and apply a new list of rules; raises ValueError if any is invalid."""
+        rules = parse_rules(specs)
+        with self._lock:
+            if self.path:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump([rule.to_dict() for rule in rules], f, indent=2)
+                os.replace(tmp, self.path)
+                self._mtime = self._stat()
+            self.rules = RuleSet(rules, self.rules.version + 1)
+        log.info("alert_rules_loaded", path=self.path, version=self.rules.version, rules=len(rules))
+        return self.rules
+
+
+class RuleTimers:
+    """
+    Per-camera state of the alert rules: timers of the timed rules and phone debouncers.
+
+    Every (track, rule) timer holds when its condition started and the alert
+    level reached so far; its next deadline sits in one heap shared by all
+    tracks, so a frame pops only the timers that are due and touches only
+    those whose condition changed, never every track. Stopped timers stay in
+    the heap and are skipped by generation when they surface; the heap is
+    rebuilt once most of it is stale.
+    """
+
+    def __init__(self, phone_trigger_frames=5, phone_release_frames=15):
+        self.phone_trigger_frames = phone_trigger_frames
+        self.phone_release_frames = phone_release_frames
+        self._heap = []  # (deadline, generation, track_id, rule name)
+        self._timers = {}  # track_id -> {rule name: [generation, since, level, rule]}
+        self._generation = itertools.count(1)
+        self._debouncers = {}  # phone rule -> EpisodeDebouncer
+        self._bound = (None, None)  # (roi_index, rules version) of the last frame
+
+    @property
+    def pending(self):
+        return sum(len(timers) for timers in self._timers.values())
+
+    @property
+    def heap_size(self):
+        return len(self._heap)
+
+    def bind(self, camera_rules):
+        """
+        Note the rules in effect for this frame.
+
+        Returns True if the rules or the camera's ROIs changed since the last
+        frame, in which case the timers of the vehicles in view are rescheduled.
+        """
+        roi_index, version = self._bound
+        self._bound = (camera_rules.roi_index, camera_rules.version)
+        if version != camera_rules.version:
+            # Debouncers of replaced phone rules
+            self._debouncers = {}
+        return roi_index is not camera_rules.roi_index or version != camera_rules.version
+
+    def timer(self, track_id, name):
+        timers = self._timers.get(track_id)
+        return timers.get(name) if timers else None
+
+    def names(self, track_id):
+        return list(self._timers.get(track_id, ()))
+
+    def start(self, track_id, rule, since, level=0):
+        generation = next(self._generation)
+        state = [generation, since, level, rule]
+        self._timers.setdefault(track_id, {})[rule.name] = state
+        self._push(track_id, state)
+
+    def _push(self, track_id, state):
+        generation, since, level, rule = state
+        if level and not rule.repeat:
+            return
+        heapq.heappush(self._heap, (since + rule.threshold(level + 1), generation, track_id, rule.name))
+
+    def stop(self, track_id, name):
+        """Stop a timer; return the alert level it had reached (0 if none or not running)."""
+        timers = self._timers.get(track_id)
+        state = timers.pop(name, None) if timers else None
+        if timers is not None and not timers:
+            del self._timers[track_id]
+        return state[2] if state else 0
+
+    def drop_track(self, track_id):
+        self._timers.pop(track_id, None)
+
+    def due(self, now):
+        """Pop every running timer whose deadline has passed, as (track_id, state) pairs."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, generation, track_id, name = heapq.heappop(self._heap)
+            state = self.timer(track_id, name)
+            if state is not None and state[0] == generation:
+                due.append((track_id, state))
+        if len(self._heap) > 1024 and len(self._heap) > 8 * len(self._timers):
+            self._compact()
+        return due
+
+    def fired(self, track_id, state, level):
+        """Record that the timer's alert fired at level and schedule the next one."""
+        state[2] = level
+        self._push(track_id, state)
+
+    def requeue(self, entries):
+        """Put due timers whose track was not in the frame back, to fire once it is seen again."""
+        for track_id, state in entries:
+            self._push(track_id, state)
+
+    def _compact(self):
+        live = {(track_id, state[0]) for track_id, timers in self._timers.items() for state in timers.values()}
+        self._heap = [entry for entry in self._heap if (entry[2], entry[1]) in live]
+        heapq.heapify(self._heap)
+
+    def debouncer(self, rule):
+        debouncer = self._debouncers.get(rule)
+        if debouncer is None:
+            debouncer = self._debouncers[rule] = EpisodeDebouncer(
+                rule.trigger_frames or self.phone_trigger_frames, rule.release_frames or self.phone_release_frames)
+        return debouncer
+
+    def stats(self):
+        return {"timers": self.pending, "heap": len(self._heap)}
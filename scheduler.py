@@ -0,0 +1,159 @@
+import time
+import threading
+
+import numpy as np
+
+from cropping import crop, merge_crop_results
+from logs import get_logger
+from metrics import STAGE_SECONDS
+
+log = get_logger("scheduler")
+
+
+def create_tracker(tracker_config="bytetrack.yaml", frame_rate=30):
+    """Build a standalone ByteTrack instance from an Ultralytics tracker YAML."""
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+
+    cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker_config)))
+    return BYTETracker(args=cfg, frame_rate=frame_rate)
+
+
+def track_result(tracker, result):
+    """Run a detection Results through ByteTrack; returns the tracked Results (boxes gain IDs)."""
+    import torch
+
+    det = result.boxes.cpu().numpy()
+    tracks = tracker.update(det, result.orig_img)
+    if len(tracks) == 0:
+        return result
+    idx = tracks[:, -1].astype(int)
+    result = result[idx]
+    result.update(boxes=torch.as_tensor(tracks[:, :-1].astype(np.float32)))
+    return result
+
+
+class InferenceScheduler:
+    """
+    One resident YOLO model serving every registered camera.
+
+    Each pass collects the newest unseen frame from up to max_batch cameras,
+    runs them through a single model.predict call and routes every result
+    through that camera's own ByteTrack instance before handing it to
+    on_result(camera, result, capture_time). Frames a camera's DetectionPolicy skips are
+    answered from its TrackPropagator instead of the model, and so are frames its
+    MotionGate finds unchanged, with the tracks held where they were last seen. Cameras in ROI crop
+    mode are detected on their ROI crops and mapped back to full-frame boxes. The model
+    may be set after start(); until then no frame is processed.
+    """
+
+    def __init__(self, model, registry, on_result, max_batch=8, idle_wait=0.005,
+                 tracker_config="bytetrack.yaml", **predict_kwargs):
+        self.model = model
+        self.registry = registry
+        self.on_result = on_result
+        self.max_batch = max_batch
+        self.idle_wait = idle_wait
+        self.tracker_config = tracker_config
+        self.predict_kwargs = predict_kwargs
+        self._offset = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.batches = 0
+        self.frames = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    def _collect(self):
+        cameras = self.registry.cameras()
+        if not cameras:
+            return [], []
+        # Rotate the starting camera so nobody starves when there are more cameras than batch slots
+        start = self._offset % len(cameras)
+        self._offset += 1
+        batch = []
+        propagated = []
+        for camera in cameras[start:] + cameras[:start]:
+            if len(batch) >= self.max_batch:
+                break
+            seq, frame, timestamp = camera.grabber.read(camera.last_seq)
+            if frame is None:
+                continue
+            camera.last_seq = seq
+            with STAGE_SECONDS.time(camera.camera_id, "motion"):
+                moving = camera.motion.check(frame, timestamp, camera.roi_index)
+            if not moving:
+                propagated.append((camera, frame, timestamp, True))
+            elif camera.policy.should_detect():
+                batch.append((camera, frame, timestamp))
+            else:
+                propagated.append((camera, frame, timestamp, False))
+        return batch, propagated
+
+    def _track(self, camera, result):
+        if camera.tracker is None:
+            camera.tracker = create_tracker(self.tracker_config)
+        return track_result(camera.tracker, result)
+
+    def _dispatch(self, camera, result, capture_time):
+        try:
+            self.on_result(camera, result, capture_time)
+        except Exception as e:
+            log.error("postprocess_failed", camera=camera.camera_id, error=str(e))
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.model is None:
+                # Still loading in the background; cameras keep capturing, only the newest frame is kept
+                self._stop.wait(0.05)
+                continue
+            batch, propagated = self._collect()
+            if not batch and not propagated:
+                time.sleep(self.idle_wait)
+                continue
+            for camera, frame, timestamp, hold in propagated:
+                with STAGE_SECONDS.time(camera.camera_id, "propagation"):
+                    result = camera.propagator.result(frame, timestamp, self.model.names, hold)
+                self._dispatch(camera, result, timestamp)
+            if not batch:
+                continue
+            # Cameras in ROI crop mode contribute one image per crop region instead of the full frame
+            images = []
+            plans = []
+            for camera, frame, _ in batch:
+                regions = camera.crop_regions(frame) if camera.crop_mode == "roi" else None
+                plans.append((len(images), regions))
+                images.extend(crop(frame, regions) if regions else [frame])
+            start = time.perf_counter()
+            try:
+                results = self.model.predict(images, verbose=False, **self.predict_kwargs)
+            except Exception as e:
+                log.error("inference_failed", error=str(e))
+                time.sleep(0.5)
+                continue
+            self.batches += 1
+            self.frames += len(batch)
+            share = (time.perf_counter() - start) / len(batch)
+            for (camera, frame, timestamp), (first, regions) in zip(batch, plans):
+                if regions:
+                    result = merge_crop_results(frame, self.model.names, regions,
+                                                results[first:first + len(regions)])
+                else:
+                    result = results[first]
+                STAGE_SECONDS.observe(share, camera.camera_id, "inference")
+                camera.policy.observe(result.speed.get("inference"))
+                with STAGE_SECONDS.time(camera.camera_id, "tracking"):
+                    result = self._track(camera, result)
+                    camera.propagator.observe_result(result, timestamp)
+                self._dispatch(camera, result, timestamp)
@@ -0,0 +1,132 @@
+import struct
+import time
+import uuid
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Ring header: latest published seq, slot count, payload bytes per slot
+_RING = struct.Struct("<QQQ")
+# Slot header: seq (0 while being written), timestamp, height, width, channels (0 = raw bytes), payload size.
+# Byte payloads may carry the height/width of the image they encode.
+_SLOT = struct.Struct("<QdIIIQ")
+_SLOT_HEADER = 64
+
+
+def _attach(name):
+    """Open an existing block; only its creator unlinks it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: children spawned by the creator share its resource tracker, where
+        # registering the name again is a no-op and unregistering would drop the creator's entry
+        return shared_memory.SharedMemory(name=name)
+
+
+class FrameRing:
+    """
+    Single-writer, many-reader ring of frames (or encoded bytes) in shared memory.
+
+    The writer copies each frame into the next slot and then publishes its
+    sequence number; readers copy the newest slot out and check the slot's
+    sequence number again afterwards (a seqlock), so a frame the writer lapped
+    mid-copy is retried instead of returned torn. Nothing is pickled: only the
+    block's name crosses process boundaries.
+    """
+
+    def __init__(self, name=None, slots=4, slot_bytes=1920 * 1080 * 3, create=False):
+        if create:
+            size = _RING.size + slots * (_SLOT_HEADER + slot_bytes)
+            self._shm = shared_memory.SharedMemory(name=name or f"sst_{uuid.uuid4().hex[:12]}",
+                                                   create=True, size=size)
+            _RING.pack_into(self._shm.buf, 0, 0, slots, slot_bytes)
+        else:
+            self._shm = _attach(name)
+        self.owner = create
+        self.name = self._shm.name
+        _, self.slots, self.slot_bytes = _RING.unpack_from(self._shm.buf, 0)
+
+    @classmethod
+    def create(cls, slots=4, slot_bytes=1920 * 1080 * 3, name=None):
+        return cls(name, slots, slot_bytes, create=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(name)
+
+    def _offset(self, seq):
+        return _RING.size + (seq % self.slots) * (_SLOT_HEADER + self.slot_bytes)
+
+    @property
+    def latest_seq(self):
+        return _RING.unpack_from(self._shm.buf, 0)[0]
+
+    def write(self, frame, timestamp=None, shape=None):
+        """Publish a uint8 HxW(xC) image, or bytes (with the (height, width) they encode); returns its seq."""
+        if isinstance(frame, (bytes, bytearray, memoryview)):
+            height, width = shape[:2] if shape else (0, 0)
+            payload, channels = memoryview(frame).cast("B"), 0
+        else:
+            frame = np.ascontiguousarray(frame, dtype=np.uint8)
+            height, width = frame.shape[:2]
+            channels = frame.shape[2] if frame.ndim == 3 else 1
+            payload = memoryview(frame).cast("B")
+        if len(payload) > self.slot_bytes:
+            raise ValueError(f"Frame of {len(payload)} bytes exceeds ring slot of {self.slot_bytes}")
+        buf = self._shm.buf
+        seq = self.latest_seq + 1
+        offset = self._offset(seq)
+        # Invalidate the slot first so a reader still copying its previous frame notices
+        _SLOT.pack_into(buf, offset, 0, 0.0, 0, 0, 0, 0)
+        start = offset + _SLOT_HEADER
+        buf[start:start + len(payload)] = payload
+        _SLOT.pack_into(buf, offset, seq, time.time() if timestamp is None else timestamp,
+                        height, width, channels, len(payload))
+        struct.pack_into("<Q", buf, 0, seq)
+        return seq
+
+    def _read_slot(self, seq):
+        buf = self._shm.buf
+        offset = self._offset(seq)
+        slot_seq, timestamp, height, width, channels, size = _SLOT.unpack_from(buf, offset)
+        if slot_seq != seq:
+            return None
+        start = offset + _SLOT_HEADER
+        # bytearray keeps the copied image writable for in-place overlay drawing
+        data = bytearray(buf[start:start + size])
+        if _SLOT.unpack_from(buf, offset)[0] != seq:
+            return None
+        if channels == 0:
+            return bytes(data), timestamp, (height, width)
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        return np.frombuffer(data, dtype=np.uint8).reshape(shape), timestamp, shape
+
+    def read_entry(self, last_seq=0):
+        """Return (seq, frame, timestamp, shape) for the newest entry if newer than last_seq, else None."""
+        while True:
+            seq = self.latest_seq
+            if seq == last_seq or seq == 0:
+                return None
+            entry = self._read_slot(seq)
+            if entry is not None:
+                return (seq,) + entry
+
+    def read(self, last_seq=0):
+        """Return (seq, frame, timestamp) if an entry newer than last_seq exists, else (last_seq, None, None)."""
+        entry = self.read_entry(last_seq)
+        if entry is None:
+            return last_seq, None, None
+        return entry[:3]
+
+    def read_seq(self, seq):
+        """Return (frame, timestamp, shape) of a specific seq, or None once it has been overwritten."""
+        if seq <= 0 or seq > self.latest_seq or self.latest_seq - seq >= self.slots:
+            return None
+        return self._read_slot(seq)
+
+    def close(self):
+        self._shm.close()
+
+    def unlink(self):
+        if self.owner:
+            self._shm.unlink()
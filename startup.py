@@ -0,0 +1,116 @@
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger("startup")
+
+
+class _Step:
+    __slots__ = ("required", "attempt", "state", "phase", "info", "error", "started", "seconds", "result", "done")
+
+    def __init__(self, required, attempt=1):
+        self.required = required
+        self.attempt = attempt
+        self.state = "running"
+        self.phase = None
+        self.info = {}
+        self.error = None
+        self.started = time.time()
+        self.seconds = None
+        self.result = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "phase": self.phase,
+            "required": self.required,
+            "attempt": self.attempt,
+            "seconds": round(self.seconds if self.seconds is not None else time.time() - self.started, 3),
+            "error": self.error,
+            **self.info,
+        }
+
+
+class Startup:
+    """
+    Slow initialization (model load, warm-up, storage client) on background threads.
+
+    The server binds and serves the UI right away; each step runs as
+    fn(progress) on its own thread, where progress(phase, **info) records what
+    it is doing for /readyz. The process is ready once every required step has
+    finished. A failing step is logged and reported as failed, never raised, so
+    a bad credential or a broken export does not take the process down; the
+    next run() of it after backoff seconds (doubling per failure, up to
+    max_backoff) starts it again.
+    """
+
+    def __init__(self, backoff=5.0, max_backoff=300.0):
+        self.started = time.time()
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._steps = {}
+        self._lock = threading.Lock()
+
+    def _retry_in(self, step):
+        delay = min(self.backoff * 2 ** (step.attempt - 1), self.max_backoff)
+        return step.started + step.seconds + delay - time.time()
+
+    def run(self, name, fn, required=True):
+        """Start step name once, or again if it failed and its backoff has passed; returns an Event set when done."""
+        with self._lock:
+            step = self._steps.get(name)
+            if step is not None and (step.state != "failed" or self._retry_in(step) > 0):
+                return step.done
+            attempt = step.attempt + 1 if step is not None else 1
+            step = self._steps[name] = _Step(required, attempt)
+            if attempt > 1:
+                log.info("startup_retry", step=name, attempt=attempt)
+        threading.Thread(target=self._run, args=(name, step, fn), name=f"startup-{name}", daemon=True).start()
+        return step.done
+
+    def _run(self, name, step, fn):
+        def progress(phase, **info):
+            step.phase = phase
+            step.info.update(info)
+            log.info("startup_progress", step=name, phase=phase, **info)
+
+        try:
+            step.result = fn(progress)
+            step.state = "ready"
+        except Exception as e:
+            step.state = "failed"
+            step.error = str(e)
+            log.error("startup_failed", step=name, error=str(e))
+        finally:
+            step.seconds = time.time() - step.started
+            step.done.set()
+        log.info("startup_step_done", step=name, state=step.state, seconds=round(step.seconds, 3))
+
+    def result(self, name, timeout=None):
+        """The step's return value once it has succeeded (waiting up to timeout), else None."""
+        step = self._steps.get(name)
+        if step is None or not step.done.wait(timeout):
+            return None
+        return step.result
+
+    def info(self, name):
+        step = self._steps.get(name)
+        return dict(step.info) if step is not None else {}
+
+    @property
+    def ready(self):
+        with self._lock:
+            steps = list(self._steps.values())
+        return all(step.state == "ready" for step in steps if step.required)
+
+    def stats(self):
+        with self._lock:
+            steps = dict(self._steps)
+        views = {}
+        for name, step in steps.items():
+            views[name] = step.to_dict()
+            if step.state == "failed":
+                views[name]["retry_in_s"] = round(max(0.0, self._retry_in(step)), 1)
+        return {"ready": self.ready, "uptime_s": round(time.time() - self.started, 3), "steps": views}
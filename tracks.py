@@ -0,0 +1,179 @@
+import numpy as np
+
+# Per-track columns of TrackStore and their dtypes
+TRACK_COLUMNS = (
+    ("track_id", np.int64),
+    ("first_seen", np.float64),
+    ("start_time", np.float64),
+    ("last_attended_time", np.float64),
+    # Centroid at the last move; dwell timers restart when the vehicle leaves it
+    ("cx", np.int64),
+    ("cy", np.int64),
+    # Whether anyone stood in the vehicle's ROI when it was last seen
+    ("attended", bool),
+    ("last_seen_frame", np.int64),
+    ("last_seen_time", np.float64),
+    ("roi_label", object),
+)
+
+
+class VehicleTrack:
+    """Snapshot of one tracked vehicle, as returned by TrackStore.get() and evict_stale()."""
+
+    __slots__ = ("track_id", "first_seen", "start_time", "last_attended_time", "bbox",
+                 "attended", "last_seen_frame", "last_seen_time", "roi_label")
+
+    def __init__(self, track_id, first_seen, start_time, last_attended_time, bbox, attended,
+                 last_seen_frame, last_seen_time, roi_label="Unknown"):
+        self.track_id = track_id
+        self.first_seen = first_seen
+        self.start_time = start_time
+        self.last_attended_time = last_attended_time
+        self.bbox = bbox
+        self.attended = attended
+        self.last_seen_frame = last_seen_frame
+        self.last_seen_time = last_seen_time
+        self.roi_label = roi_label
+
+    @property
+    def total_dwell(self):
+        return self.last_seen_time - self.first_seen
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class TrackStore:
+    """
+    Bounded, column-oriented replacement for the tracked_vehicles dict.
+
+    Every field is one NumPy array (see TRACK_COLUMNS) with rows kept sorted
+    by track id, so a frame's vehicles are matched to their rows with one
+    searchsorted() in observe() and the alert logic reads and writes whole
+    columns by row index. Tracks the tracker has not reported for ttl_frames
+    frames (see touch()) are compacted away by evict_stale(); each evicted
+    track is passed to on_depart(track).
+    """
+
+    def __init__(self, ttl_frames=30, on_depart=None, capacity=64):
+        self.ttl_frames = ttl_frames
+        self.on_depart = on_depart
+        self._size = 0
+        for name, dtype in TRACK_COLUMNS:
+            setattr(self, name, np.empty(capacity, dtype=dtype))
+        self.frame_index = 0
+        self.departed = 0
+
+    def __contains__(self, track_id):
+        return self.row(track_id) is not None
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter([self._record(row) for row in range(self._size)])
+
+    def row(self, track_id):
+        """Current row of track_id in the column arrays, or None."""
+        row = int(np.searchsorted(self.track_id[:self._size], track_id))
+        return row if row < self._size and self.track_id[row] == track_id else None
+
+    def _record(self, row):
+        return VehicleTrack(int(self.track_id[row]), float(self.first_seen[row]), float(self.start_time[row]),
+                            float(self.last_attended_time[row]), (int(self.cx[row]), int(self.cy[row])),
+                            bool(self.attended[row]),
+                            int(self.last_seen_frame[row]), float(self.last_seen_time[row]), self.roi_label[row])
+
+    def get(self, track_id):
+        row = self.row(track_id)
+        return None if row is None else self._record(row)
+
+    def next_frame(self):
+        """Advance the frame clock; call once per processed frame before sightings."""
+        self.frame_index += 1
+        return self.frame_index
+
+    def _reserve(self, size):
+        capacity = len(self.track_id)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name, dtype in TRACK_COLUMNS:
+            column = np.empty(capacity, dtype=dtype)
+            column[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, column)
+
+    def observe(self, track_ids, now, cx, cy, roi_labels):
+        """
+        Mark every track in track_ids (unique) as seen in this frame, creating the new ones.
+
+        Returns (rows, is_new, roi_changed): the row of each track in the column
+        arrays, valid until the next observe() or evict_stale(), which of them
+        were created and which are now in a different ROI (new tracks included).
+        """
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        size = self._size
+        rows = np.searchsorted(self.track_id[:size], track_ids)
+        is_new = rows >= size
+        is_new[~is_new] = self.track_id[rows[~is_new]] != track_ids[~is_new]
+        if is_new.any():
+            count = int(is_new.sum())
+            self._reserve(size + count)
+            added = slice(size, size + count)
+            self.track_id[added] = track_ids[is_new]
+            self.first_seen[added] = self.start_time[added] = self.last_attended_time[added] = now
+            self.cx[added] = np.asarray(cx)[is_new]
+            self.cy[added] = np.asarray(cy)[is_new]
+            self.attended[added] = False
+            self._size = size = size + count
+            order = np.argsort(self.track_id[:size], kind="stable")
+            for name, _ in TRACK_COLUMNS:
+                column = getattr(self, name)
+                column[:size] = column[order]
+            rows = np.searchsorted(self.track_id[:size], track_ids)
+        self.last_seen_frame[rows] = self.frame_index
+        self.last_seen_time[rows] = now
+        # New rows still hold None, so they count as changed
+        roi_changed = self.roi_label[rows] != roi_labels
+        self.roi_label[rows] = roi_labels
+        return rows, is_new, roi_changed
+
+    def touch(self, track_ids, now):
+        """
+        Mark the known tracks among track_ids as still followed by the tracker, creating none.
+
+        ByteTrack keeps an ID through frames where the detection is too weak
+        for the alert logic, so those frames keep the track alive without
+        counting as a sighting for observe().
+        """
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        size = self._size
+        rows = np.searchsorted(self.track_id[:size], track_ids)
+        known = rows < size
+        known[known] = self.track_id[rows[known]] == track_ids[known]
+        rows = rows[known]
+        self.last_seen_frame[rows] = self.frame_index
+        self.last_seen_time[rows] = now
+
+    def evict_stale(self):
+        """Drop tracks not seen for ttl_frames frames; return the departed records, oldest sighting first."""
+        size = self._size
+        stale = self.last_seen_frame[:size] <= self.frame_index - self.ttl_frames
+        if not stale.any():
+            return []
+        rows = np.flatnonzero(stale)
+        rows = rows[np.argsort(self.last_seen_frame[rows], kind="stable")]
+        departed = [self._record(row) for row in rows]
+        keep = ~stale
+        self._size = int(keep.sum())
+        for name, _ in TRACK_COLUMNS:
+            column = getattr(self, name)
+            column[:self._size] = column[:size][keep]
+        # Drop references to departed labels
+        self.roi_label[self._size:size] = None
+        self.departed += len(departed)
+        if self.on_depart is not None:
+            for track in departed:
+                self.on_depart(track)
+        return departed
@@ -0,0 +1,353 @@
+import os
+import time
+import queue
+import threading
+import mimetypes
+from urllib.parse import quote, unquote
+
+import cv2
+
+from logs import get_logger
+
+log = get_logger("upload")
+
+
+class StorageBackend:
+    """Where event snapshots end up. Subclasses implement upload()."""
+
+    name = "base"
+
+    def connect(self):
+        """Open clients and connections ahead of the first upload; a no-op where there are none."""
+
+    def upload(self, path, data, content_type):
+        raise NotImplementedError
+
+
+class GCSBackend(StorageBackend):
+    """Google Cloud Storage bucket; one client (and HTTP connection pool) is shared by all workers."""
+
+    name = "gcs"
+
+    def __init__(self, bucket_name, credentials_info=None, client=None):
+        self.bucket_name = bucket_name
+        self.credentials_info = credentials_info
+        self._client = client
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    def _get_bucket(self):
+        with self._lock:
+            if self._bucket is None:
+                if self._client is None:
+                    from google.cloud import storage
+                    from google.oauth2 import service_account
+                    credentials = service_account.Credentials.from_service_account_info(self.credentials_info)
+                    self._client = storage.Client(credentials=credentials,
+                                                  project=self.credentials_info["project_id"])
+                self._bucket = self._client.bucket(self.bucket_name)
+            return self._bucket
+
+    def connect(self):
+        self._get_bucket()
+
+    def upload(self, path, data, content_type):
+        blob = self._get_bucket().blob(path)
+        blob.upload_from_string(data, content_type=content_type)
+
+
+class LocalBackend(StorageBackend):
+    """Plain directory on disk, mirroring the bucket layout."""
+
+    name = "local"
+
+    def __init__(self, root):
+        self.root = root
+
+    def upload(self, path, data, content_type):
+        target = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        tmp = target + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+
+
+class MemoryBackend(StorageBackend):
+    """In-process store for tests and offline runs."""
+
+    name = "memory"
+
+    def __init__(self, fail_times=0, delay=0.0):
+        self.objects = {}
+        self.fail_times = fail_times
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def upload(self, path, data, content_type):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise IOError("simulated upload failure")
+            self.objects[path] = (bytes(data), content_type)
+
+
+def create_backend(kind, **options):
+    """Build a storage backend by name: "gcs", "local" or "memory"."""
+    if kind == "gcs":
+        return GCSBackend(options["bucket_name"], options.get("credentials_info"))
+    if kind == "local":
+        return LocalBackend(options.get("root", "snapshots"))
+    if kind == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+class _Job:
+    __slots__ = ("path", "frame", "data", "attempts", "enqueued_at", "on_done")
+
+    def __init__(self, path, frame=None, data=None, on_done=None):
+        self.path = path
+        self.frame = frame
+        self.data = data
+        self.attempts = 0
+        self.enqueued_at = time.time()
+        self.on_done = on_done
+
+    def done(self, uploaded):
+        if self.on_done is not None:
+            try:
+                self.on_done(uploaded)
+            except Exception as e:
+                log.error("upload_callback_failed", path=self.path, error=str(e))
+
+
+class SnapshotUploader:
+    """
+    Bounded upload queue drained by a pool of worker threads.
+
+    submit() never blocks: it puts the frame into the queue and returns.
+    Workers JPEG-encode and upload with exponential backoff. Jobs that cannot
+    be delivered (queue full, retries exhausted) are written to an on-disk
+    spool which is replayed in the background and after a restart. When the
+    upload queue is full, jobs go to the spool writer thread through a second
+    bounded queue, so the caller never encodes or touches the disk; past that
+    they are dropped and counted.
+    """
+
+    def __init__(self, backend, workers=4, max_queue=256, spool_dir=None,
+                 max_retries=4, backoff=0.5, max_backoff=30.0, jpeg_quality=80):
+        self.backend = backend
+        self.spool_dir = spool_dir
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jpeg_quality = jpeg_quality
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spool_queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._counters = {"submitted": 0, "uploaded": 0, "failed": 0,
+                          "dropped": 0, "spooled": 0, "replayed": 0, "retried": 0}
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._latency_last = 0.0
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+        self._threads = [threading.Thread(target=self._worker, name=f"uploader-{i}", daemon=True)
+                         for i in range(workers)]
+        if spool_dir:
+            self._threads.append(threading.Thread(target=self._drain_spool, name="uploader-spool", daemon=True))
+            self._threads.append(threading.Thread(target=self._spool_writer, name="uploader-spool-writer",
+                                                  daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def submit(self, path, frame=None, data=None, on_done=None):
+        """
+        Queue a frame or EncodedFrame (encoded by a worker) or pre-encoded bytes. Returns False if dropped.
+
+        A queued job ends with on_done(True) once the backend has stored it, or
+        on_done(False) if it was spooled for a later replay or lost.
+        """
+        job = _Job(path, frame, data, on_done)
+        self._count("submitted")
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            pass
+        if self.spool_dir:
+            try:
+                self._spool_queue.put_nowait(job)
+                return True
+            except queue.Full:
+                pass
+        self._count("dropped")
+        log.warning("queue_full_dropped", path=path)
+        return False
+
+    def _encode(self, job):
+        if job.data is None and hasattr(job.frame, "jpeg"):
+            # Shared EncodedFrame: reuse the bytes if a viewer already encoded this variant
+            job.data = job.frame.jpeg(quality=self.jpeg_quality)
+            job.frame = None
+        elif job.data is None:
+            success, encoded = cv2.imencode('.jpg', job.frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            if not success:
+                raise ValueError("Failed to encode image.")
+            job.data = encoded.tobytes()
+            job.frame = None
+        return job.data
+
+    def _upload(self, job):
+        data = self._encode(job)
+        content_type = mimetypes.guess_type(job.path)[0] or "application/octet-stream"
+        start = time.time()
+        self.backend.upload(job.path, data, content_type)
+        latency = time.time() - start
+        with self._lock:
+            self._counters["uploaded"] += 1
+            self._latency_total += latency
+            self._latency_last = latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._deliver(job)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, job):
+        delay = self.backoff
+        while True:
+            try:
+                self._upload(job)
+                log.debug("uploaded", path=job.path)
+                job.done(True)
+                return True
+            except ValueError as e:
+                self._count("failed")
+                log.error("encode_failed", path=job.path, error=str(e))
+                job.done(False)
+                return False
+            except Exception as e:
+                job.attempts += 1
+                if job.attempts > self.max_retries or self._stop.is_set():
+                    self._count("failed")
+                    log.error("upload_failed", path=job.path, attempts=job.attempts, error=str(e))
+                    self._spool(job)
+                    job.done(False)
+                    return False
+                self._count("retried")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    # --- on-disk spool -------------------------------------------------
+
+    def _spool(self, job):
+        if not self.spool_dir:
+            return False
+        try:
+            data = self._encode(job)
+        except ValueError:
+            return False
+        target = os.path.join(self.spool_dir, quote(job.path, safe=""))
+        tmp = target + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, target)
+        except OSError as e:
+            # Disk full or read-only: the snapshot is lost, but nothing upstream fails
+            log.error("spool_write_failed", path=job.path, error=str(e))
+            return False
+        self._count("spooled")
+        return True
+
+    def _spool_writer(self):
+        """Spool the jobs submit() could not queue, off the caller's thread."""
+        while not self._stop.is_set():
+            try:
+                job = self._spool_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                if not self._spool(job):
+                    self._count("dropped")
+                job.done(False)
+            finally:
+                self._spool_queue.task_done()
+
+    def _drain_spool(self):
+        delay = self.backoff
+        while not self._stop.is_set():
+            names = [n for n in sorted(os.listdir(self.spool_dir)) if not n.endswith(".tmp")]
+            if not names:
+                self._stop.wait(5.0)
+                continue
+            for name in names:
+                if self._stop.is_set():
+                    return
+                source = os.path.join(self.spool_dir, name)
+                try:
+                    with open(source, "rb") as f:
+                        job = _Job(unquote(name), data=f.read())
+                    self._upload(job)
+                    os.remove(source)
+                    self._count("replayed")
+                    delay = self.backoff
+                except FileNotFoundError:
+                    continue
+                except Exception as e:
+                    # Backend is still unavailable; back off before the next pass
+                    log.warning("spool_replay_failed", error=str(e), retry_in=round(delay, 1))
+                    self._stop.wait(delay)
+                    delay = min(delay * 2, self.max_backoff)
+                    break
+
+    def spool_size(self):
+        if not self.spool_dir:
+            return 0
+        return sum(1 for n in os.listdir(self.spool_dir) if not n.endswith(".tmp"))
+
+    def stats(self):
+        with self._lock:
+            uploaded = self._counters["uploaded"]
+            return {
+                "backend": self.backend.name,
+                "queue_depth": self._queue.qsize(),
+                "spool_queue_depth": self._spool_queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "spool_size": self.spool_size(),
+                **self._counters,
+                "latency_avg_ms": (self._latency_total / uploaded * 1000) if uploaded else 0.0,
+                "latency_last_ms": self._latency_last * 1000,
+                "latency_max_ms": self._latency_max * 1000,
+            }
+
+    def flush(self, timeout=None):
+        """Wait until every queued job has been handled."""
+        deadline = None if timeout is None else time.time() + timeout
+        while self._queue.unfinished_tasks or self._spool_queue.unfinished_tasks:
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout=5.0):
+        self.flush(timeout)
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=1.0)
@@ -0,0 +1,639 @@
+"""
+Multi-process pipeline: capture, inference and encode/upload run in worker
+processes, each with its own GIL, and hand frames to each other through
+shared-memory FrameRings. The Flask process only serves what they produce.
+
+Per camera there are three rings: raw decoded frames (capture -> inference),
+annotated frames (inference -> encode) and stream JPEGs (encode -> Flask).
+Each inference worker also owns a snapshot ring, from which encode workers
+pick up event frames to encode and upload. Queues carry only small messages:
+control commands, log records, detection payloads, upload jobs and stats.
+"""
+import queue
+import sys
+import threading
+import time
+import multiprocessing as mp
+from contextlib import contextmanager
+
+from cluster import merge_metrics
+from logs import configure as configure_logging, get_logger
+from metrics import REGISTRY
+from shmring import FrameRing
+
+log = get_logger("workers")
+
+STATS_INTERVAL = 1.0
+
+
+def _drain(q, limit=256):
+    """Up to limit messages already waiting on q, without blocking."""
+    messages = []
+    for _ in range(limit):
+        try:
+            messages.append(q.get_nowait())
+        except queue.Empty:
+            break
+    return messages
+
+
+def _report(results, stage, index):
+    """Send this worker's metrics to the serving process, which merges them into its /metrics."""
+    results.put(("metrics", f"{stage}-{index}", REGISTRY.render()))
+
+
+# --- stand-ins used inside the inference worker ---------------------------------
+
+class _QueueLog:
+    """EventRing/EventStore look-alike that forwards appends, adds and retractions to the Flask process."""
+
+    def __init__(self, results, kind):
+        self.results = results
+        self.kind = kind
+
+    def append(self, *args):
+        self.results.put(("log", self.kind, args))
+
+    def add(self, *args):
+        self.results.put(("add", self.kind, args))
+
+    def retract(self, *args):
+        self.results.put(("retract", self.kind, args))
+
+
+class _QueueClips:
+    """ClipRecorder look-alike: the Flask process buffers the stream JPEGs, so only triggers are forwarded."""
+
+    def __init__(self, results):
+        self.results = results
+
+    def record(self, camera, frame, timestamp):
+        pass
+
+    def trigger(self, camera, path, timestamp):
+        self.results.put(("clip", camera.camera_id, path, timestamp))
+
+
+class _QueueChannel:
+    """FrameBroadcaster look-alike for detection payloads; the Flask process republishes them."""
+
+    def __init__(self, results, camera_id):
+        self.results = results
+        self.camera_id = camera_id
+        self.closed = False
+        self.subscribers = 0
+
+    def publish(self, payload):
+        self.results.put(("detections", self.camera_id, payload))
+
+    def close(self):
+        self.closed = True
+
+
+class _RingChannel:
+    """FrameBroadcaster look-alike that writes each published frame's image into a ring."""
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.closed = False
+        self.subscribers = 0
+
+    def publish(self, frame):
+        self.ring.write(frame.image, time.time())
+
+    def close(self):
+        self.closed = True
+
+
+class _RingUploader:
+    """SnapshotUploader look-alike: the frame goes into the snapshot ring, the job onto the queue."""
+
+    def __init__(self, ring, jobs):
+        self.ring = ring
+        self.jobs = jobs
+        self._last = (None, 0)
+
+    def submit(self, path, frame=None, data=None):
+        image = frame.image if hasattr(frame, "image") else frame
+        # Several alerts raised on one frame share a single slot
+        if self._last[0] is not image:
+            self._last = (image, self.ring.write(image))
+        try:
+            self.jobs.put_nowait((self.ring.name, self._last[1], path))
+            return True
+        except queue.Full:
+            log.warning("upload_jobs_full_dropped", path=path)
+            return False
+
+
+def _ring_grabber(ring, name):
+    from capture import FrameGrabber
+
+    class RingGrabber(FrameGrabber):
+        """FrameGrabber whose frames come from a capture worker's ring instead of a decoder thread."""
+
+        def start(self):
+            return self
+
+        def stop(self):
+            pass
+
+        def read(self, last_seq=0):
+            return ring.read(last_seq)
+
+    return RingGrabber(None, name=name)
+
+
+# --- worker processes -------------------------------------------------------------
+
+def capture_worker(index, cameras, control, results, stop, log_level):
+    """Decode assigned sources into their raw rings. cameras: {camera_id: (source, ring name)}."""
+    from capture import FrameGrabber
+
+    configure_logging(log_level)
+    grabbers = {}
+
+    def add(camera_id, source, ring_name):
+        ring = FrameRing.attach(ring_name)
+
+        def sink(frame, timestamp):
+            try:
+                ring.write(frame, timestamp)
+            except ValueError as e:
+                log.error("frame_too_large", camera=camera_id, error=str(e))
+        grabbers[camera_id] = (FrameGrabber(source, name=camera_id, sink=sink).start(), ring)
+
+    def remove(camera_id):
+        grabber, ring = grabbers.pop(camera_id, (None, None))
+        if grabber is not None:
+            grabber.stop()
+            ring.close()
+
+    for camera_id, (source, ring_name) in cameras.items():
+        add(camera_id, source, ring_name)
+    while not stop.wait(STATS_INTERVAL):
+        for command, camera_id, *args in _drain(control):
+            if command == "add":
+                add(camera_id, *args)
+            elif command == "remove":
+                remove(camera_id)
+        for camera_id, (grabber, _) in grabbers.items():
+            results.put(("stats", "capture", camera_id, grabber.stats()))
+        _report(results, "capture", index)
+    for camera_id in list(grabbers):
+        remove(camera_id)
+
+
+def inference_worker(index, cameras, options, control, results, upload_jobs, stop):
+    """
+    Batched detection, tracking and alert logic for the assigned cameras.
+    cameras: {camera_id: {"spec", "rois", "config", "raw", "frames"}}.
+    """
+    from cameras import Camera, CameraRegistry
+    from detector import load_detector, warm_up
+    from pipeline import FrameProcessor
+    from rules import RuleBook
+    from scheduler import InferenceScheduler
+
+    configure_logging(options["log_level"])
+    started = time.time()
+    model, description = load_detector(**options["model"])
+    predict = dict(options["predict"])
+    ms = warm_up(model, predict.pop("imgsz", 640), options["max_batch"], options["warmup_runs"], **predict)
+    log.info("inference_worker_ready", worker=index, model=description, warmup_ms=round(ms, 2))
+    results.put(("model", index, {"model": description, "warmup_ms": round(ms, 2),
+                                  "seconds": round(time.time() - started, 3)}))
+    snapshots = FrameRing.attach(options["snapshot_ring"])
+    registry = CameraRegistry()
+    rings = {}
+
+    def add(camera_id, entry):
+        camera = Camera(**entry["spec"])
+        camera.config.update(entry.get("config") or {})
+        camera.set_rois(entry.get("rois") or {})
+        raw, frames = FrameRing.attach(entry["raw"]), FrameRing.attach(entry["frames"])
+        rings[camera_id] = (raw, frames)
+        camera.grabber = _ring_grabber(raw, camera_id)
+        camera.broadcaster = _RingChannel(frames)
+        camera.detections = _QueueChannel(results, camera_id)
+        registry.add(camera, start=False)
+
+    def remove(camera_id):
+        registry.remove(camera_id)
+        for ring in rings.pop(camera_id, ()):
+            ring.close()
+
+    for camera_id, entry in cameras.items():
+        add(camera_id, entry)
+    processor = FrameProcessor(model.names, _RingUploader(snapshots, upload_jobs),
+                               _QueueLog(results, "events"), _QueueLog(results, "inference"),
+                               options["snapshot_folder"], options["stream_quality"],
+                               _QueueLog(results, "store") if options["event_store"] else None,
+                               _QueueClips(results) if options["clips"] else None,
+                               RuleBook(options["alert_rules"]))
+    scheduler = InferenceScheduler(model, registry, processor.process_result, options["max_batch"],
+                                   tracker_config=options["tracker_config"], **options["predict"]).start()
+    REGISTRY.collector("sst_inference_batches_total", "model.predict calls",
+                       lambda: {(): scheduler.batches}, kind="counter")
+    last_stats = 0.0
+    # Poll control faster than stats so ROI edits apply promptly
+    while not stop.wait(STATS_INTERVAL / 10):
+        for command, camera_id, *args in _drain(control):
+            camera = registry.get(camera_id)
+            if command == "add":
+                add(camera_id, *args)
+            elif command == "remove":
+                remove(camera_id)
+            elif command == "rois" and camera is not None:
+                camera.set_rois(args[0])
+            elif command == "config" and camera is not None:
+                camera.config.update(args[0])
+        if time.time() - last_stats < STATS_INTERVAL:
+            continue
+        last_stats = time.time()
+        for camera in registry.cameras():
+            results.put(("stats", "inference", camera.camera_id, {
+                "inference": camera.policy.stats(),
+                "tracked_vehicles": len(camera.tracked_vehicles),
+                "rule_timers": camera.rule_timers.pending,
+                "latency_ms": camera.grabber.latency_ms,
+                "latency_max_ms": camera.grabber.latency_max_ms,
+            }))
+        _report(results, "inference", index)
+    scheduler.stop()
+    for camera_id in list(rings):
+        remove(camera_id)
+    snapshots.close()
+
+
+def encode_worker(index, cameras, options, control, results, upload_jobs, stop):
+    """
+    JPEG-encode the newest annotated frame of each assigned camera into its stream ring,
+    and encode and upload snapshot jobs. cameras: {camera_id: (frames ring name, jpeg ring name)}.
+    """
+    from jpegcache import encode_jpeg
+    from uploader import SnapshotUploader, create_backend
+
+    configure_logging(options["log_level"])
+    storage = options["storage"]
+    spool_dir = storage.get("spool_dir")
+    uploader = SnapshotUploader(create_backend(storage["kind"], **storage["options"]),
+                                workers=storage["workers"], max_queue=storage["max_queue"],
+                                # One spool per worker so their replay threads never race over files
+                                spool_dir=f"{spool_dir}/{index}" if spool_dir else None)
+    REGISTRY.collector("sst_uploads_total", "Snapshot uploads by outcome",
+                       lambda: {(k,): v for k, v in uploader.stats().items()
+                                if k in ("submitted", "uploaded", "failed", "dropped", "spooled", "replayed",
+                                         "retried")},
+                       ("result",), "counter")
+    quality = options["stream_quality"]
+    streams = {}
+    snapshot_rings = {}
+    lost = 0
+
+    def add(camera_id, frames_name, jpeg_name):
+        streams[camera_id] = [FrameRing.attach(frames_name), FrameRing.attach(jpeg_name), 0]
+
+    def remove(camera_id):
+        for ring in streams.pop(camera_id, [])[:2]:
+            ring.close()
+
+    for camera_id, names in cameras.items():
+        add(camera_id, *names)
+    last_stats = 0.0
+    while not stop.is_set():
+        busy = False
+        for command, camera_id, *args in _drain(control):
+            if command == "add":
+                add(camera_id, *args)
+            elif command == "remove":
+                remove(camera_id)
+        for state in streams.values():
+            frames, jpegs, last_seq = state
+            seq, image, timestamp = frames.read(last_seq)
+            if image is None:
+                continue
+            state[2] = seq
+            jpegs.write(encode_jpeg(image, quality), timestamp, image.shape)
+            busy = True
+        for ring_name, seq, path in _drain(upload_jobs, limit=8):
+            busy = True
+            ring = snapshot_rings.get(ring_name)
+            if ring is None:
+                ring = snapshot_rings[ring_name] = FrameRing.attach(ring_name)
+            entry = ring.read_seq(seq)
+            if entry is None:
+                lost += 1
+                log.error("snapshot_overwritten", path=path)
+                continue
+            uploader.submit(path, data=encode_jpeg(entry[0], uploader.jpeg_quality))
+        now = time.time()
+        if now - last_stats >= STATS_INTERVAL:
+            last_stats = now
+            results.put(("stats", "uploads", index, {**uploader.stats(), "lost": lost}))
+            _report(results, "encode", index)
+        if not busy:
+            time.sleep(0.002)
+    uploader.close()
+    for camera_id in list(streams):
+        remove(camera_id)
+    for ring in snapshot_rings.values():
+        ring.close()
+
+
+# --- Flask-process side -----------------------------------------------------------
+
+@contextmanager
+def _hidden_main():
+    """
+    Spawned children re-import the parent's __main__ unless it looks unimportable. The
+    worker entry points live here, so keep them from re-running app.py (model load,
+    uploader threads) in every process.
+    """
+    main = sys.modules["__main__"]
+    saved = {name: getattr(main, name) for name in ("__file__", "__spec__") if hasattr(main, name)}
+    main.__spec__ = None
+    if "__file__" in saved:
+        del main.__file__
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(main, name, value)
+
+
+class ProcessPipeline:
+    """
+    Owns the rings and worker processes for every camera in a CameraRegistry.
+
+    Cameras are spread over capture_workers, inference_workers and
+    encode_workers processes (fewest cameras first). A pump thread in the
+    serving process republishes stream JPEGs, detection payloads and log
+    records into the registry's cameras and the event logs, so the routes
+    read them exactly as in the threaded mode.
+    """
+
+    def __init__(self, registry, event_log, inference_log, model_options, predict_options,
+                 storage_options, capture_workers=1, inference_workers=1, encode_workers=1,
+                 max_batch=8, tracker_config="bytetrack.yaml", snapshot_folder="videos-dev",
+                 stream_quality=80, max_frame_bytes=1920 * 1080 * 3, ring_slots=4, log_level="INFO",
+                 event_store=None, clips=None, rules_path=None, warmup_runs=2):
+        self.registry = registry
+        self.event_log = event_log
+        self.inference_log = inference_log
+        self.event_store = event_store
+        self.clips = clips
+        self.counts = {"capture": capture_workers, "inference": inference_workers, "encode": encode_workers}
+        self.max_frame_bytes = max_frame_bytes
+        self.ring_slots = ring_slots
+        self.stream_quality = stream_quality
+        self._ctx = mp.get_context("spawn")
+        self._stop = self._ctx.Event()
+        self._results = self._ctx.Queue()
+        self._upload_jobs = self._ctx.Queue(maxsize=1024)
+        self._options = {
+            "model": model_options,
+            "predict": predict_options,
+            "storage": storage_options,
+            "max_batch": max_batch,
+            "tracker_config": tracker_config,
+            "snapshot_folder": snapshot_folder,
+            "stream_quality": stream_quality,
+            "log_level": log_level,
+            "event_store": event_store is not None,
+            "clips": clips is not None,
+            # Each worker reloads the rules file on its own when /alert_rules rewrites it
+            "alert_rules": rules_path,
+            "warmup_runs": warmup_runs,
+        }
+        self._lock = threading.Lock()
+        self._rings = {}        # camera_id -> {"raw", "frames", "jpeg"} FrameRings (owned here)
+        self._assigned = {}     # camera_id -> {stage: worker index}
+        self._controls = {}     # stage -> [Queue per worker]
+        self._processes = {}    # stage -> [Process per worker]
+        self._snapshot_rings = []
+        self._stats = {"capture": {}, "inference": {}, "uploads": {}}
+        self._models = {}       # inference worker index -> model, warm-up ms and seconds to ready
+        self._metrics = {}      # worker name -> its latest /metrics text
+        self._pump_thread = None
+
+    # --- assignment --------------------------------------------------------
+
+    def _least_loaded(self, stage):
+        load = [0] * self.counts[stage]
+        for assigned in self._assigned.values():
+            load[assigned[stage]] += 1
+        return load.index(min(load))
+
+    def _create_rings(self, camera_id):
+        rings = {
+            "raw": FrameRing.create(self.ring_slots, self.max_frame_bytes),
+            "frames": FrameRing.create(self.ring_slots, self.max_frame_bytes),
+            "jpeg": FrameRing.create(self.ring_slots, self.max_frame_bytes // 2),
+        }
+        self._rings[camera_id] = rings
+        self._assigned[camera_id] = {stage: self._least_loaded(stage) for stage in self.counts}
+        return rings
+
+    def _entries(self, camera):
+        rings = self._rings[camera.camera_id]
+        return {
+            "capture": (camera.source, rings["raw"].name),
+            "inference": {"spec": camera.spec(), "rois": camera.rois, "config": camera.config,
+                          "raw": rings["raw"].name, "frames": rings["frames"].name},
+            "encode": (rings["frames"].name, rings["jpeg"].name),
+        }
+
+    # --- lifecycle ---------------------------------------------------------
+
+    def start(self):
+        with self._lock:
+            if self._processes:
+                return self
+            plan = {stage: [{} for _ in range(n)] for stage, n in self.counts.items()}
+            for camera in self.registry.cameras():
+                self._create_rings(camera.camera_id)
+                for stage, entry in self._entries(camera).items():
+                    plan[stage][self._assigned[camera.camera_id][stage]][camera.camera_id] = entry
+            self._controls = {stage: [self._ctx.Queue() for _ in range(n)] for stage, n in self.counts.items()}
+            self._snapshot_rings = [FrameRing.create(16, self.max_frame_bytes)
+                                    for _ in range(self.counts["inference"])]
+            targets = {
+                "capture": lambda i: (capture_worker, (i, plan["capture"][i], self._controls["capture"][i],
+                                                       self._results, self._stop, self._options["log_level"])),
+                "inference": lambda i: (inference_worker, (
+                    i, plan["inference"][i], {**self._options, "snapshot_ring": self._snapshot_rings[i].name},
+                    self._controls["inference"][i], self._results, self._upload_jobs, self._stop)),
+                "encode": lambda i: (encode_worker, (i, plan["encode"][i], self._options,
+                                                     self._controls["encode"][i], self._results,
+                                                     self._upload_jobs, self._stop)),
+            }
+            with _hidden_main():
+                for stage, n in self.counts.items():
+                    self._processes[stage] = []
+                    for i in range(n):
+                        target, args = targets[stage](i)
+                        process = self._ctx.Process(target=target, args=args, name=f"{stage}-{i}", daemon=True)
+                        process.start()
+                        self._processes[stage].append(process)
+            self._pump_thread = threading.Thread(target=self._pump, name="process-pump", daemon=True)
+            self._pump_thread.start()
+        log.info("process_pipeline_started", **self.counts)
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for processes in self._processes.values():
+            for process in processes:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+        if self._pump_thread is not None:
+            self._pump_thread.join(timeout=2.0)
+        for camera_id in list(self._rings):
+            self._close_rings(self._release(camera_id))
+        for ring in self._snapshot_rings:
+            ring.close()
+            ring.unlink()
+
+    def _release(self, camera_id):
+        """Forget a camera's assignment and hand back its rings for _close_rings()."""
+        self._assigned.pop(camera_id, None)
+        return list(self._rings.pop(camera_id, {}).values())
+
+    @staticmethod
+    def _close_rings(rings):
+        for ring in rings:
+            ring.close()
+            ring.unlink()
+
+    # --- runtime changes -----------------------------------------------------
+
+    def _send(self, stage, camera_id, *message):
+        with self._lock:
+            assigned = self._assigned.get(camera_id)
+            if assigned is not None and self._controls:
+                self._controls[stage][assigned[stage]].put(message)
+
+    def add_camera(self, camera):
+        with self._lock:
+            if not self._processes:
+                return
+            self._create_rings(camera.camera_id)
+            entries = self._entries(camera)
+        for stage, entry in entries.items():
+            args = entry if isinstance(entry, tuple) else (entry,)
+            self._send(stage, camera.camera_id, "add", camera.camera_id, *args)
+
+    def remove_camera(self, camera_id):
+        for stage in self.counts:
+            self._send(stage, camera_id, "remove", camera_id)
+        # The id is free again at once (it may be added back right away); only these
+        # rings are unlinked, after giving the workers a moment to detach from them
+        with self._lock:
+            rings = self._release(camera_id)
+        timer = threading.Timer(2.0, self._close_rings, (rings,))
+        timer.daemon = True
+        timer.start()
+
+    def update_rois(self, camera_id, rois):
+        self._send("inference", camera_id, "rois", camera_id, rois)
+
+    def update_config(self, camera_id, config):
+        self._send("inference", camera_id, "config", camera_id, config)
+
+    # --- serving side ----------------------------------------------------------
+
+    def _pump(self):
+        logs = {"events": self.event_log, "inference": self.inference_log, "store": self.event_store}
+        last_seqs = {}
+        while not self._stop.is_set():
+            busy = False
+            for message in _drain(self._results):
+                busy = True
+                kind = message[0]
+                if kind == "log":
+                    logs[message[1]].append(*message[2])
+                elif kind == "add":
+                    logs[message[1]].add(*message[2])
+                elif kind == "retract":
+                    logs[message[1]].retract(*message[2])
+                elif kind == "detections":
+                    camera = self.registry.get(message[1])
+                    if camera is not None:
+                        camera.detections.publish(message[2])
+                elif kind == "clip":
+                    camera = self.registry.get(message[1])
+                    if camera is not None and self.clips is not None:
+                        self.clips.trigger(camera, message[2], message[3])
+                elif kind == "stats":
+                    self._stats[message[1]][message[2]] = message[3]
+                elif kind == "model":
+                    self._models[message[1]] = message[2]
+                elif kind == "metrics":
+                    self._metrics[message[1]] = message[2]
+            with self._lock:
+                rings = [(camera_id, r["jpeg"]) for camera_id, r in self._rings.items()]
+            for camera_id, ring in rings:
+                entry = ring.read_entry(last_seqs.get(camera_id, 0))
+                camera = self.registry.get(camera_id)
+                if entry is None or camera is None:
+                    continue
+                seq, data, timestamp, (height, width) = entry
+                last_seqs[camera_id] = seq
+                camera.frame_dimensions["height"], camera.frame_dimensions["width"] = height, width
+                frame = self._wrap(seq, data, width, height)
+                camera.broadcaster.publish(frame)
+                if self.clips is not None:
+                    self.clips.record(camera, frame, timestamp)
+                busy = True
+            if not busy:
+                time.sleep(0.002)
+
+    def _wrap(self, seq, data, width, height):
+        from jpegcache import EncodedFrame
+        return EncodedFrame.from_jpeg(seq, data, width, height, self.stream_quality)
+
+    def camera_stats(self, camera_id):
+        """Worker-side view of a camera, merged into /cameras."""
+        inference = self._stats["inference"].get(camera_id, {})
+        capture = dict(self._stats["capture"].get(camera_id, {}))
+        capture.update(latency_ms=inference.get("latency_ms"), latency_max_ms=inference.get("latency_max_ms"))
+        stats = {"capture": capture}
+        if "inference" in inference:
+            stats.update(inference=inference["inference"], tracked_vehicles=inference["tracked_vehicles"],
+                         rule_timers=inference["rule_timers"])
+        return stats
+
+    def metrics(self, own_text):
+        """The serving process's /metrics followed by every worker's, labelled with the worker."""
+        return merge_metrics({None: own_text, **dict(self._metrics)}, label="worker")
+
+    def wait_models(self, progress=None, timeout=None):
+        """
+        Block until every inference worker has loaded and warmed up its model
+        (or timeout seconds passed, raising TimeoutError). Usable as a Startup
+        step; returns the slowest worker's warm-up ms per frame.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        reported = -1
+        while len(self._models) < self.counts["inference"]:
+            if self._stop.is_set():
+                raise RuntimeError("Pipeline stopped before the models were ready")
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"{len(self._models)}/{self.counts['inference']} inference workers ready")
+            if progress is not None and len(self._models) != reported:
+                reported = len(self._models)
+                progress("loading", workers_ready=reported, workers=self.counts["inference"])
+            time.sleep(0.1)
+        ms = max(info["warmup_ms"] for info in self._models.values())
+        if progress is not None:
+            progress("serving", workers_ready=len(self._models), workers=self.counts["inference"], warmup_ms=ms)
+        return ms
+
+    def upload_stats(self):
+        return dict(self._stats["uploads"])
+
+    def workers(self):
+        return {stage: [{"name": p.name, "pid": p.pid, "alive": p.is_alive()} for p in processes]
+                for stage, processes in self._processes.items()}